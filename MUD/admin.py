@@ -1,10 +1,132 @@
-from django.contrib import admin
+import io
+import tempfile
 
-from .models import Character, Item, ItemSettings
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+
+from . import ledger
+from .catalog import (CONTENT_TYPES, ItemImportError, export_items, get_format,
+                      import_items, read_rows)
+from .forms import ItemImportForm
+from .helpers import invalidate_character
+from .models import Character, GoldTransaction, Item, ItemSettings
+from .utils import GoldReason
 
 # Register your models here.
 
-admin.site.register(Character)
-admin.site.register(Item)
-admin.site.register(ItemSettings)
 
+class GoldTransactionInline(admin.TabularInline):
+    model = GoldTransaction
+    fields = ("created", "amount", "reason", "reference")
+    readonly_fields = fields
+    ordering = ("-created", "-id")
+    extra = 0
+    max_num = 0
+    can_delete = False
+
+
+class CharacterAdmin(admin.ModelAdmin):
+    inlines = (GoldTransactionInline,)
+
+    def save_model(self, request, obj, form, change):
+        """
+        Applies gold changed by staff as a difference from the saved gold,
+        with an F() expression so a purchase or payment made while saving is
+        not overwritten, and records it in the ledger
+
+        """
+        if not change or "gold" not in form.changed_data:
+            super().save_model(request, obj, form, change)
+            return
+
+        adjustment = obj.gold - form.initial["gold"]
+        with transaction.atomic():
+            obj.save(update_fields=[
+                field.name for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name != "gold"
+            ])
+            Character.objects.filter(pk=obj.pk).update(gold=F("gold") + adjustment)
+            ledger.record(
+                obj.pk, adjustment, GoldReason.ADJUSTMENT, request.user.get_username()
+            )
+        obj.refresh_from_db(fields=["gold"])
+        invalidate_character(obj.owner_id)
+
+
+def export_response(queryset, file_format):
+    """
+    Writes the export to a temporary file before responding. Under ASGI a
+    streaming response is iterated on the event loop, where export_items
+    could not query the database
+
+    """
+    export = tempfile.TemporaryFile()
+    for line in export_items(queryset, file_format):
+        export.write(line.encode())
+    export.seek(0)
+    return FileResponse(
+        export,
+        as_attachment=True,
+        filename=f"items.{file_format}",
+        content_type=CONTENT_TYPES[file_format],
+    )
+
+
+class ItemAdmin(admin.ModelAdmin):
+    change_list_template = "admin/MUD/item/change_list.html"
+    actions = ("export_csv", "export_jsonl")
+    search_fields = ("name",)
+
+    @admin.action(description="Export selected items as CSV")
+    def export_csv(self, request, queryset):
+        return export_response(queryset, "csv")
+
+    @admin.action(description="Export selected items as JSON lines")
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, "jsonl")
+
+    def get_urls(self):
+        return [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="MUD_item_import",
+            ),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """
+        Imports an uploaded file of items, see MUD.catalog
+
+        """
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect(reverse("admin:MUD_item_changelist"))
+
+        form = ItemImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["items_file"]
+            try:
+                lines = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+                created, updated = import_items(read_rows(lines, get_format(upload.name)))
+            except (ItemImportError, UnicodeDecodeError) as error:
+                form.add_error("items_file", str(error))
+            else:
+                messages.success(request, f"Created {created} and updated {updated} items")
+                return redirect(reverse("admin:MUD_item_changelist"))
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import items",
+            "form": form,
+        }
+        return render(request, "admin/MUD/item/import_items.html", context)
+
+
+admin.site.register(Character, CharacterAdmin)
+admin.site.register(Item, ItemAdmin)
+admin.site.register(ItemSettings)
@@ -1,6 +1,79 @@
+from collections import namedtuple
+from operator import attrgetter
+from types import MappingProxyType
+
 from django.apps import AppConfig
+from django.core.validators import MaxValueValidator, MinValueValidator
+
+
+class Trait(namedtuple("Trait", ["name", "minimum", "maximum", "default", "widget_attrs"])):
+    """
+    Limits of one character trait
+    """
+
+    __slots__ = ()
+
+    def clamp(self, value):
+        return min(max(value, self.minimum), self.maximum)
+
+
+TraitSchema = namedtuple("TraitSchema", ["traits", "names", "by_name", "fields", "values"])
+
+# Character fields users raise by spending points. Gold, points and
+# inventory_size are integers too but are not traits
+TRAIT_FIELDS = ("hp", "mp", "agility", "dexterity", "strength")
+
+
+def get_limit(field, validator_class):
+    for validator in field.validators:
+        if isinstance(validator, validator_class):
+            return validator.limit_value
+    raise ValueError(f"Character.{field.name} has no {validator_class.__name__}")
+
+
+def build_trait_schema(model, names=TRAIT_FIELDS):
+    """
+    Reads the traits of a character model once, so validating and rendering
+    them does not have to walk the model's fields.
+    A trait's limits are the MinValueValidator and MaxValueValidator set
+    from MUD.defaultValues
+
+    :param model Model: The Character model
+    :param names Tuple: Names of the trait fields
+    """
+    traits = []
+    for name in names:
+        field = model._meta.get_field(name)
+        minimum = get_limit(field, MinValueValidator)
+        maximum = get_limit(field, MaxValueValidator)
+        traits.append(
+            Trait(
+                name,
+                minimum,
+                maximum,
+                field.default,
+                MappingProxyType({"data-min": minimum, "data-max": maximum}),
+            )
+        )
+    # The fields EditCharacterForm saves: the points spent and the traits
+    fields = ("points",) + tuple(names)
+    return TraitSchema(
+        tuple(traits),
+        tuple(names),
+        MappingProxyType({trait.name: trait for trait in traits}),
+        fields,
+        # Returns a character's points and trait values as a tuple, in the
+        # order of fields
+        attrgetter(*fields),
+    )
 
 
 class MudConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'MUD'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .models import Character
+
+        self.trait_schema = build_trait_schema(Character)
@@ -0,0 +1,355 @@
+"""
+Texture atlases of the item images.
+
+The inventory and character canvases draw every item from a few atlas
+images instead of loading each item's image separately. Each atlas is a
+sheet of equal cells, one per item, holding the inventory sized copy of the
+item's image (see MUD.images). Atlases are named after a hash of their
+content so browsers can cache them for good, and a frame map records where
+each item is:
+
+    {
+        "atlases": ["items/atlas/atlas-3f2a...webp", ...],
+        "frames": {"<item id>": [atlas index, x, y, width, height], ...},
+        "sources": {"<item id>": "items/derivatives/bread-thumb.png", ...},
+        "retired": {"items/atlas/atlas-9c1b...webp": unix time, ...},
+        "max_size": 2048
+    }
+
+"sources" is the image each frame was cut from. build_item_atlas only
+redraws the cells of items whose image changed, were added or were deleted,
+one sheet at a time, so the other atlases keep their names and a rebuild
+never holds more than one sheet in memory. An atlas left with no items is
+null in "atlases" until the sheet is reused.
+
+The map is stored next to the atlases and cached for
+settings.ITEM_ATLAS_CACHE_TIMEOUT seconds. Pages rendered with an older map
+still point at the atlases it used, so an atlas that is no longer needed is
+listed under "retired" and only deleted settings.ITEM_ATLAS_GRACE_PERIOD
+seconds later.
+
+Packing is slow, so the Item signals never do it. The generate_item_images
+worker updates the atlas once for every batch of changed item images.
+"""
+import hashlib
+import json
+import logging
+import posixpath
+import time
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from PIL import Image, UnidentifiedImageError
+
+from .images import IMAGE_DERIVATIVES, get_derivative_name
+from .models import Item
+
+logger = logging.getLogger(__name__)
+
+ATLAS_DIRECTORY = "items/atlas"
+FRAMES_NAME = posixpath.join(ATLAS_DIRECTORY, "frames.json")
+ITEM_ATLAS_CACHE_KEY = "item_atlas"
+
+# Largest width and height of one atlas. 2048 is safe for every browser's
+# canvas and WebGL texture limits
+MAX_ATLAS_SIZE = 2048
+
+# Space left around each frame so scaled drawing does not pick up the
+# pixels of its neighbours
+PADDING = 2
+
+# Width and height of the cell each item gets, large enough for any thumb
+CELL_SIZE = IMAGE_DERIVATIVES["thumb"] + 2 * PADDING
+
+EMPTY_FRAME_MAP = {"atlases": [], "frames": {}, "sources": {}, "retired": {}}
+
+Cell = namedtuple("Cell", ["atlas", "index"])
+
+
+class SheetLayout:
+    """
+    Position of the cells of every atlas, numbered row by row
+    """
+
+    def __init__(self, max_size=MAX_ATLAS_SIZE):
+        self.columns = max_size // CELL_SIZE
+        if not self.columns:
+            raise ValueError(f"A {max_size}px atlas cannot hold a {CELL_SIZE}px cell")
+        self.cells_per_atlas = self.columns * self.columns
+
+    def origin(self, index):
+        row, column = divmod(index, self.columns)
+        return column * CELL_SIZE, row * CELL_SIZE
+
+    def cell_at(self, frame):
+        """
+        The cell a frame of the frame map is drawn in
+        """
+        atlas, x, y = frame[:3]
+        return Cell(atlas, (y // CELL_SIZE) * self.columns + x // CELL_SIZE)
+
+    def size(self, indexes):
+        """
+        Smallest width and height of an atlas holding the given cells
+        """
+        width = max(index % self.columns for index in indexes) + 1
+        height = max(indexes) // self.columns + 1
+        if height > 1:
+            width = self.columns
+        return width * CELL_SIZE, height * CELL_SIZE
+
+    def free_cells(self, used):
+        """
+        Yields the cells not in used, lowest first, so deleted items' cells
+        are filled before a new atlas is started
+        """
+        atlas = 0
+        while True:
+            for index in range(self.cells_per_atlas):
+                if Cell(atlas, index) not in used:
+                    yield Cell(atlas, index)
+            atlas += 1
+
+
+def load_frame(name, storage):
+    """
+    Opens the image an item is drawn with in the inventory, scaled to the
+    thumb size if its thumb has not been made yet
+
+    :param name String: The item's thumb, or its image while it has none
+    :param storage Storage: Storage of Item.image
+    """
+    with storage.open(name, "rb") as image_file:
+        image = Image.open(image_file)
+        image.load()
+    image = image.convert("RGBA")
+    size = IMAGE_DERIVATIVES["thumb"]
+    image.thumbnail((size, size), Image.LANCZOS)
+    return image
+
+
+def get_frame_sources():
+    """
+    Returns the image every item with one is drawn from, by item id
+
+    """
+    items = (
+        Item.objects.exclude(Q(image="") | Q(image=None))
+        .only("pk", "image", "image_derivatives")
+        .order_by("pk")
+    )
+    return {str(item.pk): get_derivative_name(item, "thumb") for item in items.iterator()}
+
+
+def draw_atlas(storage, layout, previous_name, cells, clear, frames):
+    """
+    Redraws one atlas and stores it. Returns the name of the new atlas, or
+    None when it holds no items
+
+    :param storage Storage: Storage of Item.image
+    :param layout SheetLayout: Cell positions
+    :param previous_name String: The atlas being redrawn, None for a new one
+    :param cells Set: Indexes of every cell of the atlas holding an item
+    :param clear Iterable: Indexes of cells whose item changed or was removed
+    :param frames Iterable: (cell index, image) of each item to draw, read
+        one at a time
+    """
+    if not cells:
+        return None
+
+    sheet = Image.new("RGBA", layout.size(cells))
+    if previous_name:
+        with storage.open(previous_name, "rb") as atlas_file:
+            previous = Image.open(atlas_file)
+            previous.load()
+        sheet.paste(previous.convert("RGBA"), (0, 0))
+        blank = Image.new("RGBA", (CELL_SIZE, CELL_SIZE))
+        for index in clear:
+            sheet.paste(blank, layout.origin(index))
+
+    for index, image in frames:
+        x, y = layout.origin(index)
+        sheet.paste(image, (x + PADDING, y + PADDING))
+
+    output = BytesIO()
+    sheet.save(output, "WEBP", lossless=True)
+    content = output.getvalue()
+
+    name = posixpath.join(
+        ATLAS_DIRECTORY, f"atlas-{hashlib.sha1(content).hexdigest()[:16]}.webp"
+    )
+    # Same content, same name: an unchanged atlas is not uploaded again
+    if not storage.exists(name):
+        storage.save(name, ContentFile(content))
+    return name
+
+
+def build_item_atlas(max_size=MAX_ATLAS_SIZE, rebuild=False):
+    """
+    Brings the atlases up to date with the item images, redrawing only the
+    atlases that hold an added, changed or deleted item. Stores them with
+    their frame map and caches the map. Returns the frame map
+
+    :param max_size Integer: Largest width and height of one atlas
+    :param rebuild Boolean: Redraw every atlas. Also done when max_size is
+        not the size the atlases were drawn with
+    """
+    storage = Item._meta.get_field("image").storage
+    layout = SheetLayout(max_size)
+    previous = read_frame_map(storage)
+    # Maps written before the atlases had cells have no max_size
+    if rebuild or previous.get("max_size") != max_size:
+        current = dict(EMPTY_FRAME_MAP)
+    else:
+        current = previous
+
+    atlases = list(current["atlases"])
+    frames = dict(current["frames"])
+    sources = dict(current.get("sources", {}))
+    new_sources = get_frame_sources()
+
+    cells = {item_id: layout.cell_at(frame) for item_id, frame in frames.items()}
+    # Cells to blank out and items to draw, by atlas
+    clear, draw = {}, {}
+    for item_id in list(cells):
+        if sources.get(item_id) != new_sources.get(item_id):
+            cell = cells.pop(item_id)
+            del frames[item_id]
+            sources.pop(item_id, None)
+            clear.setdefault(cell.atlas, []).append(cell.index)
+
+    free_cells = layout.free_cells(set(cells.values()))
+    for item_id in new_sources:
+        if item_id not in cells:
+            cell = cells[item_id] = next(free_cells)
+            draw.setdefault(cell.atlas, []).append((item_id, cell.index))
+
+    def read_frames(atlas):
+        # Loads the images of one atlas one at a time, dropping items whose
+        # image cannot be read
+        for item_id, index in draw[atlas]:
+            try:
+                image = load_frame(new_sources[item_id], storage)
+            except (OSError, UnidentifiedImageError):
+                logger.warning("Could not add item %s to the atlas", item_id, exc_info=True)
+                del cells[item_id]
+                continue
+            x, y = layout.origin(index)
+            frames[item_id] = [atlas, x + PADDING, y + PADDING, image.width, image.height]
+            sources[item_id] = new_sources[item_id]
+            yield index, image
+
+    for atlas in sorted(set(clear) | set(draw)):
+        while len(atlases) <= atlas:
+            atlases.append(None)
+        occupied = {cell.index for cell in cells.values() if cell.atlas == atlas}
+        atlases[atlas] = draw_atlas(
+            storage,
+            layout,
+            atlases[atlas],
+            occupied,
+            clear.get(atlas, ()),
+            read_frames(atlas) if atlas in draw else (),
+        )
+    while atlases and atlases[-1] is None:
+        atlases.pop()
+
+    frame_map = {
+        "atlases": atlases,
+        "frames": frames,
+        "sources": sources,
+        "max_size": max_size,
+    }
+
+    # Atlases dropped from the map stay in storage for the grace period
+    now = time.time()
+    retired = {
+        name: retired_at
+        for name, retired_at in previous.get("retired", {}).items()
+        if name not in atlases
+    }
+    for name in set(previous["atlases"]) - set(atlases) - {None}:
+        retired[name] = now
+    expired = [
+        name
+        for name, retired_at in retired.items()
+        if retired_at <= now - settings.ITEM_ATLAS_GRACE_PERIOD
+    ]
+    for name in expired:
+        del retired[name]
+    frame_map["retired"] = retired
+
+    if storage.exists(FRAMES_NAME):
+        storage.delete(FRAMES_NAME)
+    storage.save(FRAMES_NAME, ContentFile(json.dumps(frame_map).encode()))
+    cache.set(ITEM_ATLAS_CACHE_KEY, frame_map, settings.ITEM_ATLAS_CACHE_TIMEOUT)
+
+    for name in expired:
+        if storage.exists(name):
+            storage.delete(name)
+    return frame_map
+
+
+def read_frame_map(storage):
+    """
+    Reads the frame map stored next to the atlases, which is empty until the
+    atlas has been built
+
+    :param storage Storage: Storage of Item.image
+    """
+    if not storage.exists(FRAMES_NAME):
+        return dict(EMPTY_FRAME_MAP)
+    with storage.open(FRAMES_NAME, "rb") as frames_file:
+        return json.load(frames_file)
+
+
+def get_item_atlas():
+    """
+    Returns the frame map of the item atlas, which is empty until the atlas
+    has been built
+
+    """
+    frame_map = cache.get(ITEM_ATLAS_CACHE_KEY)
+    if frame_map is not None:
+        return frame_map
+
+    frame_map = read_frame_map(Item._meta.get_field("image").storage)
+    cache.set(ITEM_ATLAS_CACHE_KEY, frame_map, settings.ITEM_ATLAS_CACHE_TIMEOUT)
+    return frame_map
+
+
+def is_item_atlas_stale():
+    """
+    Is an item with an image missing from the atlas, drawn from an image it
+    no longer has, or deleted
+
+    """
+    return get_item_atlas().get("sources") != get_frame_sources()
+
+
+def get_inventory_atlas(item_ids):
+    """
+    The part of the atlas an inventory needs: the URLs of the atlases its
+    items are in and their frames, numbered by their position in that list
+
+    :param item_ids Iterable: Ids of the items in the inventory
+    """
+    frame_map = get_item_atlas()
+    storage = Item._meta.get_field("image").storage
+    frames = {
+        str(item_id): frame_map["frames"][str(item_id)]
+        for item_id in item_ids
+        if str(item_id) in frame_map["frames"]
+    }
+    used = sorted({frame[0] for frame in frames.values()})
+    positions = {atlas: position for position, atlas in enumerate(used)}
+    return {
+        "atlases": [storage.url(frame_map["atlases"][atlas]) for atlas in used],
+        "frames": {
+            item_id: [positions[frame[0]], *frame[1:]] for item_id, frame in frames.items()
+        },
+    }
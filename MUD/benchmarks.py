@@ -0,0 +1,313 @@
+"""
+Benchmarks for the game's views.
+
+seed_world fills the database with a generated world and run_benchmarks
+drives each view in SCENARIOS through the Django test client as a random
+player, recording the latency and number of SQL queries of every request.
+The results are compared against the budgets checked in to
+benchmark_budgets.json, so a view that gets slower or starts issuing more
+queries is caught by BenchmarkTests and the benchmark_views command.
+
+Anything a scenario needs to look up (an item to buy, a free inventory
+space...) is looked up before the request is timed.
+"""
+import json
+import math
+import random
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.db import connection, reset_queries
+from django.conf import settings
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import ledger, metrics
+from .helpers import bump_item_catalog_version
+from .layout import refresh_inventory_layout
+from .models import Character, Item, ItemSettings
+from .search import get_search_backend
+from .utils import GoldReason, ItemRarity, ItemType, Slot
+
+BUDGETS_FILE = Path(__file__).with_name("benchmark_budgets.json")
+
+PERCENTILES = (50, 95, 99)
+
+# Sized so that every seeded character stays within the trait limits the
+# edit form validates
+CHARACTER_VALUES = {"inventory_size": 12, "points": 100, "gold": 100}
+
+World = namedtuple("World", ["users", "items"])
+
+Request = namedtuple("Request", ["method", "url", "data", "content_type"])
+
+
+def seed_world(users=20, items=200, items_per_character=6, seed=0):
+    """
+    Creates users with characters, a catalog of items and the item settings
+    linking them. Returns a World of the users and item ids
+
+    :param users Integer: Number of users, each with a character
+    :param items Integer: Number of items in the catalog
+    :param items_per_character Integer: Items each character starts with,
+        placed in the first spaces of their inventory
+    :param seed Integer: Seed for the random choices, so runs are comparable
+    """
+    rng = random.Random(seed)
+    items_per_character = min(items_per_character, items)
+
+    Item.objects.bulk_create(
+        Item(
+            name=f"Benchmark item {n}",
+            description="Generated by MUD.benchmarks",
+            rarity=rng.choice(ItemRarity.values),
+            item_type=rng.choice(ItemType.values),
+            slot=rng.choice(Slot.values),
+            cost=rng.randint(1, 3),
+        )
+        for n in range(items)
+    )
+    # bulk_create only sets primary keys on some databases, so read them back
+    created_items = list(
+        Item.objects.filter(name__startswith="Benchmark item ").order_by("pk")
+    )
+    # bulk_create skips the signals that maintain the catalog cache and index
+    bump_item_catalog_version()
+    get_search_backend().rebuild_index()
+
+    User = get_user_model()
+    User.objects.bulk_create(
+        User(username=f"benchmark{n}") for n in range(users)
+    )
+    created_users = list(
+        User.objects.filter(username__startswith="benchmark").order_by("pk")
+    )
+    Character.objects.bulk_create(
+        Character(owner=user, **CHARACTER_VALUES) for user in created_users
+    )
+    characters = list(Character.objects.filter(owner__in=created_users))
+    ledger.record_many(
+        (character.pk, character.gold, GoldReason.OPENING, "")
+        for character in characters
+    )
+
+    item_settings = []
+    for character in characters:
+        for index, item in enumerate(rng.sample(created_items, items_per_character)):
+            item_settings.append(
+                ItemSettings(
+                    character=character,
+                    item=item,
+                    currentSpaceIndex=str(index),
+                    lastSpaceIndex=str(index),
+                )
+            )
+    ItemSettings.objects.bulk_create(item_settings)
+
+    for character in characters:
+        refresh_inventory_layout(character.pk)
+
+    return World(created_users, [item.id for item in created_items])
+
+
+def owned_items(character):
+    return dict(
+        character.items.values_list("item_id", "currentSpaceIndex")
+    )
+
+
+def view_items(world, rng, character):
+    return Request(
+        "get", reverse("view_items"), {"rarity": rng.choice(ItemRarity.values)}, None
+    )
+
+
+def buy_item(world, rng, character):
+    owned = owned_items(character)
+    item_id = rng.choice([item_id for item_id in world.items if item_id not in owned])
+    return Request("post", reverse("buy_item"), {"item_id": item_id}, None)
+
+
+def sell_item(world, rng, character):
+    item_id = rng.choice(sorted(owned_items(character)))
+    return Request("post", reverse("sell_item"), {"item_id": item_id}, None)
+
+
+def manage_inventory(world, rng, character):
+    return Request("get", reverse("manage_inventory"), None, None)
+
+
+def update_item(world, rng, character):
+    owned = owned_items(character)
+    placed = sorted(item_id for item_id, index in owned.items() if index != "-1")
+    free = sorted(
+        set(range(character.inventory_size)) - {int(owned[item_id]) for item_id in placed}
+    )
+    item_id = rng.choice(placed)
+    payload = {
+        "item_data": [
+            {
+                "item_id": item_id,
+                "lastSpaceIndex": owned[item_id],
+                "currentSpaceIndex": str(rng.choice(free)),
+            }
+        ]
+    }
+    return Request("post", reverse("update_item"), json.dumps(payload), "application/json")
+
+
+def edit_character(world, rng, character):
+    data = {
+        field: getattr(character, field)
+        for field in ("inventory_size", "points", "gold", "hp", "mp", "strength", "agility", "dexterity")
+    }
+    trait = rng.choice(("hp", "mp", "strength", "agility", "dexterity"))
+    data["points"] -= 1
+    data[trait] += 1
+    return Request("post", reverse("edit_character"), data, None)
+
+
+SCENARIOS = {
+    "view_items": view_items,
+    "buy_item": buy_item,
+    "sell_item": sell_item,
+    "manage_inventory": manage_inventory,
+    "update_item": update_item,
+    "edit_character": edit_character,
+}
+
+
+def percentile(timings, percent):
+    """
+    Nearest rank percentile of a list of timings
+
+    """
+    ordered = sorted(timings)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_scenario(world, name, iterations, seed=0):
+    """
+    Sends iterations requests to one view, each as a random user.
+    Returns a dict of latency percentiles in milliseconds and the maximum
+    number of queries a request made
+
+    :param world World: Returned by seed_world
+    :param name String: Key of SCENARIOS
+    :param iterations Integer: Number of requests to time
+    :param seed Integer: Seed for the random choices
+    """
+    rng = random.Random(seed)
+    prepare = SCENARIOS[name]
+    client = Client()
+    timings = []
+    queries = []
+
+    for _ in range(iterations):
+        user = rng.choice(world.users)
+        client.force_login(user)
+        character = Character.objects.get(owner=user)
+        request = prepare(world, rng, character)
+
+        kwargs = {"content_type": request.content_type} if request.content_type else {}
+        # The query log is bounded, so long runs would otherwise wrap it
+        reset_queries()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = getattr(client, request.method)(request.url, request.data, **kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context))
+
+        if response.status_code >= 400:
+            raise AssertionError(
+                f"{name} responded with {response.status_code} for {request}"
+            )
+
+    result = {f"p{percent}_ms": percentile(timings, percent) for percent in PERCENTILES}
+    result["queries"] = max(queries)
+    return result
+
+
+def run_benchmarks(world, iterations=50, scenarios=None, seed=0):
+    """
+    Runs each scenario and returns their results keyed by name
+
+    """
+    return {
+        name: run_scenario(world, name, iterations, seed)
+        for name in scenarios or SCENARIOS
+    }
+
+
+def measure_metrics_overhead(world, iterations=200, scenario="manage_inventory", seed=0):
+    """
+    Measures what RequestMetricsMiddleware costs. Returns the median latency
+    of a scenario with and without the middleware, and the median time one
+    SQL statement takes with and without record_query counting it, all in
+    milliseconds
+
+    :param world World: Returned by seed_world
+    :param iterations Integer: Requests and statements timed for each median
+    :param scenario String: Key of SCENARIOS to time
+    :param seed Integer: Seed for the random choices
+    """
+    without_middleware = [
+        name for name in settings.MIDDLEWARE
+        if name != "MUD.middleware.RequestMetricsMiddleware"
+    ]
+    # Warm up caches and templates so neither run pays for them
+    run_scenario(world, scenario, min(iterations, 50), seed)
+    with override_settings(MIDDLEWARE=without_middleware):
+        without = run_scenario(world, scenario, iterations, seed)
+    metrics.registry.reset()
+    with_ = run_scenario(world, scenario, iterations, seed)
+
+    def time_queries():
+        timings = []
+        with connection.cursor() as cursor:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                cursor.execute("SELECT 1")
+                timings.append((time.perf_counter() - start) * 1000)
+        return percentile(timings, 50)
+
+    metrics.install_query_recorder(connection)
+    query_without = time_queries()
+    metrics.current_request.metrics = metrics.RequestMetrics()
+    try:
+        query_with = time_queries()
+    finally:
+        del metrics.current_request.metrics
+
+    return {
+        "request_ms": with_["p50_ms"],
+        "request_without_ms": without["p50_ms"],
+        "query_ms": query_with,
+        "query_without_ms": query_without,
+    }
+
+
+def load_budgets(path=BUDGETS_FILE):
+    with open(path) as budgets:
+        return json.load(budgets)
+
+
+def check_budgets(results, budgets):
+    """
+    Returns a message for every result over its budget
+
+    :param results Dict: Returned by run_benchmarks
+    :param budgets Dict: Maximum values for each result, keyed like results
+    """
+    failures = []
+    for name, result in results.items():
+        for metric, limit in budgets.get(name, {}).items():
+            value = result[metric]
+            if value > limit:
+                value = f"{value:.1f}" if metric.endswith("_ms") else value
+                failures.append(f"{name} {metric} is {value}, over its budget of {limit}")
+    return failures
@@ -0,0 +1,272 @@
+"""
+Bulk import and export of the item catalog.
+
+Items are read from CSV or JSON lines files one chunk at a time. Each chunk
+is written with one batched INSERT for new names and one batched UPDATE for
+names already in the catalog, so an import never holds more than a chunk of
+items in memory and costs a handful of queries per chunk.
+
+Exports stream the catalog in primary key order from a server side cursor,
+one line at a time, so they never hold the whole catalog in memory. They
+query the database as they go, so responses must not iterate them on an
+ASGI event loop (see MUD.admin.export_response).
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .helpers import bump_item_catalog_version
+from .images import mark_item_images_changed
+from .models import Item
+from .search import get_search_backend
+
+# Columns of an exported catalog. Imports need the REQUIRED_FIELDS. Other
+# columns a row leaves blank get the field's default, and columns missing from
+# the file get it in new items and are left alone in existing ones
+ITEM_FIELDS = (
+    "name",
+    "description",
+    "item_type",
+    "slot",
+    "rarity",
+    "cost",
+    "width",
+    "height",
+    "image",
+    "image_url",
+)
+
+REQUIRED_FIELDS = ("name", "description", "cost")
+
+FORMATS = ("csv", "jsonl")
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+}
+
+
+class ItemImportError(Exception):
+    """
+    A row of an import could not be turned into an item
+    """
+
+
+def get_format(filename):
+    """
+    Returns the format of a catalog file from its extension
+
+    :param filename String: Name of the file
+    """
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension == "ndjson":
+        return "jsonl"
+    if extension not in FORMATS:
+        raise ItemImportError(f"Unknown item file format .{extension}")
+    return extension
+
+
+def read_rows(lines, file_format):
+    """
+    Yields each row of a catalog file as a dictionary
+
+    :param lines Iterable: Lines of text, e.g. a file opened in text mode
+    :param file_format String: One of FORMATS
+    """
+    if file_format == "csv":
+        yield from csv.DictReader(lines)
+        return
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise ItemImportError(f"Line {number} is not valid JSON: {error}") from error
+
+
+def clean_row(row, number):
+    """
+    Validates a row against the Item fields and returns the cleaned values
+    of the columns it has, blank ones replaced by the field's default
+
+    :param row Dict: Column names to values
+    :param number Integer: Row number, for error messages
+    """
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, "")]
+    if missing:
+        raise ItemImportError(f"Row {number} is missing {', '.join(missing)}")
+
+    values = {}
+    for name in ITEM_FIELDS:
+        if name not in row:
+            continue
+        value = row[name]
+        field = Item._meta.get_field(name)
+        if value in (None, ""):
+            values[name] = field.get_default()
+            continue
+        try:
+            values[name] = field.clean(value, None)
+        except ValidationError as error:
+            raise ItemImportError(
+                f"Row {number} has an invalid {name}: {' '.join(error.messages)}"
+            ) from error
+    return values
+
+
+def model_defaults():
+    """
+    Values a new item gets for columns its row left out
+
+    """
+    return {
+        name: Item._meta.get_field(name).get_default() for name in ITEM_FIELDS
+    }
+
+
+def import_chunk(rows):
+    """
+    Creates the items of rows whose names are new and updates the rest.
+    Returns a tuple of the number of items created and updated
+
+    Rows are written with executemany instead of bulk_create and
+    bulk_update, which build a model instance per row and, for updates, a
+    CASE expression per column that grows with the batch
+
+    :param rows List: Cleaned rows. When a name appears more than once the
+        last row wins. Updates only set the columns a row has
+    """
+    by_name = {row["name"]: row for row in rows}
+
+    existing = {}
+    # Items given a new image must have their derivatives made again
+    new_images = []
+    for pk, name, image in Item.objects.filter(name__in=by_name).values_list(
+        "pk", "name", "image"
+    ):
+        existing.setdefault(name, []).append(pk)
+        if "image" in by_name[name] and (by_name[name]["image"] or "") != image:
+            new_images.append(pk)
+
+    fields = [Item._meta.get_field(name) for name in ITEM_FIELDS]
+    defaults = model_defaults()
+
+    def prepare(row, fields):
+        values = {**defaults, **row}
+        return [field.get_db_prep_save(values[field.name], connection) for field in fields]
+
+    # Columns that are not imported (e.g. image_derivatives) are left alone
+    # by updates and get their default in new items
+    other_fields = [
+        field for field in Item._meta.concrete_fields
+        if not field.primary_key and field.name not in ITEM_FIELDS
+    ]
+    other_values = [
+        field.get_db_prep_save(field.get_default(), connection) for field in other_fields
+    ]
+
+    quote = connection.ops.quote_name
+    table = quote(Item._meta.db_table)
+    insert_columns = [quote(field.column) for field in fields + other_fields]
+    created = [
+        prepare(row, fields) + other_values
+        for name, row in by_name.items()
+        if name not in existing
+    ]
+    # Rows of one file usually share their columns, so this is one UPDATE
+    # statement per distinct set of columns
+    updated = {}
+    for name, row in by_name.items():
+        row_fields = tuple(field for field in fields if field.name in row)
+        for pk in existing.get(name, ()):
+            updated.setdefault(row_fields, []).append(prepare(row, row_fields) + [pk])
+
+    with connection.cursor() as cursor:
+        if created:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(insert_columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(insert_columns))})",
+                created,
+            )
+        for row_fields, params in updated.items():
+            assignments = ", ".join(f"{quote(field.column)} = %s" for field in row_fields)
+            cursor.executemany(
+                f"UPDATE {table} SET {assignments} "
+                f"WHERE {quote(Item._meta.pk.column)} = %s",
+                params,
+            )
+    if new_images:
+        Item.objects.filter(pk__in=new_images).update(image_derivatives={})
+    return len(created), sum(len(params) for params in updated.values())
+
+
+def import_items(rows, chunk_size=1000):
+    """
+    Adds rows to the catalog, updating items whose name already exists.
+    Nothing is imported if any row is invalid.
+    Returns a tuple of the number of items created and updated
+
+    Rows are written without the Item signals, so the catalog cache is
+    invalidated, the search index rebuilt and the generate_item_images
+    worker told about new images once at the end instead
+
+    :param rows Iterable: Dictionaries of column names to values, e.g. from
+        read_rows
+    :param chunk_size Integer: Rows written at a time
+    """
+    created = updated = 0
+    numbered = enumerate(rows, 1)
+
+    with transaction.atomic():
+        while True:
+            chunk = [clean_row(row, number) for number, row in islice(numbered, chunk_size)]
+            if not chunk:
+                break
+            chunk_created, chunk_updated = import_chunk(chunk)
+            created += chunk_created
+            updated += chunk_updated
+
+        get_search_backend().rebuild_index()
+        mark_item_images_changed()
+
+    bump_item_catalog_version()
+    return created, updated
+
+
+class Echo:
+    """
+    File like object whose write returns what was written, so csv.writer
+    can produce lines for a generator
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_items(queryset=None, file_format="csv", chunk_size=2000):
+    """
+    Yields the catalog one line at a time
+
+    :param queryset QuerySet: Items to export, the whole catalog by default
+    :param file_format String: One of FORMATS
+    :param chunk_size Integer: Rows fetched from the database at a time
+    """
+    if queryset is None:
+        queryset = Item.objects.all()
+    rows = queryset.order_by("pk").values_list(*ITEM_FIELDS).iterator(chunk_size)
+
+    if file_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(ITEM_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+
+    for row in rows:
+        yield json.dumps(dict(zip(ITEM_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
@@ -0,0 +1,112 @@
+"""
+Buying and selling items.
+
+Gold is never read, changed in Python and saved. Each operation is a single
+transaction made of conditional UPDATE/INSERT/DELETE statements, so concurrent
+requests for the same character cannot lose updates or overspend:
+
+    * gold is only taken if the UPDATE's "gold >= cost" condition still holds
+    * the unique (character, item) constraint stops an item being bought twice
+    * an item is only refunded if this request is the one that deleted it
+
+Every change is recorded in the gold ledger in the same transaction.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import ledger
+from .helpers import invalidate_character
+from .layout import refresh_inventory_layout
+from .models import Character, ItemSettings
+from .utils import GoldReason
+
+
+class EconomyError(Exception):
+    """ Base class for purchases and sales that could not happen """
+
+
+class InsufficientGold(EconomyError):
+    pass
+
+
+class AlreadyOwned(EconomyError):
+    pass
+
+
+class NotOwned(EconomyError):
+    pass
+
+
+def get_refund(item):
+    """
+    Items sell for half their cost, but never for nothing
+
+    :param item Item or CatalogItem: The item being sold
+    """
+    return max(round(item.cost / 2), 1)
+
+
+def get_gold(character):
+    return Character.objects.values_list("gold", flat=True).get(pk=character.pk)
+
+
+def buy_item(character, item):
+    """
+    Gives item to character in exchange for item.cost gold.
+    Returns the character's new gold balance.
+
+    :param character Character: The buyer
+    :param item Item or CatalogItem: The item being bought
+    :raises AlreadyOwned: The character already owns the item
+    :raises InsufficientGold: The character cannot afford the item
+    """
+    with transaction.atomic():
+        try:
+            # In a savepoint of its own, so only this insert's unique
+            # constraint error is turned into AlreadyOwned
+            with transaction.atomic():
+                ItemSettings.objects.create(character=character, item_id=item.id)
+        except IntegrityError:
+            if ItemSettings.objects.filter(character=character, item_id=item.id).exists():
+                raise AlreadyOwned(item.name)
+            raise
+
+        paid = Character.objects.filter(
+            pk=character.pk, gold__gte=item.cost
+        ).update(gold=F("gold") - item.cost)
+        if not paid:
+            raise InsufficientGold(item.name)
+        ledger.record(character.pk, -int(item.cost), GoldReason.PURCHASE, item.name)
+
+        refresh_inventory_layout(character.pk)
+        gold = get_gold(character)
+
+    invalidate_character(character.owner_id)
+    return gold
+
+
+def sell_item(character, item):
+    """
+    Takes item from character and refunds half of its cost.
+    Returns a tuple of the refund and the character's new gold balance.
+
+    :param character Character: The seller
+    :param item Item or CatalogItem: The item being sold
+    :raises NotOwned: The character does not own the item
+    """
+    refund = get_refund(item)
+
+    with transaction.atomic():
+        deleted, _ = ItemSettings.objects.filter(
+            character=character, item_id=item.id
+        ).delete()
+        if not deleted:
+            raise NotOwned(item.name)
+
+        Character.objects.filter(pk=character.pk).update(gold=F("gold") + refund)
+        ledger.record(character.pk, refund, GoldReason.SALE, item.name)
+        refresh_inventory_layout(character.pk)
+        gold = get_gold(character)
+
+    invalidate_character(character.owner_id)
+    return refund, gold
@@ -3,8 +3,9 @@ from django import forms
 
 from crispy_forms.helper import FormHelper
 
+from .apps import TRAIT_FIELDS
+from .helpers import get_trait_schema
 from .models import Character
-from . import defaultValues
 
 
 class DisplayCharacterForm(ModelForm):
@@ -12,9 +13,12 @@ class DisplayCharacterForm(ModelForm):
     Form used to display character information to user
 
     """
+    # Shown but never saved by the form. Gold only changes through MUD.ledger
+    gold = forms.IntegerField(required=False, widget=forms.TextInput)
+
     class Meta:
         model = Character
-        exclude = ["id", "owner"]
+        exclude = ["id", "owner", "gold"]
         widgets = {
             "points": forms.TextInput,
             "gold": forms.TextInput,
@@ -31,6 +35,7 @@ class DisplayCharacterForm(ModelForm):
         self.helper = FormHelper(self)
         self.helper.form_show_labels = False
 
+        self.fields["gold"].initial = self.instance.gold
         self.fields["gold"].widget.attrs['readonly']=True
         self.fields["gold"].widget.attrs['aria-labelledby']="GoldTitle"
 
@@ -55,11 +60,13 @@ class DisplayCharacterForm(ModelForm):
 
 class EditCharacterForm(ModelForm):
     """
-    Form used to allow user to spend points upgrading their character
+    Form used to allow user to spend points upgrading their character.
+    Only the points and the traits can be edited; gold only changes through
+    MUD.ledger
     """
     class Meta:
         model = Character
-        exclude = ["id", "owner"]
+        fields = ("points",) + TRAIT_FIELDS
         widgets = {
             "points": forms.TextInput,
             "hp": forms.TextInput,
@@ -77,34 +84,22 @@ class EditCharacterForm(ModelForm):
         self.fields["points"].widget.attrs['readonly']=True
         self.fields["points"].widget.attrs['aria-labelledby']="PointsTitle"
 
-        self.fields["hp"].widget.attrs["data-min"] = defaultValues.MIN_HP_VALUE
-        self.fields["hp"].widget.attrs["data-max"] = defaultValues.MAX_HP_VALUE
-        self.fields["hp"].widget.attrs['aria-labelledby']="HPTitle"
+        # The limits editform.js keeps the traits within
+        for trait in get_trait_schema().traits:
+            if trait.name in self.fields:
+                self.fields[trait.name].widget.attrs.update(trait.widget_attrs)
 
-        self.fields["mp"].widget.attrs["data-min"] = defaultValues.MIN_MP_VALUE
-        self.fields["mp"].widget.attrs["data-max"] = defaultValues.MAX_MP_VALUE
+        self.fields["hp"].widget.attrs['aria-labelledby']="HPTitle"
         self.fields["mp"].widget.attrs['aria-labelledby']="MPTitle"
-
-        self.fields["strength"].widget.attrs[
-            "data-min"
-        ] = defaultValues.MIN_STRENGTH_VALUE
-        self.fields["strength"].widget.attrs[
-            "data-max"
-        ] = defaultValues.MAX_STRENGTH_VALUE
         self.fields["strength"].widget.attrs['aria-labelledby']="StrengthTitle"
-
-        self.fields["agility"].widget.attrs[
-            "data-min"
-        ] = defaultValues.MIN_AGILITY_VALUE
-        self.fields["agility"].widget.attrs[
-            "data-max"
-        ] = defaultValues.MAX_AGILITY_VALUE
         self.fields["agility"].widget.attrs['aria-labelledby']="AgilityTitle"
-
-        self.fields["dexterity"].widget.attrs[
-            "data-min"
-        ] = defaultValues.MIN_DEXTERITY_VALUE
-        self.fields["dexterity"].widget.attrs[
-            "data-max"
-        ] = defaultValues.MAX_DEXTERITY_VALUE
         self.fields["dexterity"].widget.attrs['aria-labelledby']="DexterityTitle"
+
+
+class ItemImportForm(forms.Form):
+    """
+    Form used by the admin to upload a CSV or JSON lines file of items
+    """
+    items_file = forms.FileField(
+        help_text="A .csv or .jsonl file with a header row or keys named like the Item fields"
+    )
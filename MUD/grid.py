@@ -0,0 +1,109 @@
+"""
+Server side rules for where items can be placed in a character's inventory.
+
+inventory_stage.js draws the inventory either horizontally (two rows) or
+vertically (two columns), adding a blocked spare cell when inventory_size is
+odd. ItemSettings.currentSpaceIndex is a cell's position in the sorted list
+of the grid's space ids, which for the sizes up to MAX_INVENTORY_SIZE is row
+major order in both layouts. The same index therefore names the same slot
+whichever way the grid is drawn, and the spare cell is always the last one.
+
+Every item is stored in the single cell at its index; Item.width and
+Item.height only set how large it is drawn. The grid is a row of
+inventory_size usable cells, held as a single integer with one bit per cell,
+so checking or applying a placement is a couple of bitwise operations.
+"""
+
+
+class InvalidPlacement(ValueError):
+    pass
+
+
+class InventoryGrid:
+    """
+    Tracks which cells of an inventory are occupied
+    """
+
+    __slots__ = ("cells", "board")
+
+    def __init__(self, cells, blocked=0):
+        self.cells = cells
+        self.board = blocked
+
+    @classmethod
+    def for_inventory_size(cls, inventory_size):
+        """
+        Creates the grid inventory_stage.js would draw for inventory_size,
+        blocking the spare cell when the size is odd
+        """
+        display_size = inventory_size + inventory_size % 2
+        blocked = 0
+        if display_size != inventory_size:
+            blocked = 1 << (display_size - 1)
+        return cls(display_size, blocked)
+
+    def cell(self, index):
+        """
+        Mask of the cell at index
+
+        :raises InvalidPlacement: If index is not a cell of the grid
+        """
+        if not 0 <= index < self.cells:
+            raise InvalidPlacement(f"Space {index} is not in the inventory")
+        return 1 << index
+
+    def is_free(self, mask):
+        return not self.board & mask
+
+    def place(self, index):
+        """
+        Marks the cell at index as occupied
+
+        :raises InvalidPlacement: If the cell is outside the grid, blocked or
+            already occupied
+        """
+        mask = self.cell(index)
+        if self.board & mask:
+            raise InvalidPlacement(f"Space {index} is already occupied")
+        self.board |= mask
+        return mask
+
+    def remove(self, mask):
+        self.board &= ~mask
+
+    def can_move(self, from_mask, to_mask):
+        """
+        Would an item in from_mask fit in to_mask once it has moved
+        """
+        return not (self.board & ~from_mask) & to_mask
+
+    def move(self, from_mask, to_mask):
+        """
+        Moves an item from the cell from_mask to the cell to_mask
+
+        :raises InvalidPlacement: If the destination is occupied by another item
+        """
+        if not self.can_move(from_mask, to_mask):
+            raise InvalidPlacement("Destination is already occupied")
+        self.board = (self.board & ~from_mask) | to_mask
+
+
+def validate_layout(inventory_size, placements, occupied=()):
+    """
+    Checks that the items in placements can all be stored in an inventory.
+
+    :param inventory_size Integer: Character.inventory_size
+    :param placements Iterable: Space index of every item to check.
+        Equipped and unplaced items should not be included
+    :param occupied Iterable: Space indexes of items already stored. They are
+        marked as occupied without being checked themselves
+    :raises InvalidPlacement: If any item in placements is outside the
+        inventory or shares a cell with another item
+    """
+    grid = InventoryGrid.for_inventory_size(inventory_size)
+    for index in occupied:
+        if 0 <= index < grid.cells:
+            grid.board |= 1 << index
+    for index in placements:
+        grid.place(index)
+    return grid
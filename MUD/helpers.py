@@ -1,7 +1,67 @@
+import copy
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from types import MappingProxyType
+
+from asgiref.local import Local
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, connections, transaction
 from django.db.models import Q
 
-from .models import Character, Item
+from .models import Character, Item, ItemSettings
+from .search import get_search_backend
+
+# Maps the GET parameters accepted by view_items to the Item field they filter
+ITEM_FILTERS = (
+    ("rarity", "rarity"),
+    ("type", "item_type"),
+    ("slot", "slot"),
+)
+
+# Item fields inventory.js needs to draw an item
+INVENTORY_ITEM_FIELDS = (
+    "name",
+    "image",
+    "item_type",
+    "slot",
+    "width",
+    "height",
+    "rarity",
+    "image_derivatives",
+)
+
+# Item fields kept in the process-local catalog snapshot
+CATALOG_ITEM_FIELDS = ("id", "cost") + INVENTORY_ITEM_FIELDS
+
+CatalogItem = namedtuple("CatalogItem", CATALOG_ITEM_FIELDS)
+
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["version", "items", "loaded"])
+
+ITEM_CATALOG_VERSION_KEY = "item_catalog_version"
+
+logger = logging.getLogger(__name__)
+
+item_catalog = None
+item_catalog_lock = threading.Lock()
+
+CHARACTER_CACHE_KEY = "character:{}"
+
+# Per process counts of how get_character lookups were answered
+character_cache_stats = Counter(request_hits=0, hits=0, misses=0)
+
+# Holds the characters looked up during the current request.
+# See MUD.middleware.CharacterCacheMiddleware
+request_characters = Local()
+
+_MISSING = object()
 
 
 def get_items_to_display(character):
@@ -15,60 +75,386 @@ def get_items_to_display(character):
     items_excluding_character_items = Item.objects.filter(~Q(name__in=character_items_list))
     return items_excluding_character_items
 
-def get_character(username):
+def get_character(user):
     """
-    Get character from database that belongs to username.
+    Get character from database that belongs to user.
     Returns a blank object if not found
 
     Used when we want to control what happens when the character doesn't
     exist. Otherwise it is better to use get_object_or_404
 
+    Characters are cached by user id across requests and memoized for the
+    rest of the request once CharacterCacheMiddleware is installed. Both are
+    cleared when the character is saved or deleted. Every call returns its own
+    copy so changes made by one caller are not seen by another.
+
+    :param user User: Usually request.user
     """
-    try:
-        character = Character.objects.get(
-            owner__username=username
+    if user is None or user.pk is None:
+        return {}
+
+    memo = getattr(request_characters, "characters", None)
+
+    if memo is not None and user.pk in memo:
+        character_cache_stats["request_hits"] += 1
+        character = memo[user.pk]
+    else:
+        key = CHARACTER_CACHE_KEY.format(user.pk)
+        character = cache.get(key, _MISSING)
+
+        if character is _MISSING:
+            character_cache_stats["misses"] += 1
+            try:
+                character = Character.objects.get(owner_id=user.pk)
+            except ObjectDoesNotExist:
+                character = None
+            cache.set(key, character, settings.CHARACTER_CACHE_TIMEOUT)
+        else:
+            character_cache_stats["hits"] += 1
+
+        if memo is not None:
+            memo[user.pk] = character
+
+    return copy.copy(character) if character else {}
+
+
+def invalidate_character(user_id):
+    """
+    Removes the character belonging to user_id from the cross request cache
+    and from the current request's memo. Other processes only see this when
+    they share the cache (see CACHES in the settings)
+
+    :param user_id Integer: Id of the character's owner
+    """
+    cache.delete(CHARACTER_CACHE_KEY.format(user_id))
+
+    memo = getattr(request_characters, "characters", None)
+    if memo is not None:
+        memo.pop(user_id, None)
+
+
+def inventory_item(item, last_space, current_space, equipped):
+    """
+    One item of an inventory in the shape inventory.js expects
+
+    :param item CatalogItem: The item
+    """
+    return {
+        "item_id": item.id,
+        "lastSpaceIndex": last_space,
+        "currentSpaceIndex": current_space,
+        "equipped": equipped,
+        **{field: getattr(item, field) for field in INVENTORY_ITEM_FIELDS},
+    }
+
+
+def get_inventory_items(character_id):
+    """
+    Returns the items in a character's inventory in the shape inventory.js
+    expects, using a single query for its ItemSettings. The item fields come
+    from the catalog snapshot.
+
+    Each dictionary holds the item_id and INVENTORY_ITEM_FIELDS of the item
+    together with lastSpaceIndex, currentSpaceIndex and equipped from its
+    ItemSettings
+
+    :param character_id Integer: Id of the character
+    """
+    catalog = get_item_catalog()
+    return [
+        inventory_item(catalog[item_id], last_space, current_space, equipped)
+        for item_id, last_space, current_space, equipped in (
+            ItemSettings.objects.filter(character_id=character_id)
+            .order_by("item_id")
+            .values_list("item_id", "lastSpaceIndex", "currentSpaceIndex", "equipped")
         )
-    except ObjectDoesNotExist:
-        character = {}
+        # Deleted since the snapshot was taken
+        if item_id in catalog
+    ]
 
-    return character
+
+def get_trait_schema():
+    """
+    The TraitSchema built by MUD.apps when the app loaded
+
+    """
+    return apps.get_app_config("MUD").trait_schema
 
 
-def validate_character_form(new_data, username):
+def validate_character_form(new_data, old_values):
     """
-    Checks that the upgrades to traits falls within the boundary of the old points.
+    Checks that the upgrades to traits falls within the boundary of the old points
+    and within each trait's limits.
     This is done to rule out the user by passing the frontend validation and
     changing the POST data.
 
-    :param new_data Object: The post data from the edit form
-    :param username : Username of the currently logged in user
+    :param new_data Dict: The cleaned data of the edit form
+    :param old_values Tuple: The character's points and trait values before
+        the edit, from get_trait_schema().values(character). Read them before
+        validating the form, which updates the character
     """
-    fields = Character._meta.get_fields(include_parents=False)
-    old_data = get_character(username)
+    schema = get_trait_schema()
+    old_points, *old_traits = old_values
 
-    cumulative_difference = 0
+    # Users cannot claim previously spent points
+    if new_data["points"] > old_points:
+        return False
 
-    for field in fields:
-        trait_name = field.__str__().split(".")[2]
+    cumulative_difference = new_data["points"] - old_points
+    for trait, old_value in zip(schema.traits, old_traits):
+        new_value = new_data[trait.name]
+        if trait.clamp(new_value) != new_value:
+            return False
+        cumulative_difference += new_value - old_value
 
-        if trait_name == "id" or trait_name == "owner":
-            continue
+    # Users cannot spend more points than they had
+    return cumulative_difference <= old_points
 
-        old_value = int(getattr(old_data, trait_name))
-        new_value = int(new_data[trait_name])
 
-        # Users cannot claim previously spent points
-        if trait_name == "points" and new_value > old_value:
-            return False
+def normalize_item_filters(query_dict):
+    """
+    Turns the GET parameters of view_items into a canonical dictionary so
+    that equivalent searches (different case, order or duplicates) share
+    one cache entry.
 
-        cumulative_difference += new_value - old_value
+    Labels such as "Main Hand" are converted into their stored value "main_hand"
 
-    # Users cannot spend more points than they had
-    if cumulative_difference > getattr(old_data,"points"):
+    :param query_dict QueryDict: request.GET
+    """
+    filters = {}
+
+    for parameter, field in ITEM_FILTERS:
+        values = query_dict.get(parameter, "")
+        values = {
+            value.strip().lower().replace(" ", "_")
+            for value in values.split(",")
+            if value.strip()
+        }
+        if values:
+            filters[field] = tuple(sorted(values))
+
+    query = query_dict.get("q", "").strip().lower()
+    if query:
+        filters["q"] = query
+
+    return filters
+
+
+def filter_items(filters):
+    """
+    Applies the rarity, type and slot filters to the item catalog.
+    The "q" filter is handled by the search backend in get_item_page
+
+    :param filters Dictionary: Output of normalize_item_filters
+    """
+    items = Item.objects.all()
+
+    for _, field in ITEM_FILTERS:
+        if field in filters:
+            items = items.filter(**{f"{field}__in": filters[field]})
+
+    return items
+
+
+def new_item_catalog_version():
+    # Starts from a random number, so a version lost from the cache is never
+    # confused with one that was seen before it
+    return random.getrandbits(48)
+
+
+def get_item_catalog_version():
+    """
+    Current version of the item catalog. Every cached page and the catalog
+    snapshot include it, so bumping it invalidates all of them at once.
+
+    """
+    return cache.get_or_set(ITEM_CATALOG_VERSION_KEY, new_item_catalog_version, None)
+
+
+def _increment_item_catalog_version():
+    try:
+        cache.incr(ITEM_CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(ITEM_CATALOG_VERSION_KEY, new_item_catalog_version(), None)
+
+
+def bump_item_catalog_version():
+    """
+    Invalidates every cached catalog page and the catalog snapshot. Called
+    when an Item changes.
+
+    """
+    _increment_item_catalog_version()
+    # Other threads may have read the catalog before the change was
+    # committed, so it is bumped again once it is
+    transaction.on_commit(_increment_item_catalog_version)
+
+
+def load_item_catalog(version, chunk_size=2000):
+    """
+    Reads every item into a new CatalogSnapshot
+
+    :param version Integer: Catalog version the snapshot is of. Read before
+        the items, so changes made while they are read bump it
+    :param chunk_size Integer: Rows fetched from the database at a time
+    """
+    loaded = time.monotonic()
+    rows = Item.objects.order_by("pk").values_list(*CATALOG_ITEM_FIELDS).iterator(chunk_size)
+    return CatalogSnapshot(
+        version, MappingProxyType({row[0]: CatalogItem._make(row) for row in rows}), loaded
+    )
+
+
+def is_item_catalog_current(snapshot, version):
+    if snapshot is None or snapshot.version != version:
         return False
+    return time.monotonic() - snapshot.loaded < settings.ITEM_CATALOG_SNAPSHOT_MAX_AGE
+
+
+def get_item_catalog():
+    """
+    Returns a read only mapping of item ids to CatalogItems, shared by every
+    thread of the process. It is loaded again only when the catalog version
+    has changed, so looking items up in it costs no queries.
+    The version is only seen by other processes through a shared cache (see
+    CACHES in settings). In case a bump is missed, a snapshot older than
+    settings.ITEM_CATALOG_SNAPSHOT_MAX_AGE seconds is loaded again anyway
+
+    """
+    global item_catalog
 
-    return True
+    version = get_item_catalog_version()
+    snapshot = item_catalog
+    if not is_item_catalog_current(snapshot, version):
+        with item_catalog_lock:
+            # Another thread may have loaded it while this one waited
+            snapshot = item_catalog
+            if not is_item_catalog_current(snapshot, version):
+                snapshot = item_catalog = load_item_catalog(version)
+    return snapshot.items
 
 
+def preload_item_catalog():
+    """
+    Loads the catalog snapshot when a worker process starts, so the first
+    request does not wait for it. If the database cannot be reached yet the
+    first request loads it instead
+
+    """
+    try:
+        get_item_catalog()
+    except DatabaseError:
+        logger.warning("Could not preload the item catalog", exc_info=True)
+    finally:
+        # Requests open their own connections
+        connections.close_all()
+
+
+def get_catalog_item(item_id):
+    """
+    Returns the CatalogItem with this id, or None if there is none
+
+    :param item_id Integer or String: Id of the item, e.g. from a form
+    """
+    try:
+        return get_item_catalog().get(int(item_id))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_item_page(filters, after=None, before=None, page_size=None):
+    """
+    Returns one page of the item catalog using keyset pagination on Item.id,
+    so fetching a deep page costs the same as fetching the first one.
+    When a "q" filter is present the results come from the search index in
+    rank order instead, and the cursors refer to positions in that ranking.
+
+    Pages are cached per filter combination and cursor until an Item is
+    saved or deleted.
+
+    :param filters Dictionary: Output of normalize_item_filters
+    :param after Integer: Return items that come after the item with this id
+    :param before Integer: Return items that come before the item with this id
+    :param page_size Integer: Defaults to settings.ITEMS_PER_PAGE
+    """
+    page_size = page_size or settings.ITEMS_PER_PAGE
+
+    filters_hash = hashlib.md5(
+        json.dumps(sorted(filters.items())).encode()
+    ).hexdigest()
+    cache_key = (
+        f"item_page:{get_item_catalog_version()}:{filters_hash}:"
+        f"{after}:{before}:{page_size}"
+    )
+    page = cache.get(cache_key)
+    if page is not None:
+        return page
+
+    items = filter_items(filters)
+    truncated = False
+
+    if "q" in filters:
+        items, has_next, has_previous, truncated = _get_search_page(
+            items, filters["q"], after, before, page_size
+        )
+    elif before is not None:
+        items = list(items.filter(id__lt=before).order_by("-id")[: page_size + 1])
+        has_previous = len(items) > page_size
+        items = items[:page_size][::-1]
+        has_next = True
+    else:
+        if after is not None:
+            items = items.filter(id__gt=after)
+        items = list(items.order_by("id")[: page_size + 1])
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        has_previous = after is not None
+
+    page = {
+        "items": items,
+        "next": items[-1].id if items and has_next else None,
+        "previous": items[0].id if items and has_previous else None,
+        "truncated": truncated,
+    }
+    cache.set(cache_key, page, settings.ITEM_CATALOG_CACHE_TIMEOUT)
+
+    return page
+
+
+def _get_search_page(items, query, after, before, page_size):
+    """
+    Pages through search results in rank order. The cursors are item ids,
+    resolved to their position in the ranked results. A cursor that is no
+    longer among the results gives an empty page.
+    Only the best settings.ITEM_SEARCH_MAX_RESULTS matches among items are
+    paged through; truncated is True when more of them matched.
+
+    Returns a tuple of (items, has_next, has_previous, truncated)
+    """
+    ranked_ids = get_search_backend().search(
+        query, settings.ITEM_SEARCH_MAX_RESULTS + 1, items
+    )
+    truncated = len(ranked_ids) > settings.ITEM_SEARCH_MAX_RESULTS
+    ranked_ids = ranked_ids[: settings.ITEM_SEARCH_MAX_RESULTS]
+
+    start, end = 0, len(ranked_ids)
+    if before is not None:
+        if before not in ranked_ids:
+            return [], False, False, truncated
+        end = ranked_ids.index(before)
+        start = max(end - page_size, 0)
+    elif after is not None:
+        if after not in ranked_ids:
+            return [], False, False, truncated
+        start = ranked_ids.index(after) + 1
+    end = min(end, start + page_size)
 
+    page_ids = ranked_ids[start:end]
+    items_by_id = Item.objects.in_bulk(page_ids)
 
+    return (
+        [items_by_id[item_id] for item_id in page_ids if item_id in items_by_id],
+        end < len(ranked_ids),
+        start > 0,
+        truncated,
+    )
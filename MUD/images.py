@@ -0,0 +1,191 @@
+"""
+Resized copies of item images.
+
+Each Item.image is scaled down to the sizes in IMAGE_DERIVATIVES and saved
+both as WebP and in the upload's own format (PNG or JPEG), through the
+storage of the image field, so they end up next to the uploads locally or in
+the media bucket on S3. Their names are stored in Item.image_derivatives:
+
+    {
+        "source": "items/bread.png",
+        "card": {"webp": "items/derivatives/bread-card.webp",
+                 "image": "items/derivatives/bread-card.png"},
+        ...
+    }
+
+"source" is the image the derivatives were made from, so generating them
+again for the same image does nothing unless forced.
+
+Resizing is too slow to do while an item is saved. The Item signals only
+mark the images as changed once the save is committed, and the
+generate_item_images worker makes the copies. Until then the item shows its
+original image.
+"""
+import logging
+import posixpath
+import random
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+
+from .helpers import bump_item_catalog_version
+from .models import Item
+
+logger = logging.getLogger(__name__)
+
+# Largest width or height of each derivative in pixels. card is the 18rem
+# wide shop card, thumb covers two 75px inventory cells
+IMAGE_DERIVATIVES = {
+    "card": 288,
+    "thumb": 150,
+}
+
+DERIVATIVES_DIRECTORY = "derivatives"
+
+WEBP_QUALITY = 80
+
+ITEM_IMAGES_CHANGED_KEY = "item_images_changed"
+
+
+def derivative_name(source, size_name, extension):
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, DERIVATIVES_DIRECTORY, f"{stem}-{size_name}.{extension}")
+
+
+def encode(image, image_format, **options):
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return ContentFile(output.getvalue())
+
+
+def save(storage, name, content):
+    """
+    Saves content under exactly name, replacing any file already there,
+    so the names stay predictable
+
+    """
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+def render_derivatives(source, storage):
+    """
+    Creates and stores every derivative of an image.
+    Returns them in the shape of Item.image_derivatives
+
+    :param source String: Name of the image in storage
+    :param storage Storage: Where the image is and the derivatives go
+    """
+    with storage.open(source, "rb") as source_file:
+        original = Image.open(source_file)
+        original.load()
+
+    if original.format == "JPEG":
+        image_format, extension = "JPEG", "jpg"
+    else:
+        image_format, extension = "PNG", "png"
+    # Keep transparency for WebP and PNG, JPEG has none
+    mode = "RGB" if image_format == "JPEG" else "RGBA"
+
+    derivatives = {"source": source}
+    for size_name, size in IMAGE_DERIVATIVES.items():
+        resized = original.convert(mode)
+        # Never enlarges, only fits the image within size x size
+        resized.thumbnail((size, size), Image.LANCZOS)
+        derivatives[size_name] = {
+            "webp": save(
+                storage,
+                derivative_name(source, size_name, "webp"),
+                encode(resized, "WEBP", quality=WEBP_QUALITY, method=6),
+            ),
+            "image": save(
+                storage,
+                derivative_name(source, size_name, extension),
+                encode(resized, image_format, optimize=True),
+            ),
+        }
+    return derivatives
+
+
+def needs_derivatives(item):
+    """
+    Has the item's image changed since its derivatives were made.
+    Only compares names, so it is cheap enough to call on every save
+
+    """
+    source = item.image.name if item.image else ""
+    return (item.image_derivatives or {}).get("source", "") != source
+
+
+def _set_item_images_changed():
+    cache.set(ITEM_IMAGES_CHANGED_KEY, random.getrandbits(48), None)
+
+
+def mark_item_images_changed():
+    """
+    Tells the generate_item_images worker to look for new images once the
+    current transaction is committed, so it never misses an uncommitted item
+
+    """
+    transaction.on_commit(_set_item_images_changed)
+
+
+def get_item_images_changed():
+    """
+    Token that changes every time item images are marked as changed
+
+    """
+    return cache.get(ITEM_IMAGES_CHANGED_KEY)
+
+
+def generate_item_derivatives(item, force=False):
+    """
+    Makes the derivatives of an item's image if its current image has none.
+    Returns True if they were generated
+
+    :param item Item: The item
+    :param force Boolean: Generate them even if they are up to date
+    """
+    if not force and not needs_derivatives(item):
+        return False
+
+    source = item.image.name if item.image else ""
+
+    derivatives = {}
+    if source:
+        try:
+            derivatives = render_derivatives(source, item.image.storage)
+        except (OSError, UnidentifiedImageError):
+            logger.warning("Could not make derivatives of %s", source, exc_info=True)
+            return False
+
+    item.image_derivatives = derivatives
+    # update() so the Item signals do not run again
+    Item.objects.filter(pk=item.pk).update(image_derivatives=derivatives)
+    bump_item_catalog_version()
+    return True
+
+
+def get_derivative_name(item, size_name, kind="image"):
+    """
+    Returns the name of one derivative of an item's image, falling back to
+    the image itself while it has none
+
+    :param item Item or Dict: The item, or its INVENTORY_ITEM_FIELDS
+    :param size_name String: Key of IMAGE_DERIVATIVES
+    :param kind String: "webp", or "image" for the image's own format
+    """
+    if isinstance(item, dict):
+        image, derivatives = item["image"], item["image_derivatives"]
+    else:
+        image, derivatives = item.image.name if item.image else "", item.image_derivatives
+
+    derivatives = derivatives or {}
+    if derivatives.get("source") != image:
+        return image
+    return derivatives.get(size_name, {}).get(kind, image)
@@ -0,0 +1,129 @@
+"""
+Packed representation of a character's whole inventory layout.
+
+ItemSettings stores one row per owned item. When settings.PACKED_INVENTORY_LAYOUTS
+is enabled the same information is also kept in a single InventoryLayout row per
+character, so the layout can be read with one row fetch.
+
+The packed format is a version byte followed by one fixed size record per item:
+
+    item id            unsigned 64 bit
+    currentSpaceIndex  signed 8 bit, -1 when the item has no location
+    lastSpaceIndex     signed 8 bit, -1 when the item has no location
+    equipped           1 byte boolean
+"""
+import struct
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .helpers import get_item_catalog, inventory_item
+from .models import InventoryLayout, ItemSettings
+
+LAYOUT_VERSION = 1
+
+RECORD = struct.Struct("<Qbb?")
+
+LayoutEntry = namedtuple(
+    "LayoutEntry", ["item_id", "currentSpaceIndex", "lastSpaceIndex", "equipped"]
+)
+
+
+def encode_layout(entries):
+    """
+    Packs layout entries into bytes
+
+    :param entries Iterable: LayoutEntry or equivalent tuples
+    """
+    data = bytearray([LAYOUT_VERSION])
+    for item_id, current, last, equipped in entries:
+        data += RECORD.pack(item_id, int(current), int(last), equipped)
+    return bytes(data)
+
+
+def decode_layout(data):
+    """
+    Unpacks bytes created by encode_layout into a list of LayoutEntry
+
+    :param data Bytes: Packed layout
+    """
+    data = bytes(data)
+    if not data:
+        return []
+    if data[0] != LAYOUT_VERSION:
+        raise ValueError(f"Unknown inventory layout version {data[0]}")
+    return [LayoutEntry._make(record) for record in RECORD.iter_unpack(data[1:])]
+
+
+def get_layout_entries(character_id):
+    """
+    Reads the layout of a character from ItemSettings
+
+    :param character_id Integer: Id of the character
+    """
+    return [
+        LayoutEntry(item_id, current, last, equipped)
+        for item_id, current, last, equipped in ItemSettings.objects.filter(
+            character_id=character_id
+        )
+        .order_by("item_id")
+        .values_list("item_id", "currentSpaceIndex", "lastSpaceIndex", "equipped")
+    ]
+
+
+def refresh_inventory_layout(character_id):
+    """
+    Rewrites the packed layout of a character from its ItemSettings.
+    Does nothing unless settings.PACKED_INVENTORY_LAYOUTS is enabled
+
+    :param character_id Integer: Id of the character
+    """
+    if not settings.PACKED_INVENTORY_LAYOUTS:
+        return
+
+    # Lock the layout before reading ItemSettings so that concurrent refreshes
+    # for the same character take turns and each one sees the other's changes
+    with transaction.atomic():
+        layout, _ = InventoryLayout.objects.select_for_update().get_or_create(
+            character_id=character_id
+        )
+        layout.data = encode_layout(get_layout_entries(character_id))
+        layout.save(update_fields=["data"])
+
+
+def get_inventory_layout(character_id):
+    """
+    Reads the packed layout of a character with a single row fetch.
+    Returns a list of LayoutEntry, empty if the character has no layout yet
+
+    :param character_id Integer: Id of the character
+    """
+    data = (
+        InventoryLayout.objects.filter(character_id=character_id)
+        .values_list("data", flat=True)
+        .first()
+    )
+    return decode_layout(data or b"")
+
+
+def get_layout_inventory_items(character_id):
+    """
+    Same as helpers.get_inventory_items but reads the positions from the
+    packed layout instead of ItemSettings
+
+    :param character_id Integer: Id of the character
+    """
+    entries = get_inventory_layout(character_id)
+    catalog = get_item_catalog()
+
+    return [
+        inventory_item(
+            catalog[entry.item_id],
+            str(entry.lastSpaceIndex),
+            str(entry.currentSpaceIndex),
+            entry.equipped,
+        )
+        for entry in entries
+        if entry.item_id in catalog
+    ]
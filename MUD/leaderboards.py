@@ -0,0 +1,172 @@
+"""
+Character leaderboards for gold and each trait.
+
+Each leaderboard is a snapshot of every character's value, read in one
+streamed query that walks the (value descending, id) index of its field and
+kept as NumPy arrays in the process. Snapshots are rebuilt once older than
+settings.LEADERBOARD_REFRESH_SECONDS by a background thread, and requests
+keep using the previous snapshot until it is done.
+
+Ranks are competition ranks, so characters with equal values share a rank.
+Because the values are sorted, finding the rank of a value is a binary
+search, and a page is a slice of the snapshot plus one query for the names.
+At a million characters a snapshot takes 16MB.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .models import Character
+from .stats import STAT_FIELDS
+
+LEADERBOARD_FIELDS = ("gold",) + STAT_FIELDS
+
+SNAPSHOT_DTYPE = np.dtype([("id", np.int64), ("value", np.int64)])
+
+leaderboards = {}
+leaderboard_locks = {field: threading.Lock() for field in LEADERBOARD_FIELDS}
+
+
+class Leaderboard:
+    """
+    Every character ordered by one field, highest value first and ties
+    broken by id
+    """
+
+    __slots__ = ("field", "ids", "keys", "built")
+
+    def __init__(self, field, rows, built):
+        self.field = field
+        self.ids = np.ascontiguousarray(rows["id"])
+        # Negated values are in ascending order, as np.searchsorted needs
+        self.keys = -rows["value"]
+        self.built = built
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rank(self, value):
+        """
+        Rank a character with this value has: one more than the number of
+        characters with a higher value
+
+        """
+        return int(np.searchsorted(self.keys, -value, side="left")) + 1
+
+    def entries(self, start, stop):
+        """
+        Returns (rank, character id, value) for the characters ranked in
+        positions start to stop
+
+        """
+        keys = self.keys[start:stop]
+        ranks = np.searchsorted(self.keys, keys, side="left") + 1
+        return list(zip(ranks.tolist(), self.ids[start:stop].tolist(), (-keys).tolist()))
+
+
+def build_leaderboard(field, chunk_size=10000):
+    """
+    Reads every character's value of field into a new Leaderboard
+
+    :param field String: One of LEADERBOARD_FIELDS
+    :param chunk_size Integer: Rows fetched from the database at a time
+    """
+    rows = (
+        Character.objects.order_by(f"-{field}", "pk")
+        .values_list("pk", field)
+        .iterator(chunk_size)
+    )
+    return Leaderboard(field, np.fromiter(rows, dtype=SNAPSHOT_DTYPE), time.monotonic())
+
+
+def _refresh_in_background(field):
+    try:
+        leaderboards[field] = build_leaderboard(field)
+    finally:
+        leaderboard_locks[field].release()
+        connection.close()
+
+
+def get_leaderboard(field):
+    """
+    Returns the snapshot of a leaderboard. Only a process without one waits
+    for it to be built; once it is older than
+    settings.LEADERBOARD_REFRESH_SECONDS the stale snapshot is returned
+    while one background thread rebuilds it
+
+    :param field String: One of LEADERBOARD_FIELDS
+    """
+    leaderboard = leaderboards.get(field)
+    lock = leaderboard_locks[field]
+
+    if leaderboard is None:
+        with lock:
+            # Another thread may have built it while this one waited
+            if field not in leaderboards:
+                leaderboards[field] = build_leaderboard(field)
+            return leaderboards[field]
+
+    stale = time.monotonic() - leaderboard.built >= settings.LEADERBOARD_REFRESH_SECONDS
+    # The lock is released by the thread once it has rebuilt the snapshot
+    if stale and lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, args=(field,), daemon=True).start()
+    return leaderboard
+
+
+def clear_leaderboards():
+    leaderboards.clear()
+
+
+def get_leaderboard_page(field, page, page_size=None):
+    """
+    Returns a dictionary with one page of a leaderboard's entries, each a
+    dictionary of rank, character id, username and value, along with the
+    page number and number of pages
+
+    :param field String: One of LEADERBOARD_FIELDS
+    :param page Integer: Page number, starting at 1. Pages out of range are
+        moved to the nearest page
+    :param page_size Integer: Defaults to settings.LEADERBOARD_PAGE_SIZE
+    """
+    page_size = page_size or settings.LEADERBOARD_PAGE_SIZE
+    leaderboard = get_leaderboard(field)
+
+    pages = max((len(leaderboard) + page_size - 1) // page_size, 1)
+    page = min(max(page, 1), pages)
+    start = (page - 1) * page_size
+    entries = leaderboard.entries(start, start + page_size)
+
+    usernames = dict(
+        Character.objects.filter(pk__in=[entry[1] for entry in entries]).values_list(
+            "pk", "owner__username"
+        )
+    )
+    return {
+        "entries": [
+            {
+                "rank": rank,
+                "character": character_id,
+                # Characters deleted since the snapshot have no name
+                "username": usernames.get(character_id, ""),
+                "value": value,
+            }
+            for rank, character_id, value in entries
+        ],
+        "page": page,
+        "pages": pages,
+    }
+
+
+def get_rank(field, character):
+    """
+    Returns the rank of a character's current value on a leaderboard and the
+    number of characters on it
+
+    :param field String: One of LEADERBOARD_FIELDS
+    :param character Character: The character
+    """
+    leaderboard = get_leaderboard(field)
+    return leaderboard.rank(getattr(character, field)), len(leaderboard)
@@ -0,0 +1,164 @@
+"""
+The gold ledger.
+
+Every change to Character.gold appends a GoldTransaction in the same
+transaction, so Character.gold is a materialized balance that always equals
+the sum of the character's ledger. reconcile_gold checks that it does.
+
+compact_gold_ledger keeps history queries bounded by replacing old rows with
+one snapshot row per character holding their sum.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Character, GoldTransaction
+from .utils import GoldReason
+
+
+def record(character_id, amount, reason, reference=""):
+    """
+    Appends a change to a character's ledger. Call it in the transaction that
+    changes Character.gold
+
+    :param character_id Integer: Id of the character
+    :param amount Integer: Gold gained, negative for gold spent
+    :param reason GoldReason: Why the gold changed
+    :param reference String: Item name, order number etc.
+    """
+    return GoldTransaction.objects.create(
+        character_id=character_id,
+        amount=amount,
+        reason=reason,
+        reference=str(reference),
+    )
+
+
+def record_many(changes):
+    """
+    Appends many changes with one INSERT
+
+    :param changes Iterable: (character_id, amount, reason, reference) tuples
+    """
+    return GoldTransaction.objects.bulk_create(
+        GoldTransaction(
+            character_id=character_id,
+            amount=amount,
+            reason=reason,
+            reference=str(reference),
+        )
+        for character_id, amount, reason, reference in changes
+    )
+
+
+def get_history(character_id, limit=50):
+    """
+    Returns a character's most recent ledger entries, newest first
+
+    :param character_id Integer: Id of the character
+    :param limit Integer: Maximum number of entries
+    """
+    return list(
+        GoldTransaction.objects.filter(character_id=character_id).order_by(
+            "-created", "-id"
+        )[:limit]
+    )
+
+
+def ledger_balances():
+    """
+    Subquery of each character's ledger balance, to annotate Character
+    querysets with
+
+    """
+    return Coalesce(
+        Subquery(
+            GoldTransaction.objects.filter(character=OuterRef("pk"))
+            .order_by()
+            .values("character")
+            .annotate(total=Sum("amount"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def reconcile(batch_size=10000):
+    """
+    Compares every character's gold against its ledger, walking the
+    characters in primary key order one batch at a time so memory use does
+    not grow with the table.
+    Yields (character_id, gold, ledger balance) for each mismatch
+
+    Each batch reads balances and ledgers in a single statement, so
+    purchases committed while it runs cannot cause false mismatches
+
+    :param batch_size Integer: Characters read per query
+    """
+    last_pk = 0
+    while True:
+        batch = list(
+            Character.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .annotate(ledger=ledger_balances())
+            .values_list("pk", "gold", "ledger")[:batch_size]
+        )
+        if not batch:
+            return
+
+        for pk, gold, ledger in batch:
+            if gold != ledger:
+                yield pk, gold, ledger
+        last_pk = batch[-1][0]
+
+
+def compact(before, batch_size=1000):
+    """
+    Replaces each character's ledger entries created before a cut off with
+    one snapshot entry holding their sum, dated at the newest entry it
+    replaces. Balances are unchanged.
+    Returns the number of entries removed
+
+    :param before Datetime: Entries older than this are compacted
+    :param batch_size Integer: Characters compacted per transaction
+    """
+    removed = 0
+    last_pk = 0
+    while True:
+        character_ids = list(
+            Character.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not character_ids:
+            return removed
+        last_pk = character_ids[-1]
+
+        with transaction.atomic():
+            old = GoldTransaction.objects.filter(
+                character_id__in=character_ids, created__lt=before
+            )
+            totals = list(
+                old.order_by()
+                .values("character_id")
+                .annotate(
+                    total=Sum("amount"), newest=Max("created"), entries=Count("id")
+                )
+                .filter(entries__gt=1)
+            )
+            if not totals:
+                continue
+
+            deleted, _ = old.filter(
+                character_id__in=[total["character_id"] for total in totals]
+            ).delete()
+            GoldTransaction.objects.bulk_create(
+                GoldTransaction(
+                    character_id=total["character_id"],
+                    amount=total["total"],
+                    reason=GoldReason.SNAPSHOT,
+                    created=total["newest"],
+                )
+                for total in totals
+            )
+            removed += deleted - len(totals)
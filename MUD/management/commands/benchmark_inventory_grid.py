@@ -0,0 +1,66 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from MUD import defaultValues
+from MUD.grid import InvalidPlacement, InventoryGrid, validate_layout
+
+
+class Command(BaseCommand):
+    help = "Measures how many inventory moves and layouts the grid engine validates per second"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--moves", type=int, default=100000)
+        parser.add_argument(
+            "--inventory-size", type=int, default=defaultValues.MAX_INVENTORY_SIZE
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        size = options["inventory_size"]
+        count = options["moves"]
+
+        grid = InventoryGrid.for_inventory_size(size)
+        cells = grid.cells
+        masks = []
+        for index in range(0, cells, 2):
+            try:
+                masks.append(grid.place(index))
+            except InvalidPlacement:
+                pass
+
+        moves = [
+            (rng.randrange(len(masks)), rng.randrange(cells)) for _ in range(count)
+        ]
+
+        start = time.perf_counter()
+        accepted = 0
+        for item, destination in moves:
+            try:
+                to_mask = grid.cell(destination)
+            except InvalidPlacement:
+                continue
+            if grid.can_move(masks[item], to_mask):
+                grid.move(masks[item], to_mask)
+                masks[item] = to_mask
+                accepted += 1
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"moves:   {count / elapsed:,.0f}/s ({accepted} of {count} legal)"
+        )
+
+        layouts = [
+            [rng.randrange(cells) for _ in range(len(masks))]
+            for _ in range(count // 10)
+        ]
+        start = time.perf_counter()
+        for layout in layouts:
+            try:
+                validate_layout(size, layout)
+            except InvalidPlacement:
+                pass
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"layouts: {len(layouts) / elapsed:,.0f}/s of {len(masks)} items"
+        )
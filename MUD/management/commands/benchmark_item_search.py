@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from MUD.models import Item
+from MUD.search import LikeSearchBackend, get_search_backend
+from MUD.utils import ItemRarity, ItemType, Slot
+
+WORDS = (
+    "iron steel bronze mithril oak ash bone crystal shadow flame frost storm "
+    "blade sword axe mace spear dagger bow shield buckler helm cap plate mail "
+    "robe tunic ancient cursed blessed broken gleaming rusty royal savage"
+).split()
+
+# Common terms match a large share of the catalog, rare ones a handful of
+# items and the last one nothing at all, which forces icontains to scan
+QUERIES = ("sword", "fla", "frost blade", "excalibur", "excal", "zzyzx")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the icontains shop search with the full text search index "
+        "on a generated catalog. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed_items(options["items"])
+
+            backends = {
+                "icontains": LikeSearchBackend(None),
+                "full text": get_search_backend(),
+            }
+            for query in QUERIES:
+                for label, backend in backends.items():
+                    timings = self.time_search(backend, query, options["repeat"])
+                    self.stdout.write(
+                        f"{query!r:>14} {label:>10}: "
+                        f"median {statistics.median(timings):.2f}ms "
+                        f"max {max(timings):.2f}ms"
+                    )
+
+            transaction.set_rollback(True)
+
+    def seed_items(self, count):
+        self.stdout.write(f"Generating {count} items...")
+        rng = random.Random(0)
+        Item.objects.bulk_create(
+            (
+                Item(
+                    name=" ".join(rng.sample(WORDS, 2)).title(),
+                    description=" ".join(rng.choices(WORDS, k=12))
+                    + (" excalibur" if n % 1000 == 0 else ""),
+                    rarity=rng.choice(ItemRarity.values),
+                    item_type=rng.choice(ItemType.values),
+                    slot=rng.choice(Slot.values),
+                    cost=rng.randint(1, 500),
+                )
+                for n in range(count)
+            ),
+            batch_size=1000,
+        )
+        # bulk_create skips the signals that normally maintain the index
+        get_search_backend().rebuild_index()
+
+    def time_search(self, backend, query, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            backend.search(query, 500)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from MUD.benchmarks import SCENARIOS, measure_metrics_overhead, seed_world
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the overhead of RequestMetricsMiddleware by timing a view "
+        "with and without it, and SQL statements with and without the query "
+        "recorder. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--items", type=int, default=500)
+        parser.add_argument("--iterations", type=int, default=500)
+        parser.add_argument(
+            "--scenario", default="manage_inventory", choices=sorted(SCENARIOS)
+        )
+
+    def handle(self, *args, **options):
+        with override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            world = seed_world(options["users"], options["items"])
+            result = measure_metrics_overhead(
+                world, options["iterations"], options["scenario"]
+            )
+            transaction.set_rollback(True)
+
+        request_overhead = result["request_ms"] - result["request_without_ms"]
+        query_overhead = result["query_ms"] - result["query_without_ms"]
+        self.stdout.write(
+            f"{options['scenario']} p50: {result['request_without_ms']:.3f}ms "
+            f"without metrics, {result['request_ms']:.3f}ms with "
+            f"({request_overhead * 1000:+.0f}us)"
+        )
+        self.stdout.write(
+            f"SELECT 1 p50: {result['query_without_ms'] * 1000:.1f}us without "
+            f"the query recorder, {result['query_ms'] * 1000:.1f}us with "
+            f"({query_overhead * 1000:+.1f}us)"
+        )
@@ -0,0 +1,78 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from MUD.helpers import get_trait_schema
+from MUD.models import Character
+from MUD.stats import (STAT_FIELDS, derive_character_stats, derive_stats,
+                       load_stats)
+
+
+def seed_characters(count, batch_size=10000, seed=0):
+    """
+    Creates count users, each with a character with random traits
+    """
+    rng = random.Random(seed)
+    traits = [get_trait_schema().by_name[field] for field in STAT_FIELDS]
+    User = get_user_model()
+    last_pk = User.objects.order_by("pk").values_list("pk", flat=True).last() or 0
+
+    for first in range(0, count, batch_size):
+        users = range(first, min(first + batch_size, count))
+        User.objects.bulk_create(User(username=f"statbenchmark{n}") for n in users)
+        # bulk_create only sets primary keys on some databases
+        owners = list(
+            User.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)
+        )
+        last_pk = owners[-1]
+        Character.objects.bulk_create(
+            Character(
+                owner_id=owner,
+                **{trait.name: rng.randint(trait.minimum, trait.maximum) for trait in traits},
+            )
+            for owner in owners
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares computing derived stats one Character at a time with "
+        "load_stats and derive_stats. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--characters", type=int, default=1000000)
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def time(self, label, function):
+        start = time.perf_counter()
+        result = function()
+        self.stdout.write(f"{label:>34}: {time.perf_counter() - start:.3f}s")
+        return result
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        with transaction.atomic():
+            self.time(
+                f"seeding {options['characters']} characters",
+                lambda: seed_characters(options["characters"], chunk_size),
+            )
+
+            characters = self.time(
+                "loading Character objects",
+                lambda: list(Character.objects.order_by("pk").iterator(chunk_size)),
+            )
+            self.time(
+                "derived stats, per object loop",
+                lambda: [derive_character_stats(character) for character in characters],
+            )
+            del characters
+
+            stats = self.time("load_stats", lambda: load_stats(chunk_size=chunk_size))
+            self.time("derived stats, derive_stats", lambda: derive_stats(stats))
+            self.stdout.write(f"{'stats array size':>34}: {stats.nbytes / 2**20:.1f}MiB")
+
+            transaction.set_rollback(True)
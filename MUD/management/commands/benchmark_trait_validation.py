@@ -0,0 +1,75 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from MUD.forms import EditCharacterForm
+from MUD.helpers import get_trait_schema, validate_character_form
+from MUD.models import Character
+
+
+def validate_with_model_fields(new_data, old_data):
+    """
+    How validate_character_form used to work: walking the model's fields and
+    parsing the POST data on every call
+    """
+    cumulative_difference = 0
+    for field in Character._meta.get_fields():
+        trait_name = str(field).split(".")[-1]
+        if trait_name in ("id", "owner") or not field.concrete:
+            continue
+
+        old_value = int(getattr(old_data, trait_name))
+        new_value = int(new_data[trait_name])
+        if trait_name == "points" and new_value > old_value:
+            return False
+        cumulative_difference += new_value - old_value
+
+    return cumulative_difference <= old_data.points
+
+
+class Command(BaseCommand):
+    help = (
+        "Times validate_character_form against walking the model's fields, "
+        "and building the edit character form"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        schema = get_trait_schema()
+        character = Character(**{trait.name: trait.default for trait in schema.traits})
+        old_values = schema.values(character)
+        new_data = dict(zip(schema.fields, old_values))
+        new_data["points"] -= 1
+        new_data["hp"] += 1
+        post_data = {name: str(value) for name, value in new_data.items()}
+        # The old walk read every concrete field from the POST data
+        model_post_data = {
+            field.name: str(getattr(character, field.name))
+            for field in Character._meta.concrete_fields
+            if field.name not in ("id", "owner")
+        }
+        model_post_data.update(post_data)
+
+        timings = {
+            "model fields": timeit.timeit(
+                lambda: validate_with_model_fields(model_post_data, character),
+                number=iterations,
+            ),
+            "trait schema": timeit.timeit(
+                lambda: validate_character_form(new_data, old_values),
+                number=iterations,
+            ),
+        }
+        for name, seconds in timings.items():
+            self.stdout.write(
+                f"{name:>13}: {seconds / iterations * 1e6:.2f}us per validation"
+            )
+
+        forms = max(iterations // 100, 1)
+        seconds = timeit.timeit(
+            lambda: EditCharacterForm(post_data, instance=character), number=forms
+        )
+        self.stdout.write(f"EditCharacterForm: {seconds / forms * 1e6:.1f}us per form")
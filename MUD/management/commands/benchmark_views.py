@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from MUD.benchmarks import (SCENARIOS, check_budgets, load_budgets,
+                            run_benchmarks, seed_world)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a generated world, times the game's views through the test "
+        "client and compares latency percentiles and query counts with "
+        "MUD/benchmark_budgets.json. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--items", type=int, default=2000)
+        parser.add_argument("--items-per-character", type=int, default=6)
+        parser.add_argument("--iterations", type=int, default=100)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=sorted(SCENARIOS),
+            help="Only run this scenario. Can be given more than once",
+        )
+
+    def handle(self, *args, **options):
+        # The test client needs the testserver host to be allowed
+        with override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            world = seed_world(
+                options["users"],
+                options["items"],
+                options["items_per_character"],
+                options["seed"],
+            )
+            results = run_benchmarks(
+                world, options["iterations"], options["scenario"], options["seed"]
+            )
+            transaction.set_rollback(True)
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>16}: "
+                + " ".join(
+                    f"{metric} {value:.1f}" if metric.endswith("_ms") else f"{metric} {value}"
+                    for metric, value in result.items()
+                )
+            )
+
+        failures = check_budgets(results, load_budgets())
+        if failures:
+            raise CommandError("\n".join(failures))
+        self.stdout.write("Every view is within its budget")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from MUD.atlas import MAX_ATLAS_SIZE, build_item_atlas
+
+
+class Command(BaseCommand):
+    help = (
+        "Packs every item image into the atlases the inventory draws items "
+        "from. The generate_item_images worker keeps them up to date, this "
+        "updates them by hand."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-size",
+            type=int,
+            default=MAX_ATLAS_SIZE,
+            help="Largest width and height of one atlas in pixels",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Redraw every atlas instead of only those with changed items",
+        )
+
+    def handle(self, *args, **options):
+        frame_map = build_item_atlas(max_size=options["max_size"], rebuild=options["rebuild"])
+        self.stdout.write(
+            f"Packed {len(frame_map['frames'])} items into "
+            f"{len(frame_map['atlases'])} atlases"
+        )
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from MUD.ledger import compact
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces each character's gold ledger entries older than --days with "
+        "a single snapshot entry. Balances are unchanged. Run periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options["days"])
+        removed = compact(before, options["batch_size"])
+        self.stdout.write(f"Compacted {removed} gold ledger entries")
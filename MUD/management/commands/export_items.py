@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from MUD.catalog import FORMATS, ItemImportError, export_items, get_format
+
+
+class Command(BaseCommand):
+    help = "Exports the item catalog as CSV or JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Defaults to standard output"
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Defaults to the file's extension, or csv for standard output",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            file_format = options["format"] or ("csv" if path == "-" else get_format(path))
+        except ItemImportError as error:
+            raise CommandError(error)
+
+        if path == "-":
+            for line in export_items(file_format=file_format):
+                self.stdout.write(line, ending="")
+            return
+
+        with open(path, "w", newline="", encoding="utf-8") as output:
+            output.writelines(export_items(file_format=file_format))
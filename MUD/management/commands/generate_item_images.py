@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from MUD.atlas import build_item_atlas, is_item_atlas_stale
+from MUD.images import generate_item_derivatives, get_item_images_changed
+from MUD.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        "Makes the resized and WebP copies of every item image that does "
+        "not have them yet. Safe to run again. Run with --forever as a "
+        "worker process to make them as items are saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force", action="store_true", help="Remake copies that are up to date"
+        )
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Keep waiting for changed item images instead of exiting",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2,
+            help="Seconds to wait between checks for changed item images",
+        )
+
+    def generate(self, force):
+        items = Item.objects.exclude(Q(image="") | Q(image=None)).order_by("pk")
+
+        generated = skipped = 0
+        for item in items.iterator():
+            if generate_item_derivatives(item, force=force):
+                generated += 1
+            else:
+                skipped += 1
+
+        self.stdout.write(f"Made image copies for {generated} items, skipped {skipped}")
+
+        if generated or is_item_atlas_stale():
+            frame_map = build_item_atlas()
+            self.stdout.write(
+                f"Packed {len(frame_map['frames'])} items into "
+                f"{len(frame_map['atlases'])} atlases"
+            )
+
+    def handle(self, *args, **options):
+        seen = get_item_images_changed()
+        self.generate(options["force"])
+        while options["forever"]:
+            time.sleep(options["sleep"])
+            changed = get_item_images_changed()
+            if changed != seen:
+                # Read before generating, so changes made meanwhile are
+                # picked up by the next check
+                seen = changed
+                self.generate(force=False)
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from MUD.catalog import (FORMATS, ItemImportError, get_format, import_items,
+                         read_rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports items from a CSV or JSON lines file. Items whose name is "
+        "already in the catalog are updated. Nothing is imported if any row "
+        "is invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format", choices=FORMATS, help="Defaults to the file's extension"
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            file_format = options["format"] or get_format(options["path"])
+            with open(options["path"], newline="", encoding="utf-8") as lines:
+                created, updated = import_items(
+                    read_rows(lines, file_format), options["chunk_size"]
+                )
+        except (ItemImportError, OSError) as error:
+            raise CommandError(error)
+
+        self.stdout.write(
+            f"Created {created} and updated {updated} items "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
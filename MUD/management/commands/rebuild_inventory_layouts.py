@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from MUD.layout import encode_layout, get_layout_entries
+from MUD.models import Character, InventoryLayout
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrites every character's packed inventory layout from ItemSettings. "
+        "Run this before enabling PACKED_INVENTORY_LAYOUTS."
+    )
+
+    def handle(self, *args, **options):
+        count = 0
+        for character_id in Character.objects.values_list("id", flat=True).iterator():
+            InventoryLayout.objects.update_or_create(
+                character_id=character_id,
+                defaults={"data": encode_layout(get_layout_entries(character_id))},
+            )
+            count += 1
+        self.stdout.write(f"Rebuilt {count} inventory layouts")
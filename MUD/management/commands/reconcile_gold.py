@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from MUD.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks every character's gold against the sum of its gold ledger, "
+        "reading characters in batches. Exits with an error if any differ."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for character_id, gold, balance in reconcile(options["batch_size"]):
+            mismatches += 1
+            self.stdout.write(
+                f"Character {character_id} has {gold} gold but its ledger sums to {balance}"
+            )
+
+        if mismatches:
+            raise CommandError(f"{mismatches} characters do not match their ledger")
+        self.stdout.write("Every character matches its ledger")
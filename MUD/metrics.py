@@ -0,0 +1,212 @@
+"""
+Per view request metrics, exposed in the Prometheus text format.
+
+RequestMetricsMiddleware times every request and files it under the name of
+the URL pattern it resolved to. SQL statements are counted and timed by
+record_query, an execute wrapper installed on every database connection, so
+queries made from sync_to_async threads by async views are counted too.
+
+Metrics are kept in memory by each worker process, so every process reports
+its own numbers along with its pid.
+"""
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.local import Local
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Requests that did not match any URL pattern, e.g. 404s
+UNMATCHED = "<unmatched>"
+
+# Holds the RequestMetrics of the request being handled, if any
+current_request = Local()
+
+
+class RequestMetrics:
+    __slots__ = ("queries", "sql_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+class Histogram:
+    """
+    Counts observations into buckets. Counts are stored per bucket and only
+    made cumulative when rendered
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {total}"
+
+
+class ViewMetrics:
+    __slots__ = ("duration", "queries", "sql_seconds")
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+
+
+class MetricsRegistry:
+    """
+    Metrics of every view this process has served
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, duration, queries, sql_seconds):
+        with self.lock:
+            metrics = self.views.get(view)
+            if metrics is None:
+                metrics = self.views[view] = ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.queries.observe(queries)
+            metrics.sql_seconds += sql_seconds
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format
+
+        """
+        pid = os.getpid()
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                "# HELP http_request_duration_seconds Time taken to respond to requests",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for view, metrics in views:
+                lines.extend(
+                    metrics.duration.render(
+                        "http_request_duration_seconds", f'pid="{pid}",view="{view}"'
+                    )
+                )
+            lines += [
+                "# HELP http_request_sql_queries SQL queries made per request",
+                "# TYPE http_request_sql_queries histogram",
+            ]
+            for view, metrics in views:
+                lines.extend(
+                    metrics.queries.render(
+                        "http_request_sql_queries", f'pid="{pid}",view="{view}"'
+                    )
+                )
+            lines += [
+                "# HELP http_request_sql_seconds_total Time spent running SQL queries",
+                "# TYPE http_request_sql_seconds_total counter",
+            ]
+            lines += [
+                f'http_request_sql_seconds_total{{pid="{pid}",view="{view}"}} {metrics.sql_seconds}'
+                for view, metrics in views
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper that adds each statement to the current request's metrics
+
+    """
+    metrics = getattr(current_request, "metrics", None)
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_seconds += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_created_receiver(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return UNMATCHED
+    return match.view_name
+
+
+def start_request():
+    """
+    Starts collecting the SQL metrics of a request and returns them
+
+    """
+    # The connection of this thread may have been opened before this module
+    # was imported
+    install_query_recorder(connection)
+    metrics = current_request.metrics = RequestMetrics()
+    return metrics
+
+
+def finish_request(request, metrics, start):
+    registry.observe(
+        get_view_name(request),
+        time.perf_counter() - start,
+        metrics.queries,
+        metrics.sql_seconds,
+    )
+    del current_request.metrics
+
+
+def is_staff_request(request):
+    """
+    Is the request from a logged in staff member, or does it carry the
+    settings.METRICS_SCRAPE_TOKEN bearer token (as sent by a Prometheus
+    scraper). The token is compared in constant time and, unlike a staff
+    password, costs no password hashing per scrape
+
+    """
+    if request.user.is_active and request.user.is_staff:
+        return True
+
+    method, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    if method.lower() != "bearer" or not settings.METRICS_SCRAPE_TOKEN:
+        return False
+    return hmac.compare_digest(token.encode(), settings.METRICS_SCRAPE_TOKEN.encode())
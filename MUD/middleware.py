@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from . import metrics
+from .helpers import request_characters
+
+
+class CharacterCacheMiddleware:
+    """
+    Memoizes get_character for the lifetime of each request so views and
+    helpers can look the character up as often as they like.
+
+    Supports both sync and async requests, so it does not force async views
+    back onto a thread when the site is served over ASGI
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks instances as coroutine functions so Django awaits them
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        request_characters.characters = {}
+        try:
+            return self.get_response(request)
+        finally:
+            del request_characters.characters
+
+    async def __acall__(self, request):
+        request_characters.characters = {}
+        try:
+            return await self.get_response(request)
+        finally:
+            del request_characters.characters
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the latency, SQL query count and SQL time of every request
+    under the name of the URL it resolved to. See MUD.metrics
+
+    Should be first in MIDDLEWARE so the time spent in other middleware is
+    included
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        request_metrics = metrics.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.finish_request(request, request_metrics, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        request_metrics = metrics.start_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            metrics.finish_request(request, request_metrics, start)
@@ -0,0 +1,52 @@
+from django.db import migrations
+
+# The search index as MUD.search created it when this migration was written.
+# The SQL is copied here so later changes to MUD.search do not change what
+# this migration does
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE mud_item_search USING fts5("
+    "name, description, rarity, item_type)",
+    "INSERT INTO mud_item_search (rowid, name, description, rarity, item_type) "
+    'SELECT id, name, description, rarity, item_type FROM "MUD_item"',
+]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE mud_item_search ("
+    'item_id bigint PRIMARY KEY REFERENCES "MUD_item" (id) ON DELETE CASCADE, '
+    "document tsvector NOT NULL)",
+    "CREATE INDEX mud_item_search_document ON mud_item_search USING GIN (document)",
+    "INSERT INTO mud_item_search (item_id, document) "
+    "SELECT id, "
+    "setweight(to_tsvector('english', name), 'A') || "
+    "setweight(to_tsvector('english', description), 'B') || "
+    "setweight(to_tsvector('simple', rarity || ' ' || item_type), 'C') "
+    'FROM "MUD_item"',
+]
+
+CREATE_STATEMENTS = {
+    "sqlite": SQLITE_CREATE,
+    "postgresql": POSTGRES_CREATE,
+}
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases search with icontains lookups and need no index
+    for statement in CREATE_STATEMENTS.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_STATEMENTS:
+        schema_editor.execute("DROP TABLE IF EXISTS mud_item_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0003_auto_20210704_1038'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
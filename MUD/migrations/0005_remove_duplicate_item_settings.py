@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-17 17:32
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_item_settings(apps, schema_editor):
+    """
+    Keep the oldest ItemSettings row for each character and item so that the
+    unique constraint can be added
+    """
+    ItemSettings = apps.get_model("MUD", "ItemSettings")
+    duplicates = (
+        ItemSettings.objects.values("character_id", "item_id")
+        .annotate(count=Count("id"), keep=Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        ItemSettings.objects.filter(
+            character_id=duplicate["character_id"], item_id=duplicate["item_id"]
+        ).exclude(id=duplicate["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0004_item_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_item_settings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-17 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0005_remove_duplicate_item_settings'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='itemsettings',
+            constraint=models.UniqueConstraint(fields=('character', 'item'), name='unique_character_item'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.2 on 2026-10-17 17:36
+
+import struct
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The packed layout format as MUD.layout wrote it when this migration was
+# written: a version byte, then one record per item of item id,
+# currentSpaceIndex, lastSpaceIndex and equipped
+LAYOUT_VERSION = 1
+
+RECORD = struct.Struct("<Qbb?")
+
+BATCH_SIZE = 1000
+
+
+def encode_layout(entries):
+    data = bytearray([LAYOUT_VERSION])
+    for item_id, current, last, equipped in entries:
+        data += RECORD.pack(item_id, int(current), int(last), equipped)
+    return bytes(data)
+
+
+def backfill_inventory_layouts(apps, schema_editor):
+    """
+    Writes the packed layout of every character, a batch of characters at a
+    time: one query for their ItemSettings and one batched INSERT
+    """
+    Character = apps.get_model("MUD", "Character")
+    InventoryLayout = apps.get_model("MUD", "InventoryLayout")
+    ItemSettings = apps.get_model("MUD", "ItemSettings")
+
+    character_ids = Character.objects.order_by("id").values_list("id", flat=True)
+    batch = []
+    for character_id in character_ids.iterator(BATCH_SIZE):
+        batch.append(character_id)
+        if len(batch) == BATCH_SIZE:
+            write_layouts(InventoryLayout, ItemSettings, batch)
+            batch = []
+    if batch:
+        write_layouts(InventoryLayout, ItemSettings, batch)
+
+
+def write_layouts(InventoryLayout, ItemSettings, character_ids):
+    entries = {character_id: [] for character_id in character_ids}
+    rows = (
+        ItemSettings.objects.filter(character_id__in=character_ids)
+        .order_by("character_id", "item_id")
+        .values_list("character_id", "item_id", "currentSpaceIndex", "lastSpaceIndex", "equipped")
+    )
+    for character_id, *entry in rows:
+        entries[character_id].append(entry)
+
+    InventoryLayout.objects.bulk_create(
+        InventoryLayout(character_id=character_id, data=encode_layout(character_entries))
+        for character_id, character_entries in entries.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0006_itemsettings_unique_character_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLayout',
+            fields=[
+                ('character', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='layout', serialize=False, to='MUD.character')),
+                ('data', models.BinaryField(default=b'')),
+            ],
+        ),
+        migrations.RunPython(backfill_inventory_layouts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-17 17:49
+
+from itertools import islice
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def open_gold_ledgers(apps, schema_editor):
+    """
+    Opens every existing character's ledger with its current balance
+    """
+    Character = apps.get_model("MUD", "Character")
+    GoldTransaction = apps.get_model("MUD", "GoldTransaction")
+
+    balances = Character.objects.exclude(gold=0).values_list("id", "gold").iterator()
+    while True:
+        batch = [
+            GoldTransaction(character_id=character_id, amount=gold, reason="opening")
+            for character_id, gold in islice(balances, 1000)
+        ]
+        if not batch:
+            break
+        GoldTransaction.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0007_inventorylayout'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoldTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(choices=[('opening', 'Opening balance'), ('purchase', 'Bought an item'), ('sale', 'Sold an item'), ('bundle', 'Bought a gold bundle'), ('adjustment', 'Adjusted by staff'), ('snapshot', 'Balance carried forward')], max_length=20)),
+                ('reference', models.CharField(blank=True, default='', max_length=254)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='gold_transactions', to='MUD.character')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='goldtransaction',
+            index=models.Index(fields=['character', 'created'], name='gold_character_created'),
+        ),
+        migrations.RunPython(open_gold_ledgers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-17 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0008_goldtransaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-gold', 'id'], name='character_gold_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-hp', 'id'], name='character_hp_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-mp', 'id'], name='character_mp_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-strength', 'id'], name='character_strength_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-agility', 'id'], name='character_agility_rank'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['-dexterity', 'id'], name='character_dexterity_rank'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-17 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0009_character_rank_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-17 18:25
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def check_duplicate_characters(apps, schema_editor):
+    """
+    Stops the migration if a user has more than one Character, which the
+    unique constraint added next would reject. Each character has its own
+    gold, items and ledger, so they are left for a person to merge or remove
+    instead of being deleted here
+    """
+    Character = apps.get_model("MUD", "Character")
+    duplicates = (
+        Character.objects.values("owner_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("owner_id")
+    )
+    report = [
+        f"user {duplicate['owner_id']}: characters "
+        + ", ".join(
+            str(character_id)
+            for character_id in Character.objects.filter(owner_id=duplicate["owner_id"])
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for duplicate in duplicates
+    ]
+    if report:
+        raise RuntimeError(
+            "These users have more than one character. Merge their gold and "
+            "items into one character and delete the others before "
+            "migrating:\n" + "\n".join(report)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0010_item_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_characters, migrations.RunPython.noop),
+    ]
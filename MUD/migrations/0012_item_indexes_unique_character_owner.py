@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-17 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MUD', '0011_check_duplicate_characters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='name',
+            field=models.CharField(db_index=True, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['rarity', 'id'], name='item_rarity'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_type', 'id'], name='item_type'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['slot', 'id'], name='item_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='character',
+            constraint=models.UniqueConstraint(fields=('owner',), name='unique_character_owner'),
+        ),
+    ]
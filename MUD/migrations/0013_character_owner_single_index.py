@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-17 18:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('MUD', '0012_item_indexes_unique_character_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='character',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='owner', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,14 +1,15 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 from . import defaultValues
-from .utils import Slot, ItemType, ItemRarity
+from .utils import Slot, ItemType, ItemRarity, GoldReason
 
 
 class Item(models.Model):
 
-    name = models.CharField(max_length=254)
+    name = models.CharField(max_length=254, db_index=True)
 
     image_url = models.URLField(max_length=1024, null=True, blank=True)
 
@@ -16,6 +17,9 @@ class Item(models.Model):
         upload_to="items", max_length=1204, null=True, blank=True
     )
 
+    # Names of the resized copies of image, see MUD.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
     item_type = models.CharField(
         default=ItemType.SHIELD, choices=ItemType.choices, max_length=50
     )
@@ -36,6 +40,14 @@ class Item(models.Model):
         default=ItemRarity.COMMON, choices=ItemRarity.choices, max_length=50
     )
 
+    class Meta:
+        # view_items filters on these and pages through the results by id
+        indexes = [
+            models.Index(fields=["rarity", "id"], name="item_rarity"),
+            models.Index(fields=["item_type", "id"], name="item_type"),
+            models.Index(fields=["slot", "id"], name="item_slot"),
+        ]
+
     def __str__(self):
         return f"{self.id} - {self.name} "
 
@@ -62,6 +74,13 @@ class ItemSettings(models.Model):
 
     equipped = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["character", "item"], name="unique_character_item"
+            ),
+        ]
+
     def __str__(self):
         return f" {self.character.owner.username} - {self.item.name} - {self.equipped}"
 
@@ -69,8 +88,10 @@ class ItemSettings(models.Model):
 class Character(models.Model):
     """ Represents each chatter's character """
 
+    # unique_character_owner indexes owner, so the foreign key needs no
+    # index of its own
     owner = models.ForeignKey(
-        get_user_model(), on_delete=models.CASCADE, related_name="owner"
+        get_user_model(), on_delete=models.CASCADE, related_name="owner", db_index=False
     )
 
     inventory_size = models.IntegerField(
@@ -89,6 +110,8 @@ class Character(models.Model):
         default=defaultValues.DEFAULT_POINTS_VALUE,
     )
 
+    # Materialized balance of the character's GoldTransaction ledger.
+    # Only change it through MUD.ledger so the two stay in step
     gold = models.IntegerField(
         validators=[
             MinValueValidator(defaultValues.MIN_GOLD_VALUE),
@@ -140,5 +163,72 @@ class Character(models.Model):
         default=defaultValues.DEFAULT_STRENGTH_VALUE,
     )
 
+    class Meta:
+        # Each user has one character, looked up by get_character on most requests
+        constraints = [
+            models.UniqueConstraint(fields=["owner"], name="unique_character_owner"),
+        ]
+        # Leaderboards read characters in these orders, see MUD.leaderboards
+        indexes = [
+            models.Index(fields=["-gold", "id"], name="character_gold_rank"),
+            models.Index(fields=["-hp", "id"], name="character_hp_rank"),
+            models.Index(fields=["-mp", "id"], name="character_mp_rank"),
+            models.Index(fields=["-strength", "id"], name="character_strength_rank"),
+            models.Index(fields=["-agility", "id"], name="character_agility_rank"),
+            models.Index(fields=["-dexterity", "id"], name="character_dexterity_rank"),
+        ]
+
     def __str__(self):
         return f"{self.owner.username}'s character"
+
+
+class InventoryLayout(models.Model):
+    """
+    Every ItemSettings row of a character packed into one value.
+    See MUD.layout for the format
+    """
+
+    character = models.OneToOneField(
+        "Character",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="layout",
+    )
+
+    data = models.BinaryField(default=b"")
+
+    def __str__(self):
+        return f"{self.character_id} - {len(self.data)} bytes"
+
+
+class GoldTransaction(models.Model):
+    """
+    One change to a character's gold. Rows are only ever appended, except
+    by compact_gold_ledger which replaces old rows with a snapshot, so the
+    sum of a character's amounts is always its balance
+    """
+
+    character = models.ForeignKey(
+        "Character",
+        on_delete=models.CASCADE,
+        related_name="gold_transactions",
+    )
+
+    amount = models.IntegerField()
+
+    reason = models.CharField(choices=GoldReason.choices, max_length=20)
+
+    # Item name, order number etc. the change was made for
+    reference = models.CharField(max_length=254, blank=True, default="")
+
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["character", "created"], name="gold_character_created"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.character_id} {self.amount:+} {self.reason}"
@@ -0,0 +1,259 @@
+"""
+Full text search over the item catalog.
+
+Each backend maintains an inverted index of Item.name, description, rarity and
+item_type in its own table, kept in sync by the signals in MUD.signals:
+
+    * sqlite     - FTS5 virtual table ranked with bm25
+    * postgresql - tsvector side table with a GIN index ranked with ts_rank
+    * anything else falls back to icontains lookups on the Item table
+
+settings.ITEM_SEARCH_BACKEND can be set to the dotted path of a backend class
+to override the choice made from the database vendor.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+SEARCH_TABLE = "mud_item_search"
+
+ITEM_TABLE = "MUD_item"
+
+
+def get_search_terms(query):
+    """
+    Splits a user query into the words used to build a full text query.
+    Anything that is not a word character is discarded so that user input
+    can never be interpreted as query syntax.
+
+    :param query String: Text typed in the shop search box
+    """
+    return re.findall(r"\w+", query.lower())
+
+
+class BaseSearchBackend:
+    """
+    Interface every search backend implements
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self, schema_editor):
+        """ Creates the index table and fills it from the Item table """
+
+    def rebuild_index(self):
+        """ Re-indexes every item. Used after bulk writes that skip signals """
+
+    def drop_index(self, schema_editor):
+        """ Removes the index table """
+
+    def index_item(self, item):
+        """ Adds or replaces item in the index """
+
+    def remove_item(self, item_id):
+        """ Removes item_id from the index """
+
+    def search(self, query, limit, items=None):
+        """
+        Returns at most limit Item ids matching query, best match first
+
+        :param query String: Text typed in the shop search box
+        :param limit Integer: Maximum number of ids to return
+        :param items QuerySet: Only search these items, e.g. the catalog
+            filtered by rarity. They are filtered before the limit applies
+        """
+        raise NotImplementedError
+
+    def restrict(self, items, column):
+        """
+        SQL condition and parameters limiting column to the ids of items,
+        or an empty condition when every item is searched
+
+        :param items QuerySet: Items to search, or None
+        :param column String: Column holding the item id in the index table
+        """
+        if items is None:
+            return "", []
+        sql, params = items.values("id").query.sql_with_params()
+        return f"AND {column} IN ({sql}) ", list(params)
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    Fallback for databases without a supported full text index. Performs the
+    same icontains scan the shop originally used.
+    """
+
+    def search(self, query, limit, items=None):
+        from .models import Item
+
+        queries = (
+            Q(name__icontains=query)
+            | Q(description__icontains=query)
+            | Q(rarity__icontains=query)
+            | Q(item_type__icontains=query)
+        )
+        if items is None:
+            items = Item.objects.all()
+        return list(
+            items.filter(queries)
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+
+class SqliteSearchBackend(BaseSearchBackend):
+    """
+    Uses an FTS5 virtual table whose rowid is the Item id.
+    Matches are prefix matches on every term so results update per keystroke.
+    """
+
+    # bm25 weights for name, description, rarity and item_type
+    RANK = f"bm25({SEARCH_TABLE}, 10.0, 1.0, 2.0, 2.0)"
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "name, description, rarity, item_type)"
+        )
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, rarity, item_type) "
+                f'SELECT id, name, description, rarity, item_type FROM "{ITEM_TABLE}"'
+            )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_item(self, item):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [item.pk])
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, rarity, item_type) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [item.pk, item.name, item.description, item.rarity, item.item_type],
+            )
+
+    def remove_item(self, item_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [item_id])
+
+    def search(self, query, limit, items=None):
+        terms = get_search_terms(query)
+        if not terms:
+            return []
+
+        match = " ".join(f'"{term}"*' for term in terms)
+        restriction, params = self.restrict(items, "rowid")
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"{restriction}ORDER BY {self.RANK}, rowid LIMIT %s",
+                [match, *params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Stores a weighted tsvector per item in a side table with a GIN index.
+    Matches are prefix matches on every term so results update per keystroke.
+    """
+
+    DOCUMENT = (
+        "setweight(to_tsvector('english', {name}), 'A') || "
+        "setweight(to_tsvector('english', {description}), 'B') || "
+        "setweight(to_tsvector('simple', {rarity} || ' ' || {item_type}), 'C')"
+    )
+
+    def create_index(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE TABLE {SEARCH_TABLE} ("
+            f'item_id bigint PRIMARY KEY REFERENCES "{ITEM_TABLE}" (id) ON DELETE CASCADE, '
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX {SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)"
+        )
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        document = self.DOCUMENT.format(
+            name="name",
+            description="description",
+            rarity="rarity",
+            item_type="item_type",
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (item_id, document) "
+                f'SELECT id, {document} FROM "{ITEM_TABLE}"'
+            )
+
+    def drop_index(self, schema_editor):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def index_item(self, item):
+        document = self.DOCUMENT.format(
+            name="%s", description="%s", rarity="%s", item_type="%s"
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SEARCH_TABLE} (item_id, document) VALUES (%s, {document}) "
+                "ON CONFLICT (item_id) DO UPDATE SET document = EXCLUDED.document",
+                [item.pk, item.name, item.description, item.rarity, item.item_type],
+            )
+
+    def remove_item(self, item_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE item_id = %s", [item_id])
+
+    def search(self, query, limit, items=None):
+        terms = get_search_terms(query)
+        if not terms:
+            return []
+
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        restriction, params = self.restrict(items, "item_id")
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT item_id FROM {SEARCH_TABLE} "
+                "WHERE document @@ to_tsquery('english', %s) "
+                f"{restriction}"
+                "ORDER BY ts_rank(document, to_tsquery('english', %s)) DESC, item_id "
+                "LIMIT %s",
+                [tsquery, *params, tsquery, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SqliteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(using=None):
+    """
+    Returns the search backend for a database connection.
+
+    :param using Connection: Defaults to the default database connection
+    """
+    using = using or connection
+    backend_path = getattr(settings, "ITEM_SEARCH_BACKEND", None)
+
+    if backend_path:
+        backend_class = import_string(backend_path)
+    else:
+        backend_class = BACKENDS.get(using.vendor, LikeSearchBackend)
+
+    return backend_class(using)
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ledger
+from .helpers import bump_item_catalog_version, invalidate_character
+from .images import mark_item_images_changed, needs_derivatives
+from .models import Character, Item
+from .search import get_search_backend
+from .utils import GoldReason
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidate_item_catalog(sender, **kwargs):
+    """
+    Cached catalog pages are stale as soon as an item changes
+
+    """
+    bump_item_catalog_version()
+
+
+@receiver(post_save, sender=Item)
+def index_item(sender, instance, **kwargs):
+    """
+    Keeps the item search index in sync with the catalog
+
+    """
+    get_search_backend().index_item(instance)
+
+
+@receiver(post_save, sender=Item)
+def make_image_derivatives(sender, instance, raw=False, **kwargs):
+    """
+    Has the generate_item_images worker resize newly uploaded item images
+    and add them to the item atlas
+
+    """
+    if not raw and needs_derivatives(instance):
+        mark_item_images_changed()
+
+
+@receiver(post_delete, sender=Item)
+def unindex_item(sender, instance, **kwargs):
+    """
+    Removes deleted items from the item search index
+
+    """
+    get_search_backend().remove_item(instance.pk)
+
+
+@receiver(post_delete, sender=Item)
+def remove_from_atlas(sender, instance, **kwargs):
+    """
+    Has the generate_item_images worker drop deleted items from the item
+    atlas. A bulk delete is one batch, so the atlas is rebuilt once
+
+    """
+    if instance.image:
+        mark_item_images_changed()
+
+
+@receiver([post_save, post_delete], sender=Character)
+def invalidate_cached_character(sender, instance, **kwargs):
+    """
+    Cached characters must not outlive a change to the row
+
+    """
+    invalidate_character(instance.owner_id)
+
+
+@receiver(post_save, sender=Character)
+def record_opening_balance(sender, instance, created, raw=False, **kwargs):
+    """
+    New characters start with gold, which opens their ledger
+
+    """
+    if created and not raw and instance.gold:
+        ledger.record(instance.pk, instance.gold, GoldReason.OPENING)
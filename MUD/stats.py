@@ -0,0 +1,88 @@
+"""
+Character stats evaluated over every character at once.
+
+load_stats reads the traits of many characters into one NumPy structured
+array, a column per trait, streaming the rows of a single query. The derived
+stat formulas are plain arithmetic, so the same functions work on one
+character's integers and on whole columns, where NumPy evaluates them for
+every character in a few vectorized operations.
+"""
+import numpy as np
+
+from .models import Character
+
+STAT_FIELDS = ("hp", "mp", "strength", "agility", "dexterity")
+
+STATS_DTYPE = np.dtype([("id", np.int64)] + [(field, np.int32) for field in STAT_FIELDS])
+
+# Each point of dexterity adds this share to the damage strength deals
+DEXTERITY_DAMAGE_BONUS = 0.01
+
+# Dexterity at which half of all attacks are dodged. Dodging gets harder to
+# improve the closer it is to certain
+DODGE_HALF_POINT = 50
+
+BASE_SPEED = 1.0
+SPEED_PER_AGILITY = 0.02
+
+
+def effective_damage(strength, dexterity):
+    return strength * (1 + dexterity * DEXTERITY_DAMAGE_BONUS)
+
+
+def dodge_chance(dexterity):
+    return dexterity / (dexterity + DODGE_HALF_POINT)
+
+
+def movement_speed(agility):
+    return BASE_SPEED + agility * SPEED_PER_AGILITY
+
+
+DERIVED_STATS = {
+    "effective_damage": lambda stats: effective_damage(stats["strength"], stats["dexterity"]),
+    "dodge_chance": lambda stats: dodge_chance(stats["dexterity"]),
+    "movement_speed": lambda stats: movement_speed(stats["agility"]),
+}
+
+DERIVED_DTYPE = np.dtype([("id", np.int64)] + [(name, np.float64) for name in DERIVED_STATS])
+
+
+def load_stats(queryset=None, chunk_size=10000):
+    """
+    Reads the traits of characters into a structured array with an "id"
+    column and one column per STAT_FIELDS, ordered by id.
+    Rows are streamed from the database, so no model instances are built and
+    memory use is that of the array
+
+    :param queryset QuerySet: Characters to load, all of them by default
+    :param chunk_size Integer: Rows fetched from the database at a time
+    """
+    if queryset is None:
+        queryset = Character.objects.all()
+
+    rows = queryset.order_by("pk").values_list("pk", *STAT_FIELDS).iterator(chunk_size)
+    return np.fromiter(rows, dtype=STATS_DTYPE)
+
+
+def derive_stats(stats):
+    """
+    Evaluates every DERIVED_STATS formula for all the characters in stats.
+    Returns a structured array with an "id" column and one float column per
+    derived stat, in the same order as stats
+
+    :param stats Array: Returned by load_stats
+    """
+    derived = np.empty(len(stats), dtype=DERIVED_DTYPE)
+    derived["id"] = stats["id"]
+    for name, formula in DERIVED_STATS.items():
+        derived[name] = formula(stats)
+    return derived
+
+
+def derive_character_stats(character):
+    """
+    The derived stats of one character as a dictionary
+
+    :param character Character: The character
+    """
+    return {name: formula(vars(character)) for name, formula in DERIVED_STATS.items()}
@@ -0,0 +1,20 @@
+from django import template
+
+from ..images import get_derivative_name
+from ..models import Item
+
+register = template.Library()
+
+
+@register.simple_tag
+def item_image_url(item, size_name, kind="image"):
+    """
+    URL of a resized copy of an item's image, or of the image itself until
+    the copies have been made. Usage:
+
+        {% item_image_url item "card" "webp" %}
+    """
+    name = get_derivative_name(item, size_name, kind)
+    if not name:
+        return ""
+    return Item._meta.get_field("image").storage.url(name)
@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.http import HttpResponse, QueryDict
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import defaultValues, economy, leaderboards, ledger, metrics
+from .atlas import (ATLAS_DIRECTORY, CELL_SIZE, build_item_atlas, get_inventory_atlas,
+                    get_item_atlas)
+from .benchmarks import (check_budgets, load_budgets, measure_metrics_overhead,
+                         run_benchmarks, seed_world)
+from .catalog import ItemImportError, export_items, import_items, read_rows
+from .forms import EditCharacterForm
+from .grid import InvalidPlacement, InventoryGrid, validate_layout
+from .helpers import (CHARACTER_CACHE_KEY, character_cache_stats, filter_items, get_character,
+                      get_inventory_items, get_item_catalog, get_item_page,
+                      get_trait_schema, normalize_item_filters, request_characters,
+                      validate_character_form)
+from .images import (generate_item_derivatives, get_derivative_name, get_item_images_changed,
+                     needs_derivatives)
+from .layout import LayoutEntry, decode_layout, encode_layout, get_inventory_layout
+from .middleware import RequestMetricsMiddleware
+from .models import Character, GoldTransaction, Item, ItemSettings
+from .search import get_search_backend
+from .stats import derive_character_stats, derive_stats, load_stats
+from .utils import GoldReason, ItemRarity, ItemType, Slot
+
+
+def create_items(count, **kwargs):
+    """
+    Creates count items named "Item <n>" with a cost of 10
+    """
+    values = {"description": "A test item", "cost": 10}
+    values.update(kwargs)
+    return [Item.objects.create(name=f"Item {n}", **values) for n in range(count)]
+
+
+def create_character(username="chatter", **kwargs):
+    """
+    Creates a user with a character and returns the character
+    """
+    user = get_user_model().objects.create_user(username, password="password")
+    return Character.objects.create(owner=user, **kwargs)
+
+
+@override_settings(ITEMS_PER_PAGE=5)
+class ItemCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_filters_are_normalized(self):
+        filters = normalize_item_filters(
+            QueryDict("rarity=Rare,common,rare&slot=Main Hand&type=&q= Sword ")
+        )
+
+        self.assertEqual(
+            filters,
+            {"rarity": ("common", "rare"), "slot": ("main_hand",), "q": "sword"},
+        )
+
+    def test_pages_follow_the_cursor(self):
+        items = create_items(12)
+
+        first = get_item_page({})
+        second = get_item_page({}, after=first["next"])
+        last = get_item_page({}, after=second["next"])
+
+        self.assertEqual(first["items"], items[:5])
+        self.assertEqual(second["items"], items[5:10])
+        self.assertEqual(last["items"], items[10:])
+        self.assertIsNone(first["previous"])
+        self.assertIsNone(last["next"])
+
+        previous = get_item_page({}, before=last["previous"])
+        self.assertEqual(previous["items"], items[5:10])
+
+    def test_pages_apply_filters(self):
+        create_items(3, rarity=ItemRarity.COMMON)
+        epic = create_items(2, rarity=ItemRarity.EPIC, slot=Slot.HEAD)
+
+        page = get_item_page(normalize_item_filters(QueryDict("rarity=Epic&slot=Head")))
+
+        self.assertEqual(page["items"], epic)
+
+    def test_pages_are_cached_until_an_item_changes(self):
+        items = create_items(3, item_type=ItemType.WEAPON)
+        get_item_page({})
+
+        with self.assertNumQueries(0):
+            get_item_page({})
+
+        items[0].name = "Renamed"
+        items[0].save()
+
+        with self.assertNumQueries(1):
+            page = get_item_page({})
+        self.assertEqual(page["items"][0].name, "Renamed")
+
+        items[1].delete()
+        self.assertEqual(len(get_item_page({})["items"]), 2)
+
+    def test_view_items_renders_page_links(self):
+        create_items(7)
+
+        response = self.client.get(reverse("view_items"), {"rarity": "Common"})
+
+        self.assertEqual(len(response.context["items"]), 5)
+        self.assertContains(response, "rarity=Common&after=")
+
+
+class ItemSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = get_search_backend()
+
+    def test_name_matches_rank_above_description_matches(self):
+        described = Item.objects.create(
+            name="Plain buckler", description="Forged from a broken sword", cost=1
+        )
+        named = Item.objects.create(
+            name="Broken sword", description="Still sharp", cost=1
+        )
+
+        self.assertEqual(self.backend.search("sword", 10), [named.id, described.id])
+
+    def test_prefix_queries_match_partial_words(self):
+        item = Item.objects.create(name="Flaming axe", description="Hot", cost=1)
+
+        self.assertEqual(self.backend.search("flam", 10), [item.id])
+        self.assertEqual(self.backend.search('"flam* (', 10), [item.id])
+
+    def test_index_follows_item_changes(self):
+        item = Item.objects.create(name="Iron helm", description="Dented", cost=1)
+
+        item.name = "Steel helm"
+        item.save()
+        self.assertEqual(self.backend.search("iron", 10), [])
+        self.assertEqual(self.backend.search("steel", 10), [item.id])
+
+        item.delete()
+        self.assertEqual(self.backend.search("steel", 10), [])
+
+    def test_view_items_uses_ranked_search(self):
+        described = Item.objects.create(
+            name="Oak shield", description="Blocks any spear", cost=1
+        )
+        named = Item.objects.create(name="Spear", description="Pointy", cost=1)
+        Item.objects.create(name="Mace", description="Blunt", cost=1)
+
+        response = self.client.get(reverse("view_items"), {"q": "Spear"})
+
+        self.assertEqual(response.context["items"], [named, described])
+
+    @override_settings(ITEM_SEARCH_MAX_RESULTS=3, ITEMS_PER_PAGE=2)
+    def test_view_items_says_when_search_results_are_cut_off(self):
+        create_items(4, description="A spear")
+
+        response = self.client.get(reverse("view_items"), {"q": "spear"})
+        self.assertContains(response, "Only the best 3 matches are shown")
+
+        last = self.client.get(
+            reverse("view_items"), {"q": "spear", "after": response.context["next_cursor"]}
+        )
+        self.assertEqual(len(last.context["items"]), 1)
+        self.assertIsNone(last.context["next_cursor"])
+
+        response = self.client.get(reverse("view_items"), {"q": "spear 1"})
+        self.assertEqual(len(response.context["items"]), 1)
+        self.assertNotContains(response, "Only the best")
+
+    @override_settings(ITEM_SEARCH_MAX_RESULTS=3)
+    def test_search_filters_apply_before_the_cut_off(self):
+        create_items(4, description="Spear spear spear")
+        epic = Item.objects.create(
+            name="Halberd", description="Not quite a spear", cost=1, rarity="epic"
+        )
+
+        page = get_item_page(normalize_item_filters(QueryDict("q=spear&rarity=epic")))
+
+        self.assertEqual(page["items"], [epic])
+        self.assertFalse(page["truncated"])
+
+    def test_search_cursors_that_are_no_longer_results_give_no_page(self):
+        items = create_items(2, description="A spear")
+        filters = normalize_item_filters(QueryDict("q=spear"))
+        items[0].description = "A sword"
+        items[0].save()
+
+        for cursor in ({"after": items[0].id}, {"before": items[0].id}):
+            page = get_item_page(filters, **cursor)
+            self.assertEqual(page["items"], [])
+            self.assertIsNone(page["next"])
+
+
+class UpdateItemTests(TestCase):
+    def setUp(self):
+        self.character = create_character(inventory_size=12)
+        self.items = create_items(12)
+        for item in self.items:
+            ItemSettings.objects.create(character=self.character, item=item)
+        self.client.login(username="chatter", password="password")
+
+    def post_items(self, item_data):
+        return self.client.post(
+            reverse("update_item"),
+            json.dumps({"item_data": item_data}),
+            content_type="application/json",
+        )
+
+    def payload(self, count):
+        return [
+            {"item_id": item.id, "currentSpaceIndex": n, "lastSpaceIndex": "-1"}
+            for n, item in enumerate(self.items[:count])
+        ]
+
+    def test_updates_every_item(self):
+        response = self.post_items(self.payload(12))
+
+        self.assertEqual(response.json(), {"updated": 12})
+        self.assertEqual(
+            list(
+                ItemSettings.objects.order_by("item_id").values_list(
+                    "currentSpaceIndex", flat=True
+                )
+            ),
+            [str(n) for n in range(12)],
+        )
+
+    def test_query_count_does_not_depend_on_payload_size(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            self.post_items(self.payload(2))
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            self.post_items(self.payload(12))
+
+        self.assertEqual(len(small), len(large))
+
+    def test_unchanged_items_are_not_written(self):
+        self.post_items(self.payload(12))
+
+        response = self.post_items(self.payload(12))
+
+        self.assertEqual(response.json(), {"updated": 0})
+
+    def test_unknown_attributes_are_rejected(self):
+        payload = self.payload(2)
+        payload[1]["character_id"] = 99
+
+        response = self.post_items(payload)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ItemSettings.objects.exclude(currentSpaceIndex="-1").exists())
+
+    def test_overlapping_items_are_rejected(self):
+        self.post_items(self.payload(2))
+
+        response = self.post_items(
+            [{"item_id": self.items[1].id, "currentSpaceIndex": 0}]
+        )
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            ItemSettings.objects.get(item=self.items[1]).currentSpaceIndex, "1"
+        )
+
+    def test_large_items_can_be_stored_next_to_each_other(self):
+        self.items[0].width = self.items[0].height = 2
+        self.items[0].save()
+
+        response = self.post_items(self.payload(2))
+
+        self.assertEqual(response.json(), {"updated": 2})
+
+    def test_malformed_space_indexes_are_rejected(self):
+        response = self.post_items(
+            [{"item_id": self.items[0].id, "currentSpaceIndex": "x"}]
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_swapping_items_is_allowed(self):
+        self.post_items(self.payload(2))
+
+        response = self.post_items(
+            [
+                {"item_id": self.items[0].id, "currentSpaceIndex": 1},
+                {"item_id": self.items[1].id, "currentSpaceIndex": 0},
+            ]
+        )
+
+        self.assertEqual(response.json(), {"updated": 2})
+
+    def test_unknown_items_are_rejected(self):
+        payload = self.payload(2) + [{"item_id": 0, "equipped": True}]
+
+        response = self.post_items(payload)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(ItemSettings.objects.exclude(currentSpaceIndex="-1").exists())
+
+
+class CharacterCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.character = create_character()
+        self.user = self.character.owner
+
+    def tearDown(self):
+        request_characters.__dict__.pop("characters", None)
+
+    def test_characters_are_cached_across_calls(self):
+        get_character(self.user)
+
+        with self.assertNumQueries(0):
+            character = get_character(self.user)
+        self.assertEqual(character, self.character)
+
+    def test_saving_invalidates_the_cache(self):
+        get_character(self.user)
+
+        self.character.gold = 50
+        self.character.save()
+
+        self.assertEqual(get_character(self.user).gold, 50)
+
+        self.character.delete()
+        self.assertEqual(get_character(self.user), {})
+
+    def test_request_memo_returns_independent_copies(self):
+        request_characters.characters = {}
+        hits = character_cache_stats["request_hits"]
+
+        first = get_character(self.user)
+        first.points = 0
+        with self.assertNumQueries(0):
+            second = get_character(self.user)
+
+        self.assertEqual(second.points, self.character.points)
+        self.assertEqual(character_cache_stats["request_hits"], hits + 1)
+
+    def test_stats_are_only_shown_to_staff(self):
+        self.client.login(username="chatter", password="password")
+        response = self.client.get(reverse("character_cache_stats"))
+        self.assertEqual(response.status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("character_cache_stats"))
+        self.assertEqual(
+            set(response.json()), {"pid", "request_hits", "hits", "misses"}
+        )
+
+
+class EconomyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.character = create_character(gold=25)
+        self.item = create_items(1, cost=10)[0]
+
+    def test_buying_takes_gold_and_gives_the_item(self):
+        gold = economy.buy_item(self.character, self.item)
+
+        self.assertEqual(gold, 15)
+        self.assertTrue(self.character.items.filter(item=self.item).exists())
+
+    def test_items_cannot_be_bought_twice(self):
+        economy.buy_item(self.character, self.item)
+
+        with self.assertRaises(economy.AlreadyOwned):
+            economy.buy_item(self.character, self.item)
+        self.assertEqual(get_character(self.character.owner).gold, 15)
+
+    def test_items_cannot_be_bought_without_enough_gold(self):
+        self.item.cost = 26
+        self.item.save()
+
+        with self.assertRaises(economy.InsufficientGold):
+            economy.buy_item(self.character, self.item)
+        self.assertFalse(self.character.items.exists())
+
+    def test_selling_refunds_half_the_cost(self):
+        economy.buy_item(self.character, self.item)
+
+        self.assertEqual(economy.sell_item(self.character, self.item), (5, 20))
+        self.assertFalse(self.character.items.exists())
+
+        with self.assertRaises(economy.NotOwned):
+            economy.sell_item(self.character, self.item)
+
+    def test_buy_item_redirects_back_to_the_shop(self):
+        self.client.login(username="chatter", password="password")
+        next_url = reverse("view_items") + "?rarity=common"
+
+        response = self.client.post(
+            reverse("buy_item"), {"item_id": self.item.id, "next": next_url}
+        )
+
+        self.assertRedirects(response, next_url)
+        self.assertEqual(get_character(self.character.owner).gold, 15)
+
+    def test_trade_api_returns_only_the_change(self):
+        self.client.login(username="chatter", password="password")
+
+        response = self.client.post(
+            reverse("buy_item_api"), {"item_id": self.item.id}
+        )
+        self.assertEqual(
+            response.json(), {"gold": 15, "owned": True, "message": "Bought Item 0"}
+        )
+
+        response = self.client.post(
+            reverse("buy_item_api"), {"item_id": self.item.id}
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.json()["owned"])
+
+        response = self.client.post(
+            reverse("sell_item_api"), {"item_id": self.item.id}
+        )
+        self.assertEqual(
+            response.json(),
+            {"gold": 20, "owned": False, "message": "Sold Item 0 for 5 gold"},
+        )
+
+
+class EconomyConcurrencyTests(TransactionTestCase):
+    """
+    Many threads, each with their own database connection, spend the
+    same character's gold at once
+    """
+
+    THREADS = 8
+
+    def run_concurrently(self, operation, arguments):
+        results = []
+        barrier = threading.Barrier(len(arguments))
+
+        def worker(argument):
+            barrier.wait()
+            try:
+                for _ in range(50):
+                    try:
+                        results.append(operation(argument))
+                        break
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting
+                        time.sleep(0.01)
+            except economy.EconomyError as error:
+                results.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(a,)) for a in arguments]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_gold_is_never_overspent(self):
+        character = create_character(gold=40)
+        items = create_items(self.THREADS, cost=10)
+
+        results = self.run_concurrently(
+            lambda item: economy.buy_item(character, item), items
+        )
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(Character.objects.get().gold, 0)
+        self.assertEqual(ItemSettings.objects.count(), 4)
+        self.assertEqual(
+            sum(isinstance(r, economy.InsufficientGold) for r in results), 4
+        )
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_an_item_is_only_bought_once(self):
+        character = create_character(gold=100)
+        item = create_items(1, cost=10)[0]
+
+        results = self.run_concurrently(
+            lambda _: economy.buy_item(character, item), range(self.THREADS)
+        )
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(Character.objects.get().gold, 90)
+        self.assertEqual(ItemSettings.objects.count(), 1)
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_an_item_is_only_refunded_once(self):
+        character = create_character(gold=0)
+        item = create_items(1, cost=10)[0]
+        ItemSettings.objects.create(character=character, item=item)
+
+        results = self.run_concurrently(
+            lambda _: economy.sell_item(character, item), range(self.THREADS)
+        )
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(Character.objects.get().gold, 5)
+
+    def test_buying_a_deleted_item_is_not_reported_as_owned(self):
+        character = create_character(gold=100)
+        item = create_items(1, cost=10)[0]
+        snapshot = get_item_catalog()[item.id]
+        item.delete()
+
+        with self.assertRaises(IntegrityError):
+            economy.buy_item(character, snapshot)
+        self.assertEqual(Character.objects.get().gold, 100)
+        self.assertFalse(ItemSettings.objects.exists())
+
+
+class GoldLedgerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.character = create_character(gold=25)
+        self.item = create_items(1, cost=10)[0]
+
+    def test_every_change_is_recorded(self):
+        economy.buy_item(self.character, self.item)
+        economy.sell_item(self.character, self.item)
+
+        self.assertEqual(
+            [(t.amount, t.reason, t.reference) for t in ledger.get_history(self.character.pk)],
+            [
+                (5, GoldReason.SALE, "Item 0"),
+                (-10, GoldReason.PURCHASE, "Item 0"),
+                (25, GoldReason.OPENING, ""),
+            ],
+        )
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_failed_purchases_are_not_recorded(self):
+        self.item.cost = 26
+        self.item.save()
+
+        with self.assertRaises(economy.InsufficientGold):
+            economy.buy_item(self.character, self.item)
+        self.assertEqual(self.character.gold_transactions.count(), 1)
+
+    def test_compaction_keeps_balances_and_recent_history(self):
+        for _ in range(3):
+            economy.buy_item(self.character, self.item)
+            economy.sell_item(self.character, self.item)
+        GoldTransaction.objects.update(created=timezone.now() - timedelta(days=100))
+        economy.buy_item(self.character, self.item)
+        create_character("newcomer", gold=7)
+
+        out = StringIO()
+        call_command("compact_gold_ledger", days=90, batch_size=1, stdout=out)
+
+        self.assertIn("Compacted 6 gold ledger entries", out.getvalue())
+        self.assertEqual(
+            [(t.amount, t.reason) for t in ledger.get_history(self.character.pk)],
+            [(-10, GoldReason.PURCHASE), (10, GoldReason.SNAPSHOT)],
+        )
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_character_edits_cannot_change_gold(self):
+        self.client.login(username="chatter", password="password")
+        schema = get_trait_schema()
+        data = dict(zip(schema.fields, schema.values(self.character)))
+        data.update(points=self.character.points - 1, hp=self.character.hp + 1, gold=20)
+
+        self.client.post(reverse("edit_character"), data)
+
+        self.character.refresh_from_db()
+        self.assertEqual((self.character.gold, self.character.hp), (25, data["hp"]))
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_character_edits_do_not_write_back_cached_gold(self):
+        self.client.login(username="chatter", password="password")
+        stale = get_character(self.character.owner)
+        economy.buy_item(self.character, self.item)
+        # As when another request cached the character before the purchase
+        cache.set(CHARACTER_CACHE_KEY.format(self.character.owner_id), stale)
+        schema = get_trait_schema()
+        data = dict(zip(schema.fields, schema.values(stale)))
+        data.update(points=stale.points - 1, hp=stale.hp + 1)
+
+        self.client.post(reverse("edit_character"), data)
+
+        self.character.refresh_from_db()
+        self.assertEqual((self.character.gold, self.character.hp), (15, data["hp"]))
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_admin_gold_changes_are_applied_as_adjustments(self):
+        get_user_model().objects.create_superuser("admin", password="password")
+        self.client.login(username="admin", password="password")
+        data = {
+            field.name: getattr(self.character, field.attname)
+            for field in Character._meta.concrete_fields
+            if not field.primary_key
+        }
+        data.update({
+            "gold": 40,
+            "gold_transactions-TOTAL_FORMS": 0,
+            "gold_transactions-INITIAL_FORMS": 0,
+        })
+
+        response = self.client.post(
+            reverse("admin:MUD_character_change", args=[self.character.pk]), data
+        )
+
+        self.assertRedirects(response, reverse("admin:MUD_character_changelist"))
+        self.assertEqual(Character.objects.get().gold, 40)
+        self.assertEqual(
+            [(t.amount, t.reason, t.reference) for t in ledger.get_history(self.character.pk, 1)],
+            [(15, GoldReason.ADJUSTMENT, "admin")],
+        )
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_reconciliation_reports_balances_that_differ_from_the_ledger(self):
+        others = [create_character(f"chatter{n}", gold=n) for n in range(1, 5)]
+        Character.objects.filter(pk=others[2].pk).update(gold=100)
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("reconcile_gold", batch_size=2, stdout=out)
+
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [f"Character {others[2].pk} has 100 gold but its ledger sums to 3"],
+        )
+
+
+class InventoryGridTests(TestCase):
+    def test_grid_matches_the_inventory_stage(self):
+        grid = InventoryGrid.for_inventory_size(7)
+
+        self.assertEqual(grid.cells, 8)
+        with self.assertRaises(InvalidPlacement):
+            grid.place(7)
+        with self.assertRaises(InvalidPlacement):
+            grid.place(8)
+        grid.place(6)
+
+    def test_every_item_takes_one_cell(self):
+        # inventory_stage.js registers an item in the one space it was
+        # dropped on, whatever its size and whichever way the grid is drawn
+        validate_layout(4, [0, 1, 2, 3])
+
+        with self.assertRaises(InvalidPlacement):
+            validate_layout(4, [0, 1, 2, 4])
+        with self.assertRaises(InvalidPlacement):
+            validate_layout(4, [-2])
+
+    def test_items_cannot_overlap(self):
+        with self.assertRaises(InvalidPlacement):
+            validate_layout(8, [0, 1], occupied=[1])
+
+        validate_layout(8, [0, 2], occupied=[1])
+
+    def test_moves_ignore_the_item_being_moved(self):
+        grid = InventoryGrid.for_inventory_size(8)
+        item = grid.place(0)
+        grid.place(2)
+
+        self.assertTrue(grid.can_move(item, grid.cell(1)))
+        self.assertFalse(grid.can_move(item, grid.cell(2)))
+        grid.move(item, grid.cell(1))
+
+        self.assertTrue(grid.is_free(grid.cell(0)))
+
+
+@override_settings(PACKED_INVENTORY_LAYOUTS=True)
+class InventoryLayoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.character = create_character(gold=100, inventory_size=12)
+        self.items = create_items(3)
+
+    def test_layouts_round_trip(self):
+        entries = [LayoutEntry(1, -1, -1, False), LayoutEntry(2**40, 11, 3, True)]
+
+        self.assertEqual(decode_layout(encode_layout(entries)), entries)
+        self.assertEqual(decode_layout(b""), [])
+
+    def test_layout_follows_purchases_moves_and_sales(self):
+        for item in self.items:
+            economy.buy_item(self.character, item)
+        self.client.login(username="chatter", password="password")
+        self.client.post(
+            reverse("update_item"),
+            json.dumps(
+                {"item_data": [{"item_id": self.items[1].id, "currentSpaceIndex": 5}]}
+            ),
+            content_type="application/json",
+        )
+        economy.sell_item(self.character, self.items[0])
+
+        with self.assertNumQueries(1):
+            layout = get_inventory_layout(self.character.id)
+
+        self.assertEqual(
+            layout,
+            [
+                LayoutEntry(self.items[1].id, 5, -1, False),
+                LayoutEntry(self.items[2].id, -1, -1, False),
+            ],
+        )
+
+    def test_manage_inventory_reads_the_layout(self):
+        economy.buy_item(self.character, self.items[0])
+        self.client.login(username="chatter", password="password")
+
+        response = self.client.get(reverse("manage_inventory"))
+
+        self.assertEqual(response.context["items"][0]["name"], self.items[0].name)
+        self.assertEqual(response.context["items"][0]["currentSpaceIndex"], "-1")
+
+
+class InventoryReadModelTests(TestCase):
+    def setUp(self):
+        self.character = create_character(inventory_size=12)
+
+    def test_inventory_is_read_with_one_query(self):
+        for count in (0, 1, 12):
+            ItemSettings.objects.all().delete()
+            Item.objects.all().delete()
+            for item in create_items(count):
+                ItemSettings.objects.create(character=self.character, item=item)
+            # The item fields come from the catalog snapshot, loaded once
+            get_item_catalog()
+
+            with self.assertNumQueries(1):
+                items = get_inventory_items(self.character.id)
+            self.assertEqual(len(items), count)
+
+    def test_inventory_items_match_what_inventory_js_reads(self):
+        item = create_items(1, width=2, slot=Slot.HEAD)[0]
+        ItemSettings.objects.create(
+            character=self.character, item=item, currentSpaceIndex="3", equipped=True
+        )
+
+        self.assertEqual(
+            get_inventory_items(self.character.id),
+            [
+                {
+                    "item_id": item.pk,
+                    "name": item.name,
+                    "image": "",
+                    "item_type": item.item_type,
+                    "slot": "head",
+                    "width": 2,
+                    "height": 1,
+                    "rarity": item.rarity,
+                    "image_derivatives": {},
+                    "lastSpaceIndex": "-1",
+                    "currentSpaceIndex": "3",
+                    "equipped": True,
+                }
+            ],
+        )
+
+
+class ItemCatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_is_reused_until_an_item_changes(self):
+        items = create_items(2)
+        catalog = get_item_catalog()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_item_catalog(), catalog)
+        self.assertEqual(catalog[items[0].id].name, items[0].name)
+        with self.assertRaises(TypeError):
+            catalog[items[0].id] = None
+
+        items[0].cost = 99
+        items[0].save()
+        self.assertEqual(get_item_catalog()[items[0].id].cost, 99)
+
+        items[1].delete()
+        self.assertNotIn(items[1].id, get_item_catalog())
+
+    def test_lost_version_reloads_the_snapshot(self):
+        item = create_items(1)[0]
+        get_item_catalog()
+
+        # Neither bumps the version, as when the version is evicted
+        Item.objects.filter(pk=item.pk).update(cost=7)
+        cache.clear()
+
+        self.assertEqual(get_item_catalog()[item.id].cost, 7)
+
+    def test_old_snapshot_is_reloaded(self):
+        item = create_items(1)[0]
+        get_item_catalog()
+
+        # As when another process cannot see the version being bumped
+        Item.objects.filter(pk=item.pk).update(cost=7)
+        self.assertEqual(get_item_catalog()[item.id].cost, item.cost)
+
+        with override_settings(ITEM_CATALOG_SNAPSHOT_MAX_AGE=0):
+            self.assertEqual(get_item_catalog()[item.id].cost, 7)
+
+    def test_trades_do_not_query_items(self):
+        item = create_items(1)[0]
+        create_character(gold=20)
+        self.client.login(username="chatter", password="password")
+        get_item_catalog()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("buy_item_api"), {"item_id": item.id})
+            self.client.post(reverse("sell_item_api"), {"item_id": item.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if '"MUD_item"' in query["sql"]])
+        response = self.client.post(reverse("buy_item_api"), {"item_id": "nothing"})
+        self.assertEqual(response.status_code, 404)
+
+
+class BenchmarkTests(TestCase):
+    """
+    Runs the view benchmarks on a small world. Query counts should not
+    depend on the size of the world, so they are held to the same budgets
+    as the benchmark_views command
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_are_within_their_budgets(self):
+        world = seed_world(users=10, items=60)
+
+        results = run_benchmarks(world, iterations=20)
+
+        self.assertEqual(check_budgets(results, load_budgets()), [])
+
+    def test_budgets_catch_regressions(self):
+        results = {"view_items": {"p95_ms": 12.0, "queries": 6}}
+
+        self.assertEqual(
+            check_budgets(results, {"view_items": {"p95_ms": 20, "queries": 5}}),
+            ["view_items queries is 6, over its budget of 5"],
+        )
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.character = create_character()
+        self.user = self.character.owner
+
+    def get_metric(self, line_start):
+        for line in metrics.registry.render().splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(" ", 1)[1])
+        self.fail(f"No metric starting with {line_start}")
+
+    def test_requests_are_recorded_by_view_name(self):
+        self.client.login(username="chatter", password="password")
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse("manage_inventory"))
+        self.client.get(reverse("manage_inventory"))
+        self.client.get("/no/such/page")
+
+        self.assertEqual(
+            self.get_metric('http_request_duration_seconds_count{pid="%d",view="manage_inventory"}' % os.getpid()),
+            2,
+        )
+        self.assertEqual(
+            self.get_metric('http_request_sql_queries_bucket{pid="%d",view="manage_inventory",le="+Inf"}' % os.getpid()),
+            2,
+        )
+        self.assertGreaterEqual(
+            self.get_metric('http_request_sql_queries_sum{pid="%d",view="manage_inventory"}' % os.getpid()),
+            len(context),
+        )
+        self.assertEqual(
+            self.get_metric('http_request_duration_seconds_count{pid="%d",view="<unmatched>"}' % os.getpid()),
+            1,
+        )
+
+    async def test_queries_of_async_views_are_counted(self):
+        async def view(request):
+            await sync_to_async(Item.objects.count)()
+            await sync_to_async(Item.objects.count)()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        await middleware(RequestFactory().get("/"))
+
+        self.assertEqual(
+            self.get_metric('http_request_sql_queries_sum{pid="%d",view="<unmatched>"}' % os.getpid()),
+            2,
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram((1, 5))
+        for value in (0, 1, 3, 7):
+            histogram.observe(value)
+
+        self.assertEqual(
+            list(histogram.render("queries", 'view="x"')),
+            [
+                'queries_bucket{view="x",le="1"} 2',
+                'queries_bucket{view="x",le="5"} 3',
+                'queries_bucket{view="x",le="+Inf"} 4',
+                'queries_sum{view="x"} 11',
+                'queries_count{view="x"} 4',
+            ],
+        )
+
+    def test_metrics_are_only_shown_to_staff(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+
+        # Scraping is off until a token is set
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 401)
+
+        with override_settings(METRICS_SCRAPE_TOKEN="scrape-token"):
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong-token"
+            )
+            self.assertEqual(response.status_code, 401)
+            with self.assertNumQueries(0):
+                response = self.client.get(
+                    reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-token"
+                )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE http_request_duration_seconds histogram", response.content)
+
+        self.client.login(username="chatter", password="password")
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    def test_overhead_is_measured(self):
+        world = seed_world(users=5, items=20)
+
+        result = measure_metrics_overhead(world, iterations=10)
+
+        self.assertEqual(
+            set(result),
+            {"request_ms", "request_without_ms", "query_ms", "query_without_ms"},
+        )
+
+
+class TraitSchemaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.schema = get_trait_schema()
+        self.character = create_character(points=5)
+
+    def edit(self, **changes):
+        data = dict(zip(self.schema.fields, self.schema.values(self.character)))
+        data.update(changes)
+        return data
+
+    def test_schema_matches_the_default_values(self):
+        self.assertEqual(self.schema.names, ("hp", "mp", "agility", "dexterity", "strength"))
+        self.assertEqual(self.schema.fields, ("points",) + self.schema.names)
+        hp = self.schema.by_name["hp"]
+        self.assertEqual(
+            (hp.minimum, hp.maximum, hp.default),
+            (defaultValues.MIN_HP_VALUE, defaultValues.MAX_HP_VALUE, defaultValues.DEFAULT_HP_VALUE),
+        )
+        self.assertEqual(hp.clamp(hp.maximum + 1), hp.maximum)
+        self.assertEqual(hp.clamp(hp.minimum - 1), hp.minimum)
+
+        with self.assertRaises(TypeError):
+            self.schema.by_name["hp"] = hp
+        with self.assertRaises(TypeError):
+            hp.widget_attrs["data-max"] = 0
+
+    def test_points_can_only_be_spent_once(self):
+        old_values = self.schema.values(self.character)
+        hp = self.character.hp
+
+        self.assertTrue(validate_character_form(self.edit(points=3, hp=hp + 2), old_values))
+        self.assertFalse(validate_character_form(self.edit(points=4, hp=hp + 7), old_values))
+        self.assertFalse(validate_character_form(self.edit(points=6), old_values))
+
+    def test_traits_must_stay_within_their_limits(self):
+        strength = self.schema.by_name["strength"]
+        self.character.strength = strength.maximum - 1
+        old_values = self.schema.values(self.character)
+
+        self.assertTrue(
+            validate_character_form(self.edit(points=4, strength=strength.maximum), old_values)
+        )
+        self.assertFalse(
+            validate_character_form(self.edit(points=3, strength=strength.maximum + 1), old_values)
+        )
+
+    def test_only_points_and_traits_can_be_edited(self):
+        self.client.login(username="chatter", password="password")
+
+        self.client.post(
+            reverse("edit_character"),
+            self.edit(points=4, hp=self.character.hp + 1, inventory_size=12),
+        )
+        self.character.refresh_from_db()
+        self.assertEqual(self.character.points, 4)
+        self.assertEqual(self.character.inventory_size, defaultValues.DEFAULT_INVENTORY_SIZE)
+
+    def test_editing_saves_the_spent_points(self):
+        self.client.login(username="chatter", password="password")
+
+        self.client.post(
+            reverse("edit_character"), self.edit(points=4, mp=self.character.mp + 1)
+        )
+        self.character.refresh_from_db()
+        self.assertEqual((self.character.points, self.character.mp), (4, defaultValues.DEFAULT_MP_VALUE + 1))
+
+        self.client.post(
+            reverse("edit_character"), self.edit(points=4, mp=self.character.mp + 5)
+        )
+        self.character.refresh_from_db()
+        self.assertEqual(self.character.mp, defaultValues.DEFAULT_MP_VALUE + 1)
+
+    def test_form_widgets_carry_the_limits(self):
+        attrs = EditCharacterForm().fields["strength"].widget.attrs
+
+        self.assertEqual(attrs["data-min"], defaultValues.MIN_STRENGTH_VALUE)
+        self.assertEqual(attrs["data-max"], defaultValues.MAX_STRENGTH_VALUE)
+
+
+class CharacterStatsTests(TestCase):
+    def setUp(self):
+        self.characters = [
+            create_character(f"fighter{n}", strength=10 + n, dexterity=5 * n, agility=n)
+            for n in range(3)
+        ]
+
+    def test_stats_are_loaded_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = load_stats(chunk_size=2)
+
+        self.assertEqual(list(stats["id"]), [character.pk for character in self.characters])
+        self.assertEqual(list(stats["strength"]), [10, 11, 12])
+        self.assertEqual(len(load_stats(Character.objects.filter(strength__gt=10))), 2)
+
+    def test_vectorized_stats_match_each_character(self):
+        derived = derive_stats(load_stats())
+
+        for row, character in zip(derived, self.characters):
+            self.assertEqual(row["id"], character.pk)
+            for name, value in derive_character_stats(character).items():
+                self.assertAlmostEqual(row[name], value)
+
+    def test_no_characters_give_empty_stats(self):
+        Character.objects.all().delete()
+
+        self.assertEqual(len(derive_stats(load_stats())), 0)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        leaderboards.clear_leaderboards()
+        self.characters = [
+            create_character(f"player{n}", gold=gold)
+            for n, gold in enumerate((50, 90, 50, 10, 70))
+        ]
+
+    def tearDown(self):
+        leaderboards.clear_leaderboards()
+
+    def test_equal_values_share_a_rank(self):
+        page = leaderboards.get_leaderboard_page("gold", 1, page_size=10)
+
+        self.assertEqual(
+            [(entry["rank"], entry["username"], entry["value"]) for entry in page["entries"]],
+            [(1, "player1", 90), (2, "player4", 70), (3, "player0", 50), (3, "player2", 50), (5, "player3", 10)],
+        )
+        self.assertEqual(leaderboards.get_rank("gold", self.characters[2]), (3, 5))
+
+    def test_pages_need_one_query_once_built(self):
+        leaderboards.get_leaderboard("gold")
+
+        with self.assertNumQueries(1):
+            page = leaderboards.get_leaderboard_page("gold", 2, page_size=2)
+        self.assertEqual([entry["value"] for entry in page["entries"]], [50, 50])
+        self.assertEqual(page["pages"], 3)
+
+        self.assertEqual(leaderboards.get_leaderboard_page("gold", 9, page_size=2)["page"], 3)
+
+    def test_snapshots_are_read_through_the_rank_index(self):
+        plan = Character.objects.order_by("-gold", "pk").values_list("pk", "gold").explain()
+
+        self.assertIn("character_gold_rank", plan)
+
+    def test_leaderboard_views(self):
+        self.assertEqual(self.client.get(reverse("leaderboard", args=["owner"])).status_code, 404)
+
+        response = self.client.get(reverse("leaderboard", args=["gold"]), {"page": "x"})
+        self.assertContains(response, "player1")
+
+        self.client.login(username="player4", password="password")
+        response = self.client.get(reverse("leaderboard_rank", args=["gold"]))
+        self.assertEqual(
+            response.json(), {"board": "gold", "rank": 2, "value": 70, "characters": 5}
+        )
+
+
+class LeaderboardRefreshTests(TransactionTestCase):
+    """
+    Snapshots are rebuilt by a background thread with its own connection,
+    so the characters have to be committed
+    """
+
+    def setUp(self):
+        leaderboards.clear_leaderboards()
+        self.characters = [create_character(f"player{n}", gold=10 * n) for n in range(3)]
+
+    def tearDown(self):
+        leaderboards.clear_leaderboards()
+
+    def test_stale_snapshots_are_served_while_rebuilt(self):
+        leaderboards.get_leaderboard("gold")
+        Character.objects.filter(pk=self.characters[0].pk).update(gold=100)
+        self.assertEqual(leaderboards.get_leaderboard("gold").entries(0, 1)[0][2], 20)
+
+        with override_settings(LEADERBOARD_REFRESH_SECONDS=0):
+            stale = leaderboards.get_leaderboard("gold")
+        self.assertEqual(stale.entries(0, 1)[0][2], 20)
+
+        # Released by the background thread once it has rebuilt the snapshot
+        with leaderboards.leaderboard_locks["gold"]:
+            pass
+        self.assertEqual(leaderboards.get_leaderboard("gold").entries(0, 1)[0][2], 100)
+        self.assertEqual(leaderboards.get_leaderboard("gold").rank(10), 3)
+
+
+ITEMS_CSV = """name,description,item_type,slot,rarity,cost,width,height
+Oak shield,Sturdy,shield,off_hand,common,5,2,2
+Iron helm,Dented,armour,head,rare,7,,
+Oak shield,Sturdier,shield,off_hand,epic,6,2,2
+"""
+
+
+class ItemImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_rows_are_upserted_on_name(self):
+        helm = Item.objects.create(name="Iron helm", description="Old", cost=1, width=3)
+
+        created, updated = import_items(read_rows(ITEMS_CSV.splitlines(), "csv"), chunk_size=2)
+
+        # The second Oak shield row updates the item the first chunk created
+        self.assertEqual((created, updated), (1, 2))
+        helm.refresh_from_db()
+        self.assertEqual((helm.description, helm.cost, helm.width), ("Dented", 7, 1))
+        shield = Item.objects.get(name="Oak shield")
+        self.assertEqual((shield.description, shield.rarity), ("Sturdier", "epic"))
+        self.assertEqual(get_search_backend().search("sturdier", 10), [shield.pk])
+
+    def test_updates_leave_columns_the_file_does_not_have(self):
+        shield = Item.objects.create(
+            name="Oak shield", description="Old", cost=1, slot="off_hand", width=2,
+            height=2, image="items/shield.png", image_url="https://example.com/shield.png",
+        )
+
+        rows = read_rows(["name,description,cost,width", "Oak shield,New,4,"], "csv")
+        self.assertEqual(import_items(rows), (0, 1))
+
+        shield.refresh_from_db()
+        self.assertEqual(
+            (shield.description, shield.cost, shield.width, shield.height, shield.slot),
+            ("New", 4, 1, 2, "off_hand"),
+        )
+        self.assertEqual(
+            (shield.image.name, shield.image_url),
+            ("items/shield.png", "https://example.com/shield.png"),
+        )
+
+    def test_imported_images_get_derivatives(self):
+        shield = Item.objects.create(
+            name="Oak shield", description="Old", cost=1, image="items/shield.png",
+            image_derivatives={"source": "items/shield.png"},
+        )
+        rows = [
+            "name,description,cost,image",
+            "Oak shield,New,4,items/oak-shield.png",
+            "Iron helm,Dented,7,items/helm.png",
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            import_items(read_rows(rows, "csv"))
+
+        self.assertIsNotNone(get_item_images_changed())
+        shield.refresh_from_db()
+        self.assertEqual(shield.image_derivatives, {})
+        self.assertTrue(needs_derivatives(shield))
+        self.assertTrue(needs_derivatives(Item.objects.get(name="Iron helm")))
+
+    def test_invalid_rows_import_nothing(self):
+        rows = ITEMS_CSV.replace("rare", "legendaryish").splitlines()
+
+        with self.assertRaisesMessage(ItemImportError, "Row 2 has an invalid rarity"):
+            import_items(read_rows(rows, "csv"))
+        self.assertFalse(Item.objects.exists())
+
+        with self.assertRaisesMessage(ItemImportError, "Row 1 is missing cost"):
+            import_items([{"name": "Free lunch", "description": "Free"}])
+
+    def test_exports_can_be_imported(self):
+        create_items(3, rarity="epic")
+
+        for file_format in ("csv", "jsonl"):
+            exported = list(export_items(file_format=file_format))
+            Item.objects.all().delete()
+            self.assertEqual(import_items(read_rows(exported, file_format)), (3, 0))
+            self.assertEqual(
+                sorted(Item.objects.values_list("name", "rarity", "cost")),
+                [(f"Item {n}", "epic", 10) for n in range(3)],
+            )
+
+    def test_commands_import_and_export_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "items.csv")
+            with open(path, "w") as items_file:
+                items_file.write(ITEMS_CSV)
+
+            output = StringIO()
+            call_command("import_items", path, stdout=output)
+            self.assertIn("Created 2 and updated 0 items", output.getvalue())
+
+            jsonl = os.path.join(directory, "items.jsonl")
+            call_command("export_items", jsonl)
+            with open(jsonl) as exported:
+                self.assertEqual(len(exported.readlines()), 2)
+
+            with self.assertRaises(CommandError):
+                call_command("import_items", os.path.join(directory, "items.txt"))
+
+    def test_admin_imports_and_exports_items(self):
+        get_user_model().objects.create_superuser("admin", password="password")
+        self.client.login(username="admin", password="password")
+
+        response = self.client.post(
+            reverse("admin:MUD_item_import"),
+            {"items_file": SimpleUploadedFile("items.csv", ITEMS_CSV.encode())},
+        )
+        self.assertRedirects(response, reverse("admin:MUD_item_changelist"))
+        self.assertEqual(Item.objects.count(), 2)
+
+        response = self.client.post(
+            reverse("admin:MUD_item_changelist"),
+            {
+                "action": "export_jsonl",
+                "_selected_action": list(Item.objects.values_list("pk", flat=True)),
+            },
+        )
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines], ["Oak shield", "Iron helm"])
+
+    async def test_admin_exports_items_over_asgi(self):
+        await sync_to_async(import_items)(read_rows(ITEMS_CSV.splitlines(), "csv"))
+        await sync_to_async(get_user_model().objects.create_superuser)("admin", password="password")
+        await sync_to_async(self.client.login)(username="admin", password="password")
+        session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf_token = "a" * 64
+        item_ids = await sync_to_async(list)(Item.objects.values_list("pk", flat=True))
+        body = "&".join(
+            ["action=export_csv", f"csrfmiddlewaretoken={csrf_token}"]
+            + [f"_selected_action={pk}" for pk in item_ids]
+        ).encode()
+
+        # The request uvicorn sends to the application in PersonalWebsite.asgi
+        communicator = ApplicationCommunicator(
+            get_asgi_application(),
+            {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "path": reverse("admin:MUD_item_changelist"),
+                "query_string": b"",
+                "headers": [
+                    (b"host", b"testserver"),
+                    (b"content-type", b"application/x-www-form-urlencoded"),
+                    (b"content-length", str(len(body)).encode()),
+                    (
+                        b"cookie",
+                        f"{settings.SESSION_COOKIE_NAME}={session}; "
+                        f"{settings.CSRF_COOKIE_NAME}={csrf_token}".encode(),
+                    ),
+                ],
+                "client": ("127.0.0.1", 1234),
+                "server": ("testserver", 80),
+            },
+        )
+        await communicator.send_input({"type": "http.request", "body": body})
+
+        start = await communicator.receive_output(5)
+        self.assertEqual(start["status"], 200)
+        content = b""
+        while True:
+            message = await communicator.receive_output(5)
+            content += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        rows = list(csv.DictReader(content.decode().splitlines()))
+        self.assertEqual([row["name"] for row in rows], ["Oak shield", "Iron helm"])
+
+
+def image_upload(name="sword.png", size=(600, 300), image_format="PNG", color="red"):
+    output = BytesIO()
+    Image.new("RGBA" if image_format == "PNG" else "RGB", size, color).save(output, image_format)
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+class ItemImageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_uploads_get_resized_webp_copies(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.create(
+                name="Sword", description="Sharp", cost=1, image=image_upload()
+            )
+            # Saving only marks the images as changed, once committed
+            self.assertIsNone(get_item_images_changed())
+        self.assertEqual(item.image_derivatives, {})
+        self.assertIsNotNone(get_item_images_changed())
+
+        call_command("generate_item_images", stdout=StringIO())
+        item.refresh_from_db()
+
+        derivatives = item.image_derivatives
+        self.assertEqual(derivatives["source"], item.image.name)
+        self.assertEqual(derivatives["card"]["webp"], "items/derivatives/sword-card.webp")
+        with default_storage.open(derivatives["thumb"]["webp"]) as thumb:
+            self.assertEqual(Image.open(thumb).size, (150, 75))
+        with default_storage.open(derivatives["card"]["image"]) as card:
+            self.assertEqual(Image.open(card).format, "PNG")
+
+    def test_generation_is_idempotent(self):
+        Item.objects.create(
+            name="Sword", description="Sharp", cost=1, image=image_upload()
+        )
+        output = StringIO()
+
+        call_command("generate_item_images", stdout=output)
+        call_command("generate_item_images", stdout=output)
+
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            [
+                "Made image copies for 1 items, skipped 0",
+                "Packed 1 items into 1 atlases",
+                "Made image copies for 0 items, skipped 1",
+            ],
+        )
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, "items", "derivatives"))),
+            ["sword-card.png", "sword-card.webp", "sword-thumb.png", "sword-thumb.webp"],
+        )
+
+    def test_pages_fall_back_to_the_original_image(self):
+        item = Item.objects.create(
+            name="Sword", description="Sharp", cost=1, image=image_upload()
+        )
+        self.assertEqual(get_derivative_name(item, "card", "webp"), item.image.name)
+        call_command("generate_item_images", stdout=StringIO())
+        item.refresh_from_db()
+        self.assertEqual(get_derivative_name(item, "card", "webp"), "items/derivatives/sword-card.webp")
+
+        item.image = "items/other.png"
+        self.assertEqual(get_derivative_name(item, "card", "webp"), "items/other.png")
+
+        response = self.client.get(reverse("view_items"))
+        self.assertContains(response, 'srcset="/media/items/derivatives/sword-card.webp"')
+
+        create_character()
+        self.client.login(username="chatter", password="password")
+        ItemSettings.objects.create(character=Character.objects.get(), item=item)
+        response = self.client.get(reverse("manage_inventory"))
+        self.assertContains(response, "sword-thumb.webp")
+
+
+class ItemAtlasTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_item(self, name, color, size=(150, 150)):
+        item = Item.objects.create(
+            name=name,
+            description=name,
+            cost=1,
+            image=image_upload(f"{name.lower()}.png", size, color=color),
+        )
+        call_command("generate_item_images", stdout=StringIO())
+        return item
+
+    def atlas_files(self):
+        return sorted(
+            name
+            for name in os.listdir(os.path.join(settings.MEDIA_ROOT, ATLAS_DIRECTORY))
+            if name.endswith(".webp")
+        )
+
+    def test_only_atlases_with_changed_items_are_redrawn(self):
+        items = [self.create_item(f"Item{n}", "red") for n in range(5)]
+        # Four cells per atlas
+        frame_map = build_item_atlas(max_size=2 * CELL_SIZE + 1)
+        self.assertEqual(len(frame_map["atlases"]), 2)
+        self.assertEqual(
+            len({tuple(frame[:3]) for frame in frame_map["frames"].values()}), 5
+        )
+        first, second = frame_map["atlases"]
+
+        items[4].image = image_upload("item4.png", (150, 150), color="green")
+        items[4].save()
+        generate_item_derivatives(items[4])
+        frame_map = build_item_atlas(max_size=2 * CELL_SIZE + 1)
+
+        self.assertEqual(frame_map["atlases"][0], first)
+        self.assertNotEqual(frame_map["atlases"][1], second)
+        inventory_atlas = get_inventory_atlas([items[4].pk])
+        self.assertEqual(len(inventory_atlas["atlases"]), 1)
+        index, x, y, _, _ = inventory_atlas["frames"][str(items[4].pk)]
+        self.assertEqual(index, 0)
+        with default_storage.open(frame_map["atlases"][1]) as atlas_file:
+            atlas = Image.open(atlas_file)
+            atlas.load()
+        self.assertEqual(atlas.getpixel((x, y)), (0, 128, 0, 255))
+
+    def test_frames_are_the_item_images(self):
+        sword = self.create_item("Sword", "red", size=(600, 300))
+        shield = self.create_item("Shield", "blue")
+
+        frame_map = get_item_atlas()
+
+        self.assertEqual(len(frame_map["atlases"]), 1)
+        with default_storage.open(frame_map["atlases"][0]) as atlas_file:
+            atlas = Image.open(atlas_file)
+            atlas.load()
+        for item, color in ((sword, (255, 0, 0, 255)), (shield, (0, 0, 255, 255))):
+            index, x, y, width, height = frame_map["frames"][str(item.pk)]
+            self.assertEqual((index, width, height), (0, 150, 75 if item == sword else 150))
+            self.assertEqual(atlas.getpixel((x, y)), color)
+            self.assertEqual(atlas.getpixel((x + width - 1, y + height - 1)), color)
+
+    def test_inventory_page_gets_the_frames_of_its_items(self):
+        sword = self.create_item("Sword", "red")
+        self.create_item("Shield", "blue")
+        character = create_character()
+        ItemSettings.objects.create(character=character, item=sword)
+        self.client.login(username="chatter", password="password")
+
+        response = self.client.get(reverse("manage_inventory"))
+
+        item_atlas = response.context["item_atlas"]
+        self.assertEqual(list(item_atlas["frames"]), [str(sword.pk)])
+        self.assertEqual(len(item_atlas["atlases"]), 1)
+        self.assertTrue(item_atlas["atlases"][0].startswith(f"/media/{ATLAS_DIRECTORY}/atlas-"))
+        self.assertContains(response, 'id="item_atlas"')
+
+    def test_worker_rebuilds_the_atlas_once_per_batch(self):
+        sword = self.create_item("Sword", "red")
+        self.create_item("Shield", "blue")
+        first = self.atlas_files()
+        previous = get_item_atlas()["atlases"]
+
+        sword.image = image_upload("sword.png", (150, 150), color="green")
+        with self.captureOnCommitCallbacks(execute=True):
+            sword.save()
+        # Saving leaves the atlas to the worker
+        self.assertEqual(self.atlas_files(), first)
+
+        call_command("generate_item_images", stdout=StringIO())
+        frame_map = get_item_atlas()
+        self.assertEqual(len(frame_map["atlases"]), 1)
+        self.assertNotEqual(frame_map["atlases"], previous)
+        # Old atlases are kept for pages rendered before the rebuild
+        self.assertIn(previous[0], frame_map["retired"])
+        self.assertEqual(
+            self.atlas_files(),
+            sorted(first + [os.path.basename(frame_map["atlases"][0])]),
+        )
+
+        output = StringIO()
+        call_command("generate_item_images", stdout=output)
+        self.assertEqual(output.getvalue(), "Made image copies for 0 items, skipped 2\n")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.all().delete()
+        self.assertEqual(len(self.atlas_files()), len(first) + 1)
+
+        output = StringIO()
+        with override_settings(ITEM_ATLAS_GRACE_PERIOD=0):
+            call_command("generate_item_images", stdout=output)
+        self.assertEqual(
+            output.getvalue().splitlines(),
+            ["Made image copies for 0 items, skipped 0", "Packed 0 items into 0 atlases"],
+        )
+        self.assertEqual(self.atlas_files(), [])
+        frame_map = get_item_atlas()
+        self.assertEqual(
+            (frame_map["atlases"], frame_map["frames"], frame_map["retired"]), ([], {}, {})
+        )
+
+        cache.clear()
+        self.assertEqual(get_item_atlas(), frame_map)
+
+
+def sequential_scans(queryset):
+    """
+    Returns the tables the database would read in full to run a queryset,
+    according to EXPLAIN. Scanning an index in order is not counted
+
+    """
+    plan = queryset.explain()
+    if connection.vendor == "postgresql":
+        return re.findall(r"Seq Scan on (\S+)", plan)
+    # SQLite prints "SCAN TABLE x" or "SCAN x", followed by "USING INDEX"
+    # when the scan is over an index
+    return re.findall(r"\bSCAN (?:TABLE )?(\S+)\s*$", plan, re.MULTILINE)
+
+
+def analyze():
+    """
+    Updates the planner's statistics after seeding, as autovacuum would
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot lookups have to use an index once the tables are large.
+    These fail if a change to the models or queries brings back a full
+    table scan
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rarities = ItemRarity.values
+        item_types = ItemType.values
+        slots = Slot.values
+        Item.objects.bulk_create(
+            Item(
+                name=f"Item {n}",
+                description="Seeded",
+                cost=10,
+                rarity=rarities[n % len(rarities)],
+                item_type=item_types[n % len(item_types)],
+                slot=slots[n % len(slots)],
+            )
+            for n in range(5000)
+        )
+        get_user_model().objects.bulk_create(
+            get_user_model()(username=f"player{n}") for n in range(2000)
+        )
+        Character.objects.bulk_create(
+            Character(owner=user) for user in get_user_model().objects.all()
+        )
+        analyze()
+
+    def assertUsesIndexes(self, queryset):
+        self.assertEqual(sequential_scans(queryset), [], queryset.explain())
+
+    def test_full_table_scans_are_caught(self):
+        self.assertEqual(sequential_scans(Item.objects.filter(description="Seeded")), ["MUD_item"])
+
+    def test_item_lookups_use_indexes(self):
+        self.assertUsesIndexes(Item.objects.filter(name="Item 42"))
+        self.assertUsesIndexes(Item.objects.filter(name__in=["Item 1", "Item 2"]))
+
+    def test_catalog_filters_use_indexes(self):
+        for parameter, value in (("rarity", "epic"), ("type", "weapon"), ("slot", "head")):
+            filters = normalize_item_filters(QueryDict(f"{parameter}={value}"))
+            items = filter_items(filters).order_by("id")
+            self.assertUsesIndexes(items[:20])
+            self.assertUsesIndexes(items.filter(id__gt=2500)[:20])
+
+    def test_characters_are_looked_up_by_owner_with_an_index(self):
+        user = get_user_model().objects.get(username="player7")
+
+        self.assertUsesIndexes(Character.objects.filter(owner_id=user.pk))
+
+    def test_each_user_has_one_character(self):
+        user = get_user_model().objects.get(username="player7")
+
+        with self.assertRaises(IntegrityError):
+            Character.objects.create(owner=user)
@@ -9,5 +9,11 @@ urlpatterns = [
     path('view_items', views.view_items, name="view_items"),
     path('buy_item', views.buy_item, name="buy_item"),
     path('sell_item', views.sell_item, name="sell_item"),
+    path('api/buy_item', views.buy_item_api, name="buy_item_api"),
+    path('api/sell_item', views.sell_item_api, name="sell_item_api"),
     path('view_shop', views.view_shop, name="view_shop"),
+    path('character_cache_stats', views.view_character_cache_stats, name="character_cache_stats"),
+    path('metrics', views.view_metrics, name="metrics"),
+    path('leaderboard/<board>', views.view_leaderboard, name="leaderboard"),
+    path('api/leaderboard/<board>/rank', views.leaderboard_rank, name="leaderboard_rank"),
 ]
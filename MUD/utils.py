@@ -18,3 +18,13 @@ class ItemRarity(models.TextChoices):
     UNUSUAL = ("unusual")
     RARE = ("rare")
     EPIC = ("epic")
+
+
+class GoldReason(models.TextChoices):
+    OPENING    = ("opening", "Opening balance")
+    PURCHASE   = ("purchase", "Bought an item")
+    SALE       = ("sale", "Sold an item")
+    BUNDLE     = ("bundle", "Bought a gold bundle")
+    ADJUSTMENT = ("adjustment", "Adjusted by staff")
+    # Stands in for the transactions removed by compact_gold_ledger
+    SNAPSHOT   = ("snapshot", "Balance carried forward")
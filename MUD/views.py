@@ -1,17 +1,33 @@
 import json
+import os
 
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.serializers import serialize
-from django.shortcuts import HttpResponse, redirect, render, reverse, get_object_or_404
-from django.db.models import Q
-
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import HttpResponse, redirect, render, reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
+
+from . import economy, leaderboards, metrics
+from .atlas import get_inventory_atlas
 from .forms import DisplayCharacterForm, EditCharacterForm
-from .helpers import (get_character, get_items_to_display,
+from .grid import InvalidPlacement, validate_layout
+from .layout import get_layout_inventory_items, refresh_inventory_layout
+from .helpers import (character_cache_stats, get_catalog_item, get_character,
+                      get_inventory_items, get_item_catalog, get_item_page,
+                      get_items_to_display, get_trait_schema, normalize_item_filters,
                       validate_character_form)
-from .models import Character, Item, ItemSettings
+from .models import Character, ItemSettings
 from .utils import ItemRarity, ItemType, Slot
 
+# The ItemSettings fields the inventory page is allowed to change
+ITEM_SETTINGS_ATTRIBUTES = ("lastSpaceIndex", "currentSpaceIndex", "equipped")
+SPACE_INDEX_ATTRIBUTES = ("lastSpaceIndex", "currentSpaceIndex")
+
 
 def view_shop(request):
     """
@@ -37,45 +53,38 @@ def view_shop(request):
 
 def view_items(request):
     """
-    Displays all the items available to the user.
-    Filters out items that the user already owns
+    Displays a page of the items available to the user.
+    Pages are keyset paginated with the "after" and "before" GET parameters
 
     """
-    character = get_character(request.user.username)
+    character = get_character(request.user)
     context = {}
-    items = Item.objects.all()
-
-    if request.GET:
-        if 'rarity' in request.GET:
-            rarities = request.GET['rarity']
-            if rarities:
-                rarities = [rarity.lower() for rarity in rarities.split(',')]
-                items = items.filter(rarity__in=rarities)
-
-        if 'type' in request.GET:
-            types = request.GET['type']
-            if types:
-                types = [types.lower() for type in types.split(',')]
-                items = items.filter(item_type__in=types)
-
-        if 'slot' in request.GET:
-            slots = request.GET['slots']
-            if slots:
-                slots = [slot.lower() for slots in slots.split(',')]
-                items = items.filter(slot__in=slots)
-
-        if 'q' in request.GET:
-            query = request.GET['q']
-            if  query:
-                queries = Q(name__icontains=query) | Q(description__icontains=query) | Q(rarity__icontains=query) | Q(item_type__icontains=query)
-                items  = items.filter(queries)
+
+    filters = normalize_item_filters(request.GET)
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+
+    try:
+        after = int(after) if after else None
+        before = int(before) if before else None
+    except ValueError:
+        return redirect(reverse("view_items"))
+
+    page = get_item_page(filters, after=after, before=before)
 
     if character:
-        character_items = character.items.values_list("item__name",flat=True)
-        context["character_items"] = character_items
+        context["character_items"] = set(character.items.values_list("item_id", flat=True))
         context["character_gold"] = character.gold
 
-    context["items"] = items
+    context["items"] = page["items"]
+    context["next_cursor"] = page["next"]
+    context["previous_cursor"] = page["previous"]
+    if page["truncated"]:
+        context["search_max_results"] = settings.ITEM_SEARCH_MAX_RESULTS
+    context["filter_query"] = request.GET.copy()
+    context["filter_query"].pop("after", None)
+    context["filter_query"].pop("before", None)
+    context["filter_query"] = context["filter_query"].urlencode()
 
     context["item_types"] = ItemType.labels
     context["item_slots"] = Slot.labels
@@ -83,6 +92,81 @@ def view_items(request):
 
     return render(request, "Item/index.html", context)
 
+def get_trade(request):
+    """
+    Returns the character of the logged in user and the catalog item whose
+    id is in the POST data, raising Http404 if either does not exist
+
+    """
+    character = get_character(request.user)
+    if not character:
+        raise Http404("No character found")
+
+    item = get_catalog_item(request.POST.get("item_id"))
+    if item is None:
+        raise Http404("No item found")
+    return character, item
+
+
+def attempt_sale(request):
+    """
+    Sells the item whose id is in the POST data for the logged in user.
+    Shared by sell_item and sell_item_api.
+
+    Returns a tuple of (message level, result) where result holds the
+    message and the character's gold and ownership of the item afterwards
+    """
+    character, item = get_trade(request)
+    result = {"gold": character.gold, "owned": False}
+
+    try:
+        refund, result["gold"] = economy.sell_item(character, item)
+    except economy.NotOwned:
+        result["message"] = f"Couldn't sell {item.name}"
+        return messages.WARNING, result
+
+    result["message"] = f"Sold {item.name} for {refund} gold"
+    return messages.SUCCESS, result
+
+
+def attempt_purchase(request):
+    """
+    Buys the item whose id is in the POST data for the logged in user.
+    Shared by buy_item and buy_item_api.
+
+    Returns a tuple of (message level, result) where result holds the
+    message and the character's gold and ownership of the item afterwards
+    """
+    character, item = get_trade(request)
+    result = {"gold": character.gold, "owned": True}
+
+    try:
+        result["gold"] = economy.buy_item(character, item)
+    except economy.AlreadyOwned:
+        result["message"] = f"You already own {item.name}"
+        return messages.INFO, result
+    except economy.InsufficientGold:
+        result["owned"] = False
+        result["message"] = f"Not enough gold to buy {item.name}"
+        return messages.INFO, result
+
+    result["message"] = f"Bought {item.name}"
+    return messages.SUCCESS, result
+
+
+def redirect_to_shop(request):
+    """
+    Post/redirect/get back to the shop page the form was submitted from
+
+    """
+    next_url = request.POST.get("next")
+    if next_url and url_has_allowed_host_and_scheme(
+        next_url, allowed_hosts={request.get_host()}
+    ):
+        return redirect(next_url)
+    return redirect(reverse("view_items"))
+
+
 @login_required
 def sell_item(request):
     """
@@ -92,21 +176,9 @@ def sell_item(request):
     if request.method == "GET":
         return redirect(reverse("view_items"))
 
-    character = get_character(request.user.username)
-    if character:
-        item_name = request.POST["item_name"]
-        if ItemSettings.objects.filter(character=character, item__name=item_name).exists():
-            character_item = ItemSettings.objects.get(character=character, item__name=item_name)
-            item_cost = get_object_or_404(Item,name=item_name).cost
-            refund = round(item_cost/2) if round(item_cost/2) > 0 else 1
-            character_item.delete()
-            character.gold += refund
-            character.save()
-            messages.add_message(request, messages.SUCCESS, f"Sold {item_name} for {refund} gold")
-            return redirect(reverse("view_items"))
-
-    messages.add_message(request, messages.WARNING, f"Couldn't sell {item_name}")
-    return redirect(reverse("view_items"))
+    level, result = attempt_sale(request)
+    messages.add_message(request, level, result["message"])
+    return redirect_to_shop(request)
 
 
 @login_required
@@ -119,42 +191,31 @@ def buy_item(request):
     if request.method == "GET":
         return redirect(reverse("view_items"))
 
-    item_name = request.POST["item_name"]
-    item = get_object_or_404(Item, name=item_name)
-    character = get_object_or_404(Character,owner__username = request.user.username)
-    context = {}
-    items = Item.objects.all()
+    level, result = attempt_purchase(request)
+    messages.add_message(request, level, result["message"])
+    return redirect_to_shop(request)
 
-    context['items'] = items
-    context['character_gold'] = character.gold
 
-    character_items = character.items.values_list("item__name",flat=True)
-    context['character_items'] = character_items
-    if character.gold >= item.cost:
-        obj, created = ItemSettings.objects.get_or_create(
-            character=character, item=item
-        )
+@login_required
+@require_POST
+def sell_item_api(request):
+    """
+    JSON version of sell_item used by shop.js to update the item card in place
 
-        if not created:
-            messages.add_message(
-                request, messages.INFO, f"You already own {item_name}"
-            )
-            return render(request, "Item/index.html", context)
+    """
+    level, result = attempt_sale(request)
+    return JsonResponse(result, status=200 if level == messages.SUCCESS else 409)
 
-        character.gold -= item.cost
-        context['character_gold'] = character.gold
-        character.save()
-    else:
-        messages.add_message(
-            request, messages.INFO, f"Not enough gold to buy {item_name}"
-        )
-        return render(request, "Item/index.html", context)
 
-    character_items = character.items.values_list("item__name",flat=True)
-    context['character_items'] = character_items
+@login_required
+@require_POST
+def buy_item_api(request):
+    """
+    JSON version of buy_item used by shop.js to update the item card in place
 
-    messages.add_message(request, messages.SUCCESS, f"Bought {item_name}")
-    return render(request, "Item/index.html", context)
+    """
+    level, result = attempt_purchase(request)
+    return JsonResponse(result, status=200 if level == messages.SUCCESS else 409)
 
 
 @login_required
@@ -165,7 +226,7 @@ def view_character(request):
 
     can_edit = False
 
-    character = get_character(request.user.username)
+    character = get_character(request.user)
     if not character:
         character = Character(owner=request.user)
         character.save()
@@ -185,13 +246,15 @@ def edit_character(request):
     Allows the user to spend points upgrading their character
 
     """
-    character = get_character(request.user.username)
+    character = get_character(request.user)
     if not character:
         return redirect(reverse("view_character"))
 
     if character.points == 0:
         return redirect(reverse("view_character"))
 
+    # Validating the form updates character, so keep its current values
+    old_values = get_trait_schema().values(character)
     character_form = EditCharacterForm(
         request.POST or None, instance=character
     )
@@ -200,9 +263,12 @@ def edit_character(request):
         if character_form.has_changed():
             if character_form.is_valid():
                 if validate_character_form(
-                    request.POST, request.user.username
+                    character_form.cleaned_data, old_values
                 ):
-                    character_form.save()
+                    # The character may come from the cache, so only the
+                    # edited fields are written, never a stale gold balance
+                    character_form.save(commit=False)
+                    character.save(update_fields=get_trait_schema().fields)
                     if character.points == 0:
                         return redirect(reverse("view_character"))
 
@@ -218,68 +284,186 @@ def manage_inventory(request):
 
     """
 
-    character = get_character(request.user.username)
+    character = get_character(request.user)
     if not character:
         return redirect(reverse("view_character"))
 
-    character_items = list(character.items.all().order_by("item_id"))
-
-    item_ids = [ItemSettings.item_id for ItemSettings in character_items]
-
-    item_data = list(
-        Item.objects.filter(pk__in=item_ids)
-        .order_by("id")
-        .values(
-            "name",
-            "image",
-            "item_type",
-            "slot",
-            "width",
-            "height",
-            "rarity",
-        )
-    )
-
-    for index, item in enumerate(item_data):
-        item["lastSpaceIndex"] = character_items[index].lastSpaceIndex
-        item["currentSpaceIndex"] = character_items[index].currentSpaceIndex
-        item["equipped"] = character_items[index].equipped
+    if settings.PACKED_INVENTORY_LAYOUTS:
+        item_data = get_layout_inventory_items(character.id)
+    else:
+        item_data = get_inventory_items(character.id)
 
     context = {
         "inventory_size": character.inventory_size,
         "items": item_data,
+        "item_atlas": get_inventory_atlas(item["item_id"] for item in item_data),
     }
 
     return render(request, "Character/inventory.html", context)
 
 
+def get_placements(itemsettings):
+    """
+    Yields the space index of each item stored in the inventory grid.
+    Equipped items and items without a location are skipped.
+
+    :param itemsettings Iterable: ItemSettings
+    """
+    for item_settings in itemsettings:
+        if item_settings.equipped or item_settings.currentSpaceIndex == "-1":
+            continue
+        yield int(item_settings.currentSpaceIndex)
+
+
 @login_required
 def update_item(request):
     """
     Expects to recieve a list of dictionaries.
-    The dictionary needs to have one key of "name" that is the item to update.
+    The dictionary needs to have one key of "item_id" that is the item to update.
     The rest of the key,value pairs are presumed to be settings for the item.
+
+    All items are fetched in one query and written with a single bulk_update,
+    so either every change is saved or none are. Changes that would move an
+    item out of the inventory grid or on top of another item are rejected.
+    Responds with the number of item settings that changed.
     """
-    character = get_character(request.user.username)
+    character = get_character(request.user)
     if not character:
         return redirect(reverse("view_character"))
 
     if request.method == "POST":
-        data = json.load(request)["item_data"]
-
-        for item in data:
-            itemsettings = ItemSettings.objects.get(
-                item__name=item["name"], character_id=character.id
+        try:
+            data = json.load(request)["item_data"]
+            updates = {int(item.pop("item_id")): item for item in data}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return HttpResponse(status=400)
+
+        for attributes in updates.values():
+            if not set(attributes) <= set(ITEM_SETTINGS_ATTRIBUTES):
+                return HttpResponse(status=400)
+
+        catalog = get_item_catalog()
+        itemsettings = {
+            item_settings.item_id: item_settings
+            for item_settings in ItemSettings.objects.filter(character_id=character.id)
+            if item_settings.item_id in catalog
+        }
+        if not set(updates) <= set(itemsettings):
+            return HttpResponse(status=404)
+
+        changed = []
+        for item_id, attributes in updates.items():
+            item_settings = itemsettings[item_id]
+            has_changed = False
+            for attribute, value in attributes.items():
+                try:
+                    value = ItemSettings._meta.get_field(attribute).to_python(value)
+                    if attribute in SPACE_INDEX_ATTRIBUTES:
+                        int(value)
+                except (ValidationError, ValueError):
+                    return HttpResponse(status=400)
+                if getattr(item_settings, attribute) != value:
+                    setattr(item_settings, attribute, value)
+                    has_changed = True
+            if has_changed:
+                changed.append(item_settings)
+
+        try:
+            validate_layout(
+                character.inventory_size,
+                get_placements(changed),
+                get_placements(
+                    item_settings
+                    for item_settings in itemsettings.values()
+                    if item_settings not in changed
+                ),
             )
+        except InvalidPlacement:
+            return HttpResponse(status=409)
 
-            if itemsettings:
-                item.pop("name")
-                for attribute, value in item.items():
-                    setattr(itemsettings, attribute, value)
-                itemsettings.save()
-            else:
-                return HttpResponse(status=404)
+        if changed:
+            with transaction.atomic():
+                ItemSettings.objects.bulk_update(changed, ITEM_SETTINGS_ATTRIBUTES)
+                refresh_inventory_layout(character.id)
 
-        return HttpResponse(200)
+        return JsonResponse({"updated": len(changed)})
     else:
         return redirect(reverse("manage_inventory"))
+
+
+@staff_member_required
+def view_character_cache_stats(request):
+    """
+    Reports how get_character lookups have been answered by this worker
+    process since it started
+
+    """
+    return JsonResponse({"pid": os.getpid(), **character_cache_stats})
+
+
+def view_metrics(request):
+    """
+    Reports the request metrics of this worker process in the Prometheus
+    text format. Staff can open it in the browser, scrapers send
+    settings.METRICS_SCRAPE_TOKEN as a bearer token
+
+    """
+    if not metrics.is_staff_request(request):
+        response = HttpResponse(status=401)
+        response["WWW-Authenticate"] = 'Bearer realm="metrics"'
+        return response
+
+    return HttpResponse(
+        metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def view_leaderboard(request, board):
+    """
+    Displays a page of the characters ranked by gold or one of their traits,
+    and the rank of the user's character
+
+    """
+    if board not in leaderboards.LEADERBOARD_FIELDS:
+        raise Http404("No such leaderboard")
+
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+
+    context = leaderboards.get_leaderboard_page(board, page)
+    context["board"] = board
+    context["boards"] = leaderboards.LEADERBOARD_FIELDS
+
+    character = get_character(request.user)
+    if character:
+        context["character_rank"], context["characters"] = leaderboards.get_rank(
+            board, character
+        )
+
+    return render(request, "Leaderboard/index.html", context)
+
+
+@login_required
+def leaderboard_rank(request, board):
+    """
+    Returns the rank of the user's character on a leaderboard as JSON
+
+    """
+    if board not in leaderboards.LEADERBOARD_FIELDS:
+        raise Http404("No such leaderboard")
+
+    character = get_character(request.user)
+    if not character:
+        return JsonResponse({"error": "You do not have a character"}, status=404)
+
+    rank, characters = leaderboards.get_rank(board, character)
+    return JsonResponse(
+        {
+            "board": board,
+            "rank": rank,
+            "value": getattr(character, board),
+            "characters": characters,
+        }
+    )
@@ -3,6 +3,14 @@ ASGI config for PersonalWebsite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the entry point used in production, so that async views such as the
+homepage and checkout can wait on GitHub and Stripe without holding a worker:
+
+    uvicorn PersonalWebsite.asgi:application --host 0.0.0.0 --port $PORT
+
+Sync views keep working and are run in a thread pool. The WSGI application in
+wsgi.py still works, but runs async views one request per worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
@@ -14,3 +22,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PersonalWebsite.settings')
 
 application = get_asgi_application()
+
+# Imported once the apps are loaded
+from MUD.helpers import preload_item_catalog  # noqa: E402
+
+preload_item_catalog()
@@ -0,0 +1,20 @@
+"""
+HTTP client setup shared by the apps that call external APIs.
+"""
+import ssl
+
+import certifi
+import httpx
+
+# Building an SSL context loads the CA bundle, which blocks the event loop for
+# tens of milliseconds, so every client shares this one
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+
+def async_client(**kwargs):
+    """
+    Returns an httpx.AsyncClient verifying certificates with SSL_CONTEXT
+
+    :param kwargs: Passed on to httpx.AsyncClient
+    """
+    return httpx.AsyncClient(verify=SSL_CONTEXT, **kwargs)
@@ -72,11 +72,13 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 MIDDLEWARE = [
+    "MUD.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "MUD.middleware.CharacterCacheMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -131,6 +133,31 @@ else:
         "default": dj_database_url.parse(os.environ.get("DATABASE_URL",""))
     }
 
+# Characters, the item catalog version and the item atlas are invalidated
+# through the cache, so every process (each web worker and the payment and
+# image workers) must share it. They are read on most requests, so it must
+# also be fast: a database cache would turn every hit into a query. Outside
+# development it is the Redis server in REDIS_URL (e.g. Heroku Redis).
+# Development runs one process and keeps the per process LocMemCache
+if development:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+else:
+    REDIS_URL = os.environ.get("REDIS_URL", "")
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {},
+        }
+    }
+    if REDIS_URL.startswith("rediss://"):
+        # Heroku Redis serves TLS with a self-signed certificate
+        CACHES["default"]["OPTIONS"]["CONNECTION_POOL_KWARGS"] = {"ssl_cert_reqs": None}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -170,11 +197,21 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 STATIC_URL = "/static/"
 STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"),)
+STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+
+# Content hashed names and gzip/brotli copies, made by collectstatic.
+# Development serves the static directories as they are
+if not development:
+    STATICFILES_STORAGE = "PersonalWebsite.staticfiles.CompressedManifestStaticFilesStorage"
+
+# Threads collectstatic uploads static files to S3 with
+STATICFILES_UPLOAD_WORKERS = 8
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 if 'USE_AWS' in os.environ:
+    # Media only. StaticStorage sets the cache headers of each static file
     AWS_S3_OBJECT_PARAMETERS = {
             'Expires': 'Thu, 31 Dec 2099 20:00:00 GMT',
             'CacheControl': 'max-age=96408000',
@@ -202,12 +239,49 @@ if 'USE_AWS' in os.environ:
 STRIPE_CURRENCY = 'gbp'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY','')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY','')
+STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET','')
+STRIPE_API_BASE = 'https://api.stripe.com'
+STRIPE_TIMEOUT = 10
+
+# Bearer token Prometheus sends to scrape /MUD/metrics. Scraping is off
+# while it is empty; staff can still open the page when logged in
+METRICS_SCRAPE_TOKEN = os.getenv('METRICS_SCRAPE_TOKEN','')
 
 
 
 
 FILE_UPLOAD_PERMISSIONS = 0o644
 
+# Repos shown on the homepage. They are served from the cache and refreshed
+# in the background once older than GITHUB_REPOS_TTL seconds
+GITHUB_REPOS_URL = "https://api.github.com/users/Arb-aya/repos"
+GITHUB_REPOS_TTL = 600
+GITHUB_TIMEOUT = 3
+
+ITEMS_PER_PAGE = 24
+# Cached catalog pages are invalidated when an item changes. The timeout bounds
+# staleness for caches that are not shared between workers (e.g. LocMemCache)
+ITEM_CATALOG_CACHE_TIMEOUT = 300
+# Each worker's in memory item catalog is reloaded when the catalog version
+# changes, and at least this often in case the cache loses a change
+ITEM_CATALOG_SNAPSHOT_MAX_AGE = 300
+CHARACTER_CACHE_TIMEOUT = 300
+# Workers reread the item atlas frame map this often. Atlases dropped from
+# the map are kept for ITEM_ATLAS_GRACE_PERIOD seconds, which must be longer,
+# so pages rendered with an older map can still load them
+ITEM_ATLAS_CACHE_TIMEOUT = 300
+ITEM_ATLAS_GRACE_PERIOD = 86400
+# Also store each character's inventory layout packed into one row. Run the
+# rebuild_inventory_layouts command before turning this on
+PACKED_INVENTORY_LAYOUTS = False
+# Upper bound on ranked results returned by the item search index. The shop
+# tells users when a search matched more items than this
+ITEM_SEARCH_MAX_RESULTS = 500
+
+LEADERBOARD_PAGE_SIZE = 50
+# Each worker rebuilds its leaderboard snapshots once they are this old
+LEADERBOARD_REFRESH_SECONDS = 60
+
 INITIAL_CHARACTER_POINTS = 10
 
 MIN_INVENTORY_SIZE = 4
@@ -0,0 +1,177 @@
+"""
+Static file storage for collectstatic.
+
+Every static file is stored under a name with a hash of its content (see
+django.contrib.staticfiles.storage.ManifestFilesMixin), so it can be cached
+by browsers for good, and compressible files get a gzip (.gz) and a brotli
+(.br) copy next to them. serve_static in PersonalWebsite.views sends the
+smallest copy the browser accepts when the site serves its own static files.
+
+On S3 (custom_storages.StaticStorage) an upload manifest records a hash of
+every file in the bucket, so files that did not change since the last
+collectstatic are not uploaded again, and the rest are uploaded a few at a
+time from a thread pool.
+"""
+import gzip
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import brotli
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+# Files worth compressing. Images and fonts are compressed already
+COMPRESSED_EXTENSIONS = (".js", ".css", ".svg", ".map", ".txt", ".html", ".xml")
+
+# Smaller files gain nothing from compression
+MIN_COMPRESS_SIZE = 256
+
+# Content-Encoding of each compressed copy and the suffix of its name, most
+# preferred first
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# ManifestFilesMixin puts the first 12 hex digits of an MD5 before the extension
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}(\.[^./]+)*$")
+
+HASHED_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UNHASHED_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+def is_hashed_name(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 so the same file always compresses to the same bytes
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedFilesMixin:
+    """
+    Saves a gzip and a brotli copy next to every compressible file, unless
+    the copy would not be smaller
+    """
+
+    def _save(self, name, content):
+        content.seek(0)
+        data = content.read()
+        name = super()._save(name, ContentFile(data))
+
+        if name.endswith(COMPRESSED_EXTENSIONS) and len(data) >= MIN_COMPRESS_SIZE:
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                super()._save(name + suffix, ContentFile(compressed))
+        return name
+
+
+class UploadManifestMixin:
+    """
+    Keeps a manifest of the SHA-256 of every file collectstatic stored and
+    skips saving files whose content has not changed. Files are saved from a
+    thread pool of settings.STATICFILES_UPLOAD_WORKERS threads.
+
+    collectstatic deletes a file before copying it again, so deletes wait
+    until the end of post_process and are dropped for files that were
+    copied again with the same content.
+    """
+
+    upload_manifest_name = "staticfiles-uploads.json"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._uploaded = None
+        self._pending_deletes = set()
+        self._uploads = []
+        self._executor = None
+
+    @property
+    def uploaded(self):
+        if self._uploaded is None:
+            try:
+                with self.open(self.upload_manifest_name) as manifest:
+                    self._uploaded = json.loads(manifest.read().decode())
+            except FileNotFoundError:
+                self._uploaded = {}
+        return self._uploaded
+
+    def _save(self, name, content):
+        content.seek(0)
+        data = content.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        replacing = name in self._pending_deletes
+        self._pending_deletes.discard(name)
+        if self.uploaded.get(name) == digest:
+            return name
+        if replacing:
+            super().delete(name)
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(settings.STATICFILES_UPLOAD_WORKERS)
+        self._uploads.append(self._executor.submit(super()._save, name, ContentFile(data)))
+        self.uploaded[name] = digest
+        return name
+
+    def delete(self, name):
+        if name in self.uploaded:
+            self._pending_deletes.add(name)
+        else:
+            super().delete(name)
+
+    def exists(self, name):
+        if name in self._pending_deletes:
+            return False
+        return name in self.uploaded or super().exists(name)
+
+    def get_modified_time(self, name):
+        if name in self.uploaded and name not in self._pending_deletes:
+            # Older than any source file, so collectstatic copies it again
+            # and _save decides from its content whether to upload it
+            epoch = datetime.fromtimestamp(0, timezone.utc)
+            return epoch if settings.USE_TZ else epoch.replace(tzinfo=None)
+        return super().get_modified_time(name)
+
+    def wait_for_uploads(self):
+        """
+        Waits for every file being saved, raising the first error
+
+        """
+        uploads, self._uploads = self._uploads, []
+        for upload in uploads:
+            upload.result()
+
+    def post_process(self, *args, **kwargs):
+        # Post processing reads back the files collectstatic copied
+        self.wait_for_uploads()
+        yield from super().post_process(*args, **kwargs)
+        self.wait_for_uploads()
+
+        if kwargs.get("dry_run"):
+            return
+        for name in self._pending_deletes:
+            super().delete(name)
+            del self.uploaded[name]
+        self._pending_deletes.clear()
+
+        if super().exists(self.upload_manifest_name):
+            super().delete(self.upload_manifest_name)
+        super()._save(
+            self.upload_manifest_name,
+            ContentFile(json.dumps(self.uploaded, sort_keys=True).encode()),
+        )
+
+
+class CompressedManifestStaticFilesStorage(CompressedFilesMixin, ManifestStaticFilesStorage):
+    """
+    Hashed and compressed static files in settings.STATIC_ROOT
+    """
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+import tempfile
+
+import brotli
+from django.contrib.staticfiles.storage import (ManifestFilesMixin, StaticFilesStorage,
+                                               staticfiles_storage)
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from .staticfiles import CompressedFilesMixin, UploadManifestMixin, is_hashed_name
+
+SCRIPT = "function greet() { return 'hello'; }\n" * 50
+
+
+class RecordingStorage(StaticFilesStorage):
+    saved = []
+
+    def _save(self, name, content):
+        RecordingStorage.saved.append(name)
+        return super()._save(name, content)
+
+
+class UploadingStorage(CompressedFilesMixin, UploadManifestMixin, ManifestFilesMixin, RecordingStorage):
+    """
+    custom_storages.StaticStorage with the file system in place of S3
+    """
+
+
+class StaticFilesTests(SimpleTestCase):
+    storage = "PersonalWebsite.staticfiles.CompressedManifestStaticFilesStorage"
+
+    def setUp(self):
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.source, self.static_root = source.name, static_root.name
+
+        self.write("js/app.js", SCRIPT)
+        self.write("css/site.css", 'body { background: url("../img/tiny.css"); }')
+        self.write("img/tiny.css", "p {}")
+
+        settings_override = override_settings(
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+            STATICFILES_STORAGE=self.storage,
+            STATIC_ROOT=self.static_root,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, content):
+        path = os.path.join(self.source, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as source_file:
+            source_file.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.static_root, name), "rb") as collected:
+            return collected.read()
+
+    def collectstatic(self):
+        call_command("collectstatic", interactive=False, verbosity=0)
+        return json.loads(self.read("staticfiles.json"))["paths"]
+
+    def test_collected_files_are_hashed_and_compressed(self):
+        paths = self.collectstatic()
+
+        script = paths["js/app.js"]
+        self.assertTrue(is_hashed_name(script))
+        self.assertFalse(is_hashed_name("js/app.js"))
+        self.assertEqual(staticfiles_storage.url("js/app.js"), f"/static/{script}")
+        self.assertEqual(self.read(script), SCRIPT.encode())
+        self.assertEqual(gzip.decompress(self.read(f"{script}.gz")), SCRIPT.encode())
+        self.assertEqual(brotli.decompress(self.read(f"{script}.br")), SCRIPT.encode())
+
+        self.assertIn(paths["img/tiny.css"], self.read(paths["css/site.css"]).decode())
+        # Too small to be worth compressing
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, f"{paths['img/tiny.css']}.gz")))
+
+    def test_best_accepted_encoding_is_served(self):
+        script = self.collectstatic()["js/app.js"]
+        url = f"/static/{script}"
+
+        for accept_encoding, encoding in (
+            ("gzip, deflate, br", "br"),
+            ("gzip, br;q=0", "gzip"),
+            ("identity", None),
+        ):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept_encoding)
+            body = b"".join(response.streaming_content)
+            self.assertEqual(response.get("Content-Encoding"), encoding)
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertEqual(response["Content-Type"], "text/javascript")
+            self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+            if encoding == "br":
+                body = brotli.decompress(body)
+            elif encoding == "gzip":
+                body = gzip.decompress(body)
+            self.assertEqual(body, SCRIPT.encode())
+
+        response = self.client.get("/static/js/app.js", HTTP_ACCEPT_ENCODING="br")
+        self.assertEqual(response["Cache-Control"], "public, max-age=0, must-revalidate")
+        self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/static/js/missing.js").status_code, 404)
+
+    @override_settings(STATICFILES_STORAGE="PersonalWebsite.tests.UploadingStorage")
+    def test_unchanged_files_are_not_uploaded_again(self):
+        RecordingStorage.saved = []
+        paths = self.collectstatic()
+        self.assertIn(f"{paths['js/app.js']}.br", RecordingStorage.saved)
+
+        RecordingStorage.saved = []
+        self.assertEqual(self.collectstatic(), paths)
+        self.assertEqual(RecordingStorage.saved, ["staticfiles-uploads.json"])
+
+        self.write("js/app.js", SCRIPT * 2)
+        RecordingStorage.saved = []
+        changed = self.collectstatic()["js/app.js"]
+
+        self.assertNotEqual(changed, paths["js/app.js"])
+        self.assertEqual(
+            sorted(RecordingStorage.saved),
+            sorted([
+                "js/app.js", "js/app.js.br", "js/app.js.gz",
+                changed, f"{changed}.br", f"{changed}.gz",
+                "staticfiles.json", "staticfiles-uploads.json",
+            ]),
+        )
+        self.assertEqual(gzip.decompress(self.read(f"{changed}.gz")), (SCRIPT * 2).encode())
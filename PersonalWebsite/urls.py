@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 from PersonalWebsite import settings
+from PersonalWebsite.views import serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,3 +26,9 @@ urlpatterns = [
     path('MUD/', include('MUD.urls')),
     path('checkout/', include('checkout.urls')),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+# Without S3 the site serves its own collected static files
+if settings.STATIC_URL.startswith("/"):
+    urlpatterns.append(
+        path(f"{settings.STATIC_URL.strip('/')}/<path:path>", serve_static, name="static")
+    )
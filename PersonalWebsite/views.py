@@ -0,0 +1,81 @@
+import mimetypes
+import posixpath
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.views import serve as serve_finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .staticfiles import ENCODINGS, HASHED_CACHE_CONTROL, UNHASHED_CACHE_CONTROL, is_hashed_name
+
+
+def accepted_encodings(header):
+    """
+    Returns the content codings an Accept-Encoding header allows
+
+    :param header String: Value of the header
+    """
+    accepted = set()
+    for coding in header.split(","):
+        name, _, parameters = coding.strip().partition(";")
+        quality = parameters.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def serve_static(request, path):
+    """
+    Serves a file collected into settings.STATIC_ROOT, sending its brotli or
+    gzip copy when the browser accepts it. Files with a content hash in
+    their name are cached for a year.
+    While DEBUG is on, files that were not collected are served from the
+    static directories as runserver does
+
+    """
+    path = posixpath.normpath(path).lstrip("/")
+    try:
+        fullpath = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404("Not found")
+    if not fullpath.is_file():
+        if settings.DEBUG:
+            return serve_finders(request, path)
+        raise Http404("Not found")
+
+    # A copy asked for by name, e.g. app.js.gz, keeps its own encoding
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    for name, suffix in ENCODINGS if encoding is None else ():
+        compressed = fullpath.with_name(fullpath.name + suffix)
+        if name in accepted and compressed.is_file():
+            fullpath, encoding = compressed, name
+            break
+
+    statobj = fullpath.stat()
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"), statobj.st_mtime, statobj.st_size
+    ):
+        return HttpResponseNotModified()
+
+    response = FileResponse(
+        fullpath.open("rb"), content_type=content_type or "application/octet-stream"
+    )
+    response["Last-Modified"] = http_date(statobj.st_mtime)
+    response["Vary"] = "Accept-Encoding"
+    response["Cache-Control"] = (
+        HASHED_CACHE_CONTROL if is_hashed_name(path) else UNHASHED_CACHE_CONTROL
+    )
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return response
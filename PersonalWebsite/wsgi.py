@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PersonalWebsite.settings')
 
 application = get_wsgi_application()
+
+# Imported once the apps are loaded
+from MUD.helpers import preload_item_catalog  # noqa: E402
+
+preload_item_catalog()
@@ -1,13 +1,23 @@
 from django.contrib import admin
 
-from .models import Order
+from .models import Order, PaymentEvent
 # Register your models here.
 
 class OrderAdmin(admin.ModelAdmin):
-    readonly_fields = ('order_number','date','total')
+    readonly_fields = ('order_number','date','total','stripe_pid','gold','credited')
 
-    list_display = ('order_number','date','total')
+    list_display = ('order_number','date','total','gold','credited')
 
     ordering = ('-date',)
 
 admin.site.register(Order, OrderAdmin)
+
+
+class PaymentEventAdmin(admin.ModelAdmin):
+    readonly_fields = ('event_id','event_type','payment_intent','received','processed')
+
+    list_display = ('event_id','event_type','payment_intent','received','processed')
+
+    ordering = ('-received',)
+
+admin.site.register(PaymentEvent, PaymentEventAdmin)
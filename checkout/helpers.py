@@ -0,0 +1,202 @@
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from PersonalWebsite.http import async_client
+
+from .forms import OrderForm
+from .models import Order
+
+# Session keys for the PaymentIntents created for the current purchase and
+# the number of purchases completed in the session
+PAYMENT_INTENTS_SESSION_KEY = "payment_intents"
+PURCHASES_SESSION_KEY = "purchases"
+
+# Gold credited for each bundle sold in the shop
+BUNDLE_GOLD = {
+    "large": 100,
+    "medium": 30,
+    "small": 10,
+}
+
+ORDER_FIELDS = (
+    "full_name",
+    "email",
+    "phone_number",
+    "country",
+    "postcode",
+    "town_or_city",
+    "street_address1",
+    "street_address2",
+    "county",
+)
+
+
+async def stripe_post(path, data, idempotency_key):
+    """
+    Sends a request to the Stripe API without blocking the event loop.
+    Talks to the API directly because the stripe library is sync only.
+    Returns the response as a dict
+
+    :param path String: API path, e.g. /v1/payment_intents
+    :param data Dict: Form parameters
+    :param idempotency_key String: Stripe replays the original response for
+        repeated requests with the same key instead of acting twice
+    :raises httpx.HTTPError: If Stripe cannot be reached or rejects the request
+    """
+    async with async_client(
+        base_url=settings.STRIPE_API_BASE,
+        auth=(settings.STRIPE_SECRET_KEY, ""),
+        timeout=settings.STRIPE_TIMEOUT,
+    ) as client:
+        response = await client.post(
+            path, data=data, headers={"Idempotency-Key": idempotency_key}
+        )
+    response.raise_for_status()
+    return response.json()
+
+
+async def create_payment_intent(amount, currency, idempotency_key):
+    """
+    Creates a Stripe PaymentIntent and returns it as a dict
+
+    :param amount Integer: Amount to charge in the currency's smallest unit
+    :param currency String: Three letter ISO currency code
+    :param idempotency_key String: See stripe_post
+    """
+    return await stripe_post(
+        "/v1/payment_intents",
+        {"amount": amount, "currency": currency},
+        idempotency_key,
+    )
+
+
+async def update_payment_intent(intent_id, amount, idempotency_key):
+    """
+    Changes the amount of an existing PaymentIntent and returns it as a dict
+
+    :param intent_id String: Id of the PaymentIntent
+    :param amount Integer: Amount to charge in the currency's smallest unit
+    :param idempotency_key String: See stripe_post
+    """
+    return await stripe_post(
+        f"/v1/payment_intents/{intent_id}", {"amount": amount}, idempotency_key
+    )
+
+
+def get_stored_payment_intent(request, bundle_name):
+    """
+    Returns a tuple of the PaymentIntent stored in the session for
+    bundle_name, None if there is not one yet, and an id for the purchase
+    used to build idempotency keys.
+
+    The id only depends on the session, so concurrent renders of the same
+    checkout agree on it and Stripe creates a single intent for them
+
+    """
+    session_key = request.session.session_key or uuid.uuid4().hex
+    purchase_id = f"{session_key}-{request.session.get(PURCHASES_SESSION_KEY, 0)}"
+    intents = request.session.get(PAYMENT_INTENTS_SESSION_KEY, {})
+    return intents.get(bundle_name), purchase_id
+
+
+def store_payment_intent(request, bundle_name, intent):
+    intents = request.session.get(PAYMENT_INTENTS_SESSION_KEY, {})
+    intents[bundle_name] = {
+        "id": intent["id"],
+        "amount": intent["amount"],
+        "client_secret": intent["client_secret"],
+    }
+    request.session[PAYMENT_INTENTS_SESSION_KEY] = intents
+
+
+def forget_payment_intents(request):
+    """
+    Called once a purchase is complete, so the next one gets new intents
+
+    """
+    request.session.pop(PAYMENT_INTENTS_SESSION_KEY, None)
+    request.session[PURCHASES_SESSION_KEY] = request.session.get(PURCHASES_SESSION_KEY, 0) + 1
+
+
+async def get_payment_intent(request, bundle_name, amount):
+    """
+    Returns the PaymentIntent for a bundle as a dict of id, amount and
+    client_secret.
+
+    Each bundle's intent is created once per purchase and kept in the
+    session, so rendering the checkout again does not call Stripe unless the
+    amount has changed, in which case the intent is updated.
+
+    :param request HttpRequest: The checkout request
+    :param bundle_name String: Name of the bundle being bought
+    :param amount Integer: Amount to charge in the currency's smallest unit
+    """
+    intent, purchase_id = await sync_to_async(get_stored_payment_intent)(
+        request, bundle_name
+    )
+    if intent and intent["amount"] == amount:
+        return intent
+
+    if intent:
+        intent = await update_payment_intent(
+            intent["id"], amount, f"{intent['id']}-{amount}"
+        )
+    else:
+        intent = await create_payment_intent(
+            amount, settings.STRIPE_CURRENCY, f"{purchase_id}-{bundle_name}"
+        )
+
+    await sync_to_async(store_payment_intent)(request, bundle_name, intent)
+    return intent
+
+
+def get_bundle(request):
+    """
+    Returns the name and price of the bundle chosen in the shop
+
+    """
+    return (
+        request.session.get("bundle_name", {}),
+        request.session.get("bundle_price", {}),
+    )
+
+
+def place_order(request, bundle_name):
+    """
+    Saves the order in request.POST. The bundle's gold is credited by the
+    process_payment_events command once Stripe confirms the payment.
+    Placing the order for a payment again returns the order already placed.
+    Returns a tuple of the order, None if the form was invalid, and the form
+
+    :param request HttpRequest: POST request from the checkout page
+    :param bundle_name String: Name of the bundle being bought
+    """
+    form_data = {field: request.POST[field] for field in ORDER_FIELDS}
+    form_data["user"] = request.user
+
+    order_form = OrderForm(form_data)
+    intent = request.session.get(PAYMENT_INTENTS_SESSION_KEY, {}).get(bundle_name)
+    if not intent:
+        order_form.add_error(None, "Your payment could not be found")
+    if not order_form.is_valid():
+        return None, order_form
+
+    order = order_form.save(commit=False)
+    order.user_id = request.user.id
+    order.total = request.POST["total"]
+    order.stripe_pid = intent["id"]
+    order.gold = BUNDLE_GOLD.get(bundle_name, 0)
+    try:
+        with transaction.atomic():
+            order.save()
+    except IntegrityError:
+        # The form was submitted again for a payment that already has its
+        # order, e.g. a double click or a retried request
+        order = Order.objects.filter(stripe_pid=intent["id"], user_id=request.user.id).first()
+        if order is None:
+            raise
+
+    return order, order_form
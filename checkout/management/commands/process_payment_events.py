@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.settlement import settle_payment_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Credits gold for the payment events queued by the Stripe webhook. "
+        "Run with --forever as a worker process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Keep polling for new events instead of exiting once the queue is empty",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2,
+            help="Seconds to wait between polls when the queue is empty",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = settle_payment_events(options["batch_size"])
+            total += processed
+            if processed:
+                continue
+            if not options["forever"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(f"Processed {total} payment events")
@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('event_type', models.CharField(max_length=100)),
+                ('payment_intent', models.CharField(db_index=True, max_length=254)),
+                ('received', models.DateTimeField(auto_now_add=True)),
+                ('processed', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        # Orders placed before the webhook existed were credited during
+        # checkout, so existing rows are marked as credited
+        migrations.AddField(
+            model_name='order',
+            name='credited',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='credited',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='gold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=254),
+        ),
+    ]
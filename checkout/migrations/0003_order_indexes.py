@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-17 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0002_order_settlement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(editable=False, max_length=32, unique=True),
+        ),
+    ]
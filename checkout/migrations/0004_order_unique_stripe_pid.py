@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-17 18:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_payment_intents(apps, schema_editor):
+    """
+    Stops the migration if two orders share a PaymentIntent. They were
+    placed by a retried checkout and may both have been credited, so they
+    are left for a person to resolve instead of being deleted here
+    """
+    Order = apps.get_model("checkout", "Order")
+    duplicates = (
+        Order.objects.exclude(stripe_pid="")
+        .values("stripe_pid")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("stripe_pid")
+    )
+    report = [
+        f"{duplicate['stripe_pid']}: orders "
+        + ", ".join(
+            Order.objects.filter(stripe_pid=duplicate["stripe_pid"])
+            .order_by("id")
+            .values_list("order_number", flat=True)
+        )
+        for duplicate in duplicates
+    ]
+    if report:
+        raise RuntimeError(
+            "These PaymentIntents have more than one order. Remove the extra "
+            "orders, and any gold they credited twice, before migrating:\n" + "\n".join(report)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0003_order_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_payment_intents, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, stripe_pid=''), fields=('stripe_pid',), name='unique_order_stripe_pid'),
+        ),
+    ]
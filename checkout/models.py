@@ -2,11 +2,12 @@ import uuid
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Q
 
 # Create your models here.
 
 class Order(models.Model):
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(max_length=32, null=False, editable=False, unique=True)
     user = models.ForeignKey(get_user_model(), null=False, blank=False, on_delete=models.CASCADE, related_name='orders')
     full_name = models.CharField(max_length=50, null=False, blank=False)
     email = models.EmailField(max_length=254, null=False, blank=False)
@@ -17,8 +18,23 @@ class Order(models.Model):
     street_address1 = models.CharField(max_length=80, null=False, blank=False)
     street_address2 = models.CharField(max_length=80, null=True, blank=True)
     county = models.CharField(max_length=80, null=True, blank=True)
-    date = models.DateTimeField(auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
     total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
+    # Gold is credited by the settlement worker once Stripe confirms the payment
+    stripe_pid = models.CharField(max_length=254, null=False, blank=True, default='', db_index=True)
+    gold = models.PositiveIntegerField(null=False, default=0)
+    credited = models.BooleanField(null=False, default=False)
+
+    class Meta:
+        constraints = [
+            # One order per PaymentIntent, so a payment is never credited twice.
+            # Orders from before the settlement worker have no PaymentIntent
+            models.UniqueConstraint(
+                fields=["stripe_pid"],
+                condition=~Q(stripe_pid=""),
+                name="unique_order_stripe_pid",
+            ),
+        ]
 
     def _generate_order_number(self):
         return uuid.uuid4().hex.upper()
@@ -30,3 +46,18 @@ class Order(models.Model):
 
     def __str__(self):
         return self.order_number
+
+
+class PaymentEvent(models.Model):
+    """
+    A verified Stripe webhook event waiting to be settled by the
+    process_payment_events command
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payment_intent = models.CharField(max_length=254, db_index=True)
+    received = models.DateTimeField(auto_now_add=True)
+    processed = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return self.event_id
@@ -0,0 +1,139 @@
+"""
+Settling payments confirmed by Stripe.
+
+The webhook view only verifies and stores payment events. Gold is credited
+later by the process_payment_events command, in batches, so bursts of
+payments never hold up a request.
+
+An order is credited at most once: it is locked and only paid out while
+Order.credited is still False, which the same transaction then sets. A
+PaymentIntent has at most one order (see Order.Meta.constraints), so a
+payment cannot be credited twice through two orders either.
+Replayed webhooks are ignored because event ids are unique.
+Users who pay before they have a character get one, so no order is marked
+credited without its gold reaching a character.
+"""
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from MUD import ledger
+from MUD.helpers import invalidate_character
+from MUD.models import Character
+from MUD.utils import GoldReason
+from .models import Order, PaymentEvent
+
+logger = logging.getLogger(__name__)
+
+# Stripe events that mean an order has been paid for
+SETTLED_EVENT_TYPES = ("payment_intent.succeeded",)
+
+
+def enqueue_payment_event(event):
+    """
+    Stores a verified Stripe event for the worker.
+    Returns True if the event was queued, False if it was ignored or had
+    already been received
+
+    :param event Dict: The event Stripe sent to the webhook
+    """
+    if event["type"] not in SETTLED_EVENT_TYPES:
+        return False
+
+    _, created = PaymentEvent.objects.get_or_create(
+        event_id=event["id"],
+        defaults={
+            "event_type": event["type"],
+            "payment_intent": event["data"]["object"]["id"],
+        },
+    )
+    return created
+
+
+def get_or_create_character(user_id):
+    """
+    Returns the id of a user's character, creating it for a user who paid
+    before ever opening their character page so the gold has a home
+
+    :param user_id Integer: The user who placed the order
+    """
+    character, created = Character.objects.get_or_create(owner_id=user_id)
+    if created:
+        logger.warning("Created a character for user %s to credit their order", user_id)
+    return character.pk
+
+
+def settle_payment_events(batch_size=100):
+    """
+    Credits the gold for one batch of queued payment events.
+    Returns the number of events processed.
+
+    Events whose order has not been placed yet (Stripe can call the webhook
+    before the checkout form is submitted) stay queued until it has.
+    With Postgres several workers can run at once, each locking its own batch
+
+    :param batch_size Integer: Maximum number of events to process
+    """
+    with transaction.atomic():
+        events = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(
+                processed=None,
+                payment_intent__in=Order.objects.values("stripe_pid"),
+            )
+            .order_by("received")[:batch_size]
+        )
+        if not events:
+            return 0
+
+        orders = list(
+            Order.objects.select_for_update(of=("self",))
+            .filter(
+                stripe_pid__in={event.payment_intent for event in events},
+                credited=False,
+            )
+            .values_list("order_number", "user_id", "user__owner", "gold")
+        )
+        # The orders are locked, so this marks exactly the orders read above
+        Order.objects.filter(
+            order_number__in=[order[0] for order in orders],
+            credited=False,
+        ).update(credited=True)
+
+        orders = [
+            (order_number, user_id, character_id or get_or_create_character(user_id), order_gold)
+            for order_number, user_id, character_id, order_gold in orders
+        ]
+        gold = Counter()
+        for _, _, character_id, order_gold in orders:
+            gold[character_id] += order_gold
+
+        if gold:
+            ledger.record_many(
+                (character_id, order_gold, GoldReason.BUNDLE, order_number)
+                for order_number, _, character_id, order_gold in orders
+            )
+            Character.objects.filter(pk__in=gold).update(
+                gold=F("gold")
+                + Case(
+                    *(
+                        When(pk=character_id, then=Value(amount))
+                        for character_id, amount in gold.items()
+                    ),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+
+        PaymentEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+            processed=timezone.now()
+        )
+
+    for user_id in {order[1] for order in orders}:
+        invalidate_character(user_id)
+
+    logger.info("Settled %d payment events for %d orders", len(events), len(orders))
+    return len(events)
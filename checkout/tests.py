@@ -1,3 +1,432 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from MUD import ledger
+from MUD.helpers import get_character
+from MUD.models import Character
+from MUD.tests import analyze, create_character, sequential_scans
+from .models import Order, PaymentEvent
+from .settlement import settle_payment_events
+
+
+class FakeStripe(BaseHTTPRequestHandler):
+    """
+    Creates and updates PaymentIntents after server.delay seconds. Records the
+    requests it was sent in server.received and, like Stripe, replays the
+    original response for a repeated Idempotency-Key
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = {key: value[0] for key, value in parse_qs(self.rfile.read(length).decode()).items()}
+        key = self.headers.get("Idempotency-Key")
+        time.sleep(self.server.delay)
+
+        with self.server.lock:
+            self.server.received.append((self.path, self.headers, form))
+            if key in self.server.replies:
+                intent = self.server.replies[key]
+            elif self.path == "/v1/payment_intents":
+                number = len(self.server.intents) + 1
+                intent = {
+                    "id": f"pi_{number}",
+                    "object": "payment_intent",
+                    "amount": int(form["amount"]),
+                    "currency": form["currency"],
+                    "client_secret": f"pi_{number}_secret",
+                }
+                self.server.intents[intent["id"]] = intent
+            else:
+                intent = self.server.intents[self.path.rsplit("/", 1)[-1]]
+                intent["amount"] = int(form["amount"])
+            self.server.replies[key] = intent
+            body = json.dumps(intent).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+ORDER = {
+    "full_name": "Chatter",
+    "email": "chatter@example.com",
+    "phone_number": "0123456789",
+    "country": "GB",
+    "postcode": "AB1 2CD",
+    "town_or_city": "Town",
+    "street_address1": "1 Street",
+    "street_address2": "",
+    "county": "",
+    "total": "5.99",
+}
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStripe)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.received = []
+        self.server.intents = {}
+        self.server.replies = {}
+        self.server.delay = 0
+
+        overrides = override_settings(
+            STRIPE_API_BASE=self.url, STRIPE_SECRET_KEY="sk_test", STRIPE_TIMEOUT=5
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.character = create_character(gold=5)
+        for client in (self.client, self.async_client):
+            client.force_login(self.character.owner)
+            self.set_bundle("medium", 5.99, client)
+
+    def set_bundle(self, name, price, client=None):
+        session = (client or self.client).session
+        session["bundle_name"] = name
+        session["bundle_price"] = price
+        session.save()
+
+    def test_checkout_creates_a_payment_intent(self):
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["client_secret"], "pi_1_secret")
+
+        path, headers, form = self.server.received[0]
+        self.assertEqual(path, "/v1/payment_intents")
+        self.assertEqual(form, {"amount": "599", "currency": "gbp"})
+        self.assertEqual(
+            headers["Authorization"], "Basic " + base64.b64encode(b"sk_test:").decode()
+        )
+        self.assertTrue(headers["Idempotency-Key"])
+
+    def test_payment_intent_is_reused_between_renders(self):
+        self.client.get(reverse("checkout"))
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.context["client_secret"], "pi_1_secret")
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_each_bundle_gets_its_own_payment_intent(self):
+        self.client.get(reverse("checkout"))
+        self.set_bundle("large", 9.99)
+        self.client.get(reverse("checkout"))
+        self.set_bundle("medium", 5.99)
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.context["client_secret"], "pi_1_secret")
+        self.assertEqual(
+            [form["amount"] for _, _, form in self.server.received], ["599", "999"]
+        )
+
+    def test_payment_intent_is_updated_when_the_price_changes(self):
+        self.client.get(reverse("checkout"))
+        self.set_bundle("medium", 6.99)
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.context["client_secret"], "pi_1_secret")
+        path, _, form = self.server.received[1]
+        self.assertEqual(path, "/v1/payment_intents/pi_1")
+        self.assertEqual(form, {"amount": "699"})
+        self.assertEqual(self.server.intents["pi_1"]["amount"], 699)
+
+    def test_lost_responses_are_retried_with_the_same_idempotency_key(self):
+        session_key = self.client.session.session_key
+        self.server.replies[f"{session_key}-0-medium"] = {
+            "id": "pi_lost",
+            "amount": 599,
+            "client_secret": "pi_lost_secret",
+        }
+
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.context["client_secret"], "pi_lost_secret")
+        self.assertEqual(self.server.intents, {})
+
+    def test_completed_purchase_forgets_its_payment_intents(self):
+        self.client.get(reverse("checkout"))
+        response = self.client.post(reverse("checkout"), ORDER)
+        self.client.get(response.url)
+        self.set_bundle("medium", 5.99)
+        response = self.client.get(reverse("checkout"))
+
+        self.assertEqual(response.context["client_secret"], "pi_2_secret")
+
+    def test_order_is_placed_without_calling_stripe_or_crediting_gold(self):
+        self.client.get(reverse("checkout"))
+        response = self.client.post(reverse("checkout"), ORDER)
+
+        order = Order.objects.get()
+        self.assertRedirects(
+            response,
+            reverse("checkout_success", args=[order.order_number]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual((order.stripe_pid, order.gold, order.credited), ("pi_1", 30, False))
+        self.assertEqual(Character.objects.get(pk=self.character.pk).gold, 5)
+        self.assertEqual(len(self.server.received), 1)
+
+    def test_resubmitted_order_is_only_placed_once(self):
+        self.client.get(reverse("checkout"))
+        first = self.client.post(reverse("checkout"), ORDER)
+        second = self.client.post(reverse("checkout"), ORDER)
+
+        order = Order.objects.get()
+        self.assertEqual(first.url, second.url)
+        self.assertEqual(first.url, reverse("checkout_success", args=[order.order_number]))
+
+    def test_order_without_a_payment_intent_is_rejected(self):
+        response = self.client.post(reverse("checkout"), ORDER)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["order_form"].non_field_errors())
+        self.assertFalse(Order.objects.exists())
+
+    def test_invalid_order_is_shown_again_with_the_same_payment_intent(self):
+        self.client.get(reverse("checkout"))
+        response = self.client.post(reverse("checkout"), {**ORDER, "email": "nope"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("email", response.context["order_form"].errors)
+        self.assertEqual(response.context["client_secret"], "pi_1_secret")
+        self.assertEqual(len(self.server.received), 1)
+        self.assertFalse(Order.objects.exists())
+
+    async def test_concurrent_checkouts_overlap_slow_stripe_calls(self):
+        """
+        Load test: with Stripe taking 0.5s per call, 10 concurrent checkouts
+        served by one process take 5s if each waits in turn. Session, ORM
+        and template work still run one at a time on the sync thread
+        """
+        self.server.delay = 0.5
+        requests = 10
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(self.async_client.get(reverse("checkout")) for _ in range(requests))
+        )
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([r.status_code for r in responses], [200] * requests)
+        self.assertEqual(len(self.server.received), requests)
+        # The session is shared, so every request used the same idempotency key
+        self.assertEqual(len(self.server.intents), 1)
+        self.assertLess(elapsed, requests * self.server.delay / 2)
+
+
+def payment_event(event_id, payment_intent, event_type="payment_intent.succeeded"):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "data": {"object": {"id": payment_intent, "object": "payment_intent"}},
+    }
+
+
+def create_order(character, stripe_pid, gold=30, user=None):
+    return Order.objects.create(
+        user=user or character.owner,
+        full_name="Chatter",
+        email="chatter@example.com",
+        phone_number="0123456789",
+        country="GB",
+        town_or_city="Town",
+        street_address1="1 Street",
+        stripe_pid=stripe_pid,
+        gold=gold,
+    )
+
+
+@override_settings(STRIPE_WH_SECRET="whsec_test")
+class StripeWebhookTests(TestCase):
+    def post_event(self, event, secret="whsec_test"):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            reverse("stripe_webhook"),
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def test_verified_payment_events_are_queued_once(self):
+        self.post_event(payment_event("evt_1", "pi_1"))
+        response = self.post_event(payment_event("evt_1", "pi_1"))
+
+        self.assertEqual(response.status_code, 200)
+        event = PaymentEvent.objects.get()
+        self.assertEqual((event.payment_intent, event.processed), ("pi_1", None))
+
+    def test_events_with_a_bad_signature_are_rejected(self):
+        response = self.post_event(payment_event("evt_1", "pi_1"), secret="whsec_wrong")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_other_events_are_acknowledged_and_ignored(self):
+        response = self.post_event(
+            payment_event("evt_1", "pi_1", "payment_intent.payment_failed")
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.character = create_character(gold=5)
+
+    def queue(self, event_id, payment_intent):
+        return PaymentEvent.objects.create(
+            event_id=event_id,
+            event_type="payment_intent.succeeded",
+            payment_intent=payment_intent,
+        )
+
+    def test_paid_orders_are_credited_once(self):
+        order = create_order(self.character, "pi_1")
+        self.queue("evt_1", "pi_1")
+        self.queue("evt_2", "pi_1")
+        get_character(self.character.owner)
+
+        self.assertEqual(settle_payment_events(), 2)
+        self.assertEqual(settle_payment_events(), 0)
+
+        order.refresh_from_db()
+        self.assertTrue(order.credited)
+        self.assertEqual(get_character(self.character.owner).gold, 35)
+        self.assertEqual(
+            self.character.gold_transactions.filter(reason="bundle").get().reference,
+            order.order_number,
+        )
+        self.assertFalse(PaymentEvent.objects.filter(processed=None).exists())
+
+    def test_a_payment_cannot_have_two_orders(self):
+        create_order(self.character, "pi_1")
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                create_order(self.character, "pi_1")
+
+        create_order(self.character, "")
+        create_order(self.character, "")
+        self.queue("evt_1", "pi_1")
+        self.queue("evt_2", "pi_1")
+
+        settle_payment_events()
+        self.assertEqual(Character.objects.get(pk=self.character.pk).gold, 35)
+
+    def test_events_wait_for_their_order(self):
+        self.queue("evt_1", "pi_1")
+
+        self.assertEqual(settle_payment_events(), 0)
+
+        create_order(self.character, "pi_1")
+        self.assertEqual(settle_payment_events(), 1)
+        self.assertEqual(Character.objects.get(pk=self.character.pk).gold, 35)
+
+    def test_users_without_a_character_get_one_with_the_gold(self):
+        user = get_user_model().objects.create_user("newcomer", password="password")
+        order = create_order(None, "pi_1", user=user)
+        self.queue("evt_1", "pi_1")
+
+        with self.assertLogs("checkout.settlement", "WARNING"):
+            self.assertEqual(settle_payment_events(), 1)
+
+        order.refresh_from_db()
+        self.assertTrue(order.credited)
+        character = Character.objects.get(owner=user)
+        self.assertEqual(character.gold, Character._meta.get_field("gold").default + 30)
+        self.assertEqual(list(ledger.reconcile()), [])
+
+    def test_a_burst_is_credited_in_batches(self):
+        other = create_character("gifter", gold=0)
+        for number in range(30):
+            create_order(self.character if number % 3 else other, f"pi_{number}", gold=10)
+            self.queue(f"evt_{number}", f"pi_{number}")
+
+        # Six statements (plus a savepoint and its release) per batch,
+        # however many orders and characters it holds
+        with self.assertNumQueries(8):
+            self.assertEqual(settle_payment_events(batch_size=20), 20)
+
+        out = StringIO()
+        call_command("process_payment_events", batch_size=20, stdout=out)
+
+        self.assertIn("Processed 10 payment events", out.getvalue())
+        self.assertEqual(Character.objects.get(pk=self.character.pk).gold, 205)
+        self.assertEqual(Character.objects.get(pk=other.pk).gold, 100)
+        self.assertFalse(Order.objects.filter(credited=False).exists())
+
+
+class OrderQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        character = create_character()
+        Order.objects.bulk_create(
+            Order(
+                order_number=f"{n:032X}",
+                user=character.owner,
+                full_name="Chatter",
+                email="chatter@example.com",
+                phone_number="0123456789",
+                country="GB",
+                town_or_city="Town",
+                street_address1="1 Street",
+                stripe_pid=f"pi_{n}",
+            )
+            for n in range(5000)
+        )
+        analyze()
+
+    def test_checkout_success_finds_the_order_with_an_index(self):
+        self.assertEqual(
+            sequential_scans(Order.objects.filter(order_number=f"{42:032X}")), []
+        )
+
+    def test_admin_lists_orders_by_date_with_an_index(self):
+        self.assertEqual(sequential_scans(Order.objects.order_by("-date")[:100]), [])
+
+    def test_order_numbers_are_unique(self):
+        order = Order.objects.first()
+        order.pk = None
+
+        with self.assertRaises(IntegrityError):
+            order.save()
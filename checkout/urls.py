@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('', views.checkout , name="checkout"),
     path('checkout_success/<order_number>', views.checkout_success , name="checkout_success"),
+    path('wh/', views.stripe_webhook , name="stripe_webhook"),
 ]
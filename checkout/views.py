@@ -1,71 +1,34 @@
+import stripe
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect ,reverse, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from MUD.helpers import get_character
 from .forms import OrderForm
+from .helpers import (forget_payment_intents, get_bundle, get_payment_intent,
+                      place_order)
 from .models import Order
+from .settlement import enqueue_payment_event
 
 
-import stripe
-
+async def checkout(request):
+    """
+    Async so that waiting on Stripe does not hold up a worker.
+    Session, ORM and template work run through sync_to_async
 
-def checkout(request):
+    """
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
-    name = request.session.get('bundle_name',{})
-    price = request.session.get('bundle_price',{})
-    stripe.api_key = stripe_secret_key
-    intent = stripe.PaymentIntent.create(
-            amount=round(price*100),
-            currency=settings.STRIPE_CURRENCY,
-        )
+    name, price = await sync_to_async(get_bundle)(request)
 
     if request.method == "POST":
-        form_data = {
-            'user': request.user,
-            'full_name': request.POST['full_name'],
-            'email': request.POST['email'],
-            'phone_number': request.POST['phone_number'],
-            'country': request.POST['country'],
-            'postcode': request.POST['postcode'],
-            'town_or_city': request.POST['town_or_city'],
-            'street_address1': request.POST['street_address1'],
-            'street_address2': request.POST['street_address2'],
-            'county': request.POST['county'],
-        }
-
-        order_form = OrderForm(form_data)
-        if order_form.is_valid():
-            order = order_form.save(commit=False)
-            order.user_id = request.user.id
-            order.total = request.POST['total']
-            order.save()
-
-            character = get_character(request.user.username)
-
-            if name == "large":
-                character.gold += 100
-            if name == "medium":
-                character.gold += 30
-            if name == "small":
-                character.gold += 10
-
-            character.save()
-
-
+        order, order_form = await sync_to_async(place_order)(request, name)
+        if order:
             return redirect(reverse('checkout_success', args=[order.order_number]))
-        else:
-            messages.error(request, "There was an error with processing your order")
-            context = {
-                'order_form':order_form,
-                'bundle_name': name,
-                'bundle_price': price,
-                'stripe_public_key':stripe_public_key,
-                'client_secret': intent.client_secret,
-            }
-
-        return render(request,'checkout/checkout.html',context)
+
+        messages.error(request, "There was an error with processing your order")
 
     else:
         if not name and price:
@@ -77,21 +40,24 @@ def checkout(request):
 
         order_form = OrderForm()
 
+    # Only pages that show the card form need a PaymentIntent
+    intent = await get_payment_intent(request, name, round(price*100))
 
-        context = {
-                'order_form':order_form,
-                'bundle_name': name,
-                'bundle_price': price,
-                'stripe_public_key':stripe_public_key,
-                'client_secret': intent.client_secret,
-            }
+    context = {
+            'order_form':order_form,
+            'bundle_name': name,
+            'bundle_price': price,
+            'stripe_public_key':stripe_public_key,
+            'client_secret': intent['client_secret'],
+        }
 
-        return render(request,'checkout/checkout.html',context)
+    return await sync_to_async(render)(request,'checkout/checkout.html',context)
 
 def checkout_success(request, order_number):
     order = get_object_or_404(Order,order_number=order_number)
     messages.success(request, f'Order successfully processed! \
-                        Your order number is {order_number}')
+                        Your order number is {order_number}. \
+                        Your gold will be added as soon as your payment is confirmed')
 
     context = {
         'order': order,
@@ -104,4 +70,28 @@ def checkout_success(request, order_number):
     if 'bundle_price' in request.session:
         del request.session['bundle_price']
 
+    forget_payment_intents(request)
+
     return render(request, 'checkout/checkout_success.html',context)
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """
+    Receives events from Stripe. Payment events with a valid signature are
+    queued for the process_payment_events command, so this returns quickly
+    however many payments arrive at once
+
+    """
+    try:
+        event = stripe.Webhook.construct_event(
+            request.body,
+            request.META.get('HTTP_STRIPE_SIGNATURE', ''),
+            settings.STRIPE_WH_SECRET,
+        )
+    except (ValueError, stripe.error.SignatureVerificationError):
+        return HttpResponse(status=400)
+
+    enqueue_payment_event(event)
+    return HttpResponse(status=200)
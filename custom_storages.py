@@ -1,8 +1,28 @@
 from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin
 from storages.backends.s3boto3 import S3Boto3Storage
 
-class StaticStorage(S3Boto3Storage):
-    locaion = settings.STATICFILES_LOCATION
+from PersonalWebsite.staticfiles import (HASHED_CACHE_CONTROL, UNHASHED_CACHE_CONTROL,
+                                         CompressedFilesMixin, UploadManifestMixin,
+                                         is_hashed_name)
+
+
+class StaticStorage(CompressedFilesMixin, UploadManifestMixin, ManifestFilesMixin, S3Boto3Storage):
+    """
+    Hashed and compressed static files on S3. Only files that changed since
+    the last collectstatic are uploaded. Like every static file uploaded so
+    far, they are stored at the root of the bucket
+    """
+
+    def get_object_parameters(self, name):
+        # Hashed names change with their content, so they can be cached for
+        # good. The rest, like the manifest, must be checked every time
+        parameters = super().get_object_parameters(name)
+        parameters.pop("Expires", None)
+        parameters["CacheControl"] = (
+            HASHED_CACHE_CONTROL if is_hashed_name(name) else UNHASHED_CACHE_CONTROL
+        )
+        return parameters
 
 class MediaStorage(S3Boto3Storage):
     locaion = settings.MEDIAFILES_LOCATION
@@ -1,6 +1,30 @@
+import logging
+import threading
+import time
+
+import httpx
 import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from itertools import islice
 
+from PersonalWebsite.http import async_client
+
+logger = logging.getLogger(__name__)
+
+GITHUB_REPOS_CACHE_KEY = "github_repos"
+
+GITHUB_REPOS_REFRESH_KEY = "github_repos_refreshing"
+
+# The only fields repocard.html displays
+REPO_FIELDS = ("name", "description", "html_url")
+
+
+class GitHubError(Exception):
+    """ GitHub was slow, down or returned garbage """
+
+
 def chunk(it, size):
     """
     Taken from https://stackoverflow.com/questions/312443/how-do-you-split-a-list-into-evenly-sized-chunks
@@ -11,11 +35,171 @@ def chunk(it, size):
     it = iter(it)
     return iter(lambda: tuple(islice(it, size)), ())
 
+
+def github_headers(etag=None):
+    headers = {"Accept": "application/vnd.github.v3+json"}
+    if etag:
+        headers["If-None-Match"] = etag
+    return headers
+
+
+def parse_github_response(response, etag=None):
+    """
+    Returns a tuple of (repos, etag), or (None, etag) if GitHub replied that
+    nothing has changed since etag
+
+    :param response Response: A requests or httpx response
+    :param etag String: ETag the request was sent with
+    :raises GitHubError: If the response is an error or not a list of repos
+    """
+    if response.status_code == 304:
+        return None, etag
+    if response.status_code != 200:
+        raise GitHubError(f"GitHub responded with {response.status_code}")
+
+    try:
+        repos = [{field: repo.get(field) for field in REPO_FIELDS} for repo in response.json()]
+    except (ValueError, TypeError, AttributeError) as error:
+        raise GitHubError("Unexpected response from GitHub") from error
+
+    return repos, response.headers.get("ETag")
+
+
+def fetch_github_repos(etag=None):
+    """
+    Requests the repo list from GitHub. See parse_github_response
+
+    :param etag String: ETag of the last good response
+    :raises GitHubError: If GitHub is slow, down or returns garbage
+    """
+    try:
+        response = requests.get(
+            settings.GITHUB_REPOS_URL,
+            headers=github_headers(etag),
+            timeout=settings.GITHUB_TIMEOUT,
+        )
+    except requests.RequestException as error:
+        raise GitHubError("Could not reach GitHub") from error
+    return parse_github_response(response, etag)
+
+
+async def afetch_github_repos(etag=None):
+    """
+    Same as fetch_github_repos, without blocking the event loop
+    """
+    try:
+        async with async_client(timeout=settings.GITHUB_TIMEOUT) as client:
+            response = await client.get(
+                settings.GITHUB_REPOS_URL, headers=github_headers(etag)
+            )
+    except httpx.HTTPError as error:
+        raise GitHubError("Could not reach GitHub") from error
+    return parse_github_response(response, etag)
+
+
+def store_github_repos(entry, repos, etag):
+    """
+    Caches freshly fetched repos and returns the new cache entry
+
+    :param entry Dict: The current cache entry, if any
+    :param repos List: The fetched repos, None if they have not changed
+    :param etag String: ETag of the response
+    """
+    if repos is None:
+        repos = entry["repos"]
+    entry = {"repos": repos, "etag": etag, "fetched_at": time.time()}
+    cache.set(GITHUB_REPOS_CACHE_KEY, entry, None)
+    return entry
+
+
+def refresh_github_repos():
+    """
+    Fetches the repos and stores them in the cache. Keeps the last good
+    payload if GitHub cannot be reached.
+    Returns the cache entry.
+
+    """
+    entry = cache.get(GITHUB_REPOS_CACHE_KEY)
+    try:
+        repos, etag = fetch_github_repos(entry and entry["etag"])
+    except GitHubError:
+        logger.warning("Could not refresh GitHub repos", exc_info=True)
+        return entry
+
+    return store_github_repos(entry, repos, etag)
+
+
+async def arefresh_github_repos():
+    """
+    Same as refresh_github_repos, without blocking the event loop
+    """
+    entry = await sync_to_async(cache.get)(GITHUB_REPOS_CACHE_KEY)
+    try:
+        repos, etag = await afetch_github_repos(entry and entry["etag"])
+    except GitHubError:
+        logger.warning("Could not refresh GitHub repos", exc_info=True)
+        return entry
+
+    return await sync_to_async(store_github_repos)(entry, repos, etag)
+
+
+def _refresh_in_background():
+    try:
+        refresh_github_repos()
+    finally:
+        cache.delete(GITHUB_REPOS_REFRESH_KEY)
+
+
+def refresh_if_stale(entry):
+    """
+    Starts a background refresh once entry is older than
+    settings.GITHUB_REPOS_TTL
+
+    :param entry Dict: The current cache entry
+    """
+    if time.time() - entry["fetched_at"] <= settings.GITHUB_REPOS_TTL:
+        return
+
+    # cache.add only succeeds for one caller until the refresh finishes
+    if cache.add(GITHUB_REPOS_REFRESH_KEY, True, settings.GITHUB_TIMEOUT * 2):
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+
+
+def display_repos(entry):
+    repos = entry["repos"] if entry else []
+    repos_to_display = list(chunk(repos, 3))
+    return repos_to_display
+
+
 def get_github_repos():
     """
     Gets the json data to display information about my github repos
 
+    Repos are served from the cache. Once they are older than
+    settings.GITHUB_REPOS_TTL the stale copy is still served while one
+    background thread fetches a fresh one. Only an empty cache makes the
+    request wait for GitHub, and if that fails no repos are shown.
     """
-    repos = requests.get('https://api.github.com/users/Arb-aya/repos').json()
-    repos_to_display = list(chunk(repos,3))
-    return repos_to_display
+    entry = cache.get(GITHUB_REPOS_CACHE_KEY)
+
+    if entry is None:
+        entry = refresh_github_repos()
+    else:
+        refresh_if_stale(entry)
+
+    return display_repos(entry)
+
+
+async def aget_github_repos():
+    """
+    Same as get_github_repos, but an empty cache is filled without tying up
+    a thread while GitHub responds
+    """
+    entry = await sync_to_async(cache.get)(GITHUB_REPOS_CACHE_KEY)
+
+    if entry is None:
+        entry = await arefresh_github_repos()
+    else:
+        await sync_to_async(refresh_if_stale)(entry)
+
+    return display_repos(entry)
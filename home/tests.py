@@ -1,3 +1,189 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from .helpers import (GITHUB_REPOS_CACHE_KEY, GITHUB_REPOS_REFRESH_KEY,
+                      aget_github_repos, get_github_repos)
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    """
+    Serves the repos in server.repos after server.delay seconds,
+    or fails with server.status if it is not 200
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.end_headers()
+            return
+
+        if self.headers.get("If-None-Match") == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        body = json.dumps(self.server.repos).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def repo(name):
+    return {
+        "id": 1,
+        "name": name,
+        "description": f"{name} repo",
+        "html_url": f"https://example.com/{name}",
+    }
+
+
+class GitHubReposTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/repos"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.requests = 0
+        self.server.delay = 0
+        self.server.status = 200
+        self.server.etag = '"v1"'
+        self.server.repos = [repo("MUD"), repo("Site")]
+
+        overrides = override_settings(
+            GITHUB_REPOS_URL=self.url, GITHUB_REPOS_TTL=60, GITHUB_TIMEOUT=0.5
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def make_stale(self):
+        entry = cache.get(GITHUB_REPOS_CACHE_KEY)
+        entry["fetched_at"] -= 120
+        cache.set(GITHUB_REPOS_CACHE_KEY, entry, None)
+
+    def wait_for_refresh(self):
+        deadline = time.time() + 5
+        while cache.get(GITHUB_REPOS_REFRESH_KEY) and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_repos_are_fetched_once_and_cached(self):
+        repos = get_github_repos()
+        get_github_repos()
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(
+            repos,
+            [
+                (
+                    {"name": "MUD", "description": "MUD repo", "html_url": "https://example.com/MUD"},
+                    {"name": "Site", "description": "Site repo", "html_url": "https://example.com/Site"},
+                )
+            ],
+        )
+
+    def test_stale_repos_are_served_while_a_slow_upstream_refreshes(self):
+        get_github_repos()
+        self.make_stale()
+        self.server.delay = 0.3
+        self.server.etag = '"v2"'
+        self.server.repos = [repo("New")]
+
+        start = time.perf_counter()
+        repos = get_github_repos()
+        get_github_repos()
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.2)
+        self.assertEqual(repos[0][0]["name"], "MUD")
+
+        self.wait_for_refresh()
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(get_github_repos()[0][0]["name"], "New")
+
+    def test_unchanged_repos_are_revalidated_with_the_etag(self):
+        get_github_repos()
+        self.make_stale()
+
+        get_github_repos()
+        self.wait_for_refresh()
+
+        entry = cache.get(GITHUB_REPOS_CACHE_KEY)
+        self.assertLess(time.time() - entry["fetched_at"], 60)
+        self.assertEqual(entry["repos"][0]["name"], "MUD")
+
+    def test_last_good_repos_survive_a_failing_upstream(self):
+        get_github_repos()
+        self.make_stale()
+        self.server.status = 500
+
+        get_github_repos()
+        self.wait_for_refresh()
+
+        self.assertEqual(get_github_repos()[0][0]["name"], "MUD")
+        self.wait_for_refresh()
+
+    async def test_an_empty_cache_is_filled_asynchronously(self):
+        repos = await aget_github_repos()
+
+        self.assertEqual(repos[0][1]["name"], "Site")
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(cache.get(GITHUB_REPOS_CACHE_KEY)["etag"], '"v1"')
+
+    def test_homepage_renders_when_upstream_is_down(self):
+        self.server.status = 503
+
+        response = self.client.get(reverse("home_index"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["repos"], [])
+
+    def test_homepage_renders_when_upstream_times_out(self):
+        self.server.delay = 1
+
+        start = time.perf_counter()
+        response = self.client.get(reverse("home_index"))
+
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(response.context["repos"], [])
+
+    async def test_concurrent_homepage_requests_overlap_a_slow_upstream(self):
+        """
+        Load test: with a cold cache and GitHub taking 0.3s, 10 concurrent
+        homepage requests served by one process take 3s if each waits in turn
+        """
+        self.server.delay = 0.3
+        requests = 10
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(self.async_client.get(reverse("home_index")) for _ in range(requests))
+        )
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([r.status_code for r in responses], [200] * requests)
+        self.assertEqual(responses[0].context["repos"][0][0]["name"], "MUD")
+        self.assertLess(elapsed, requests * self.server.delay / 2)
@@ -1,17 +1,20 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 
-from .helpers import get_github_repos
+from .helpers import aget_github_repos
 
 
-def index(request):
+async def index(request):
     """
     Return a view for the homepage. Gather information on
     repos to display
 
+    Async so that waiting on GitHub does not hold up a worker
+
     """
-    repos = get_github_repos()
+    repos = await aget_github_repos()
 
     context = {
         "repos": repos,
     }
-    return render(request, "home/index.html", context)
+    return await sync_to_async(render)(request, "home/index.html", context)
@@ -257,7 +257,7 @@ export function create_character_stage() {
     wrapper.load_item = function(item) {
         const slot = wrapper[item.slot];
         let item_object = new_item(item, '00', '00', item_layer, slot_size, slot);
-        wrapper.items[item.name] = item_object;
+        wrapper.items[item_object.name] = item_object;
     };
 
     /**
@@ -107,7 +107,7 @@ function manage_inventory(direction) {
             character.unequip_item(konva_item.name());
 
             data.push({
-                'name': item_object.name,
+                'item_id': Number(item_object.name),
                 'equipped': item_object.equipped,
                 'lastSpaceIndex': inventory.spaceid_to_index(item_object.lastSpaceID),
                 'currentSpaceIndex': inventory.spaceid_to_index(item_object.currentSpaceID),
@@ -121,7 +121,7 @@ function manage_inventory(direction) {
         inventory.layer.batchDraw();
 
         data.push({
-            'name': e.target.name(),
+            'item_id': Number(e.target.name()),
             'equipped': e.item_wrapper.equipped,
             'lastSpaceIndex': inventory.spaceid_to_index(e.item_wrapper.lastSpaceID),
             'currentSpaceIndex': inventory.spaceid_to_index(e.item_wrapper.currentSpaceID),
@@ -146,7 +146,7 @@ function manage_inventory(direction) {
             character.layer.batchDraw();
 
             const data = [{
-                'name': e.item_wrapper.name,
+                'item_id': Number(e.item_wrapper.name),
                 'equipped': e.item_wrapper.equipped,
                 'lastSpaceIndex': inventory.spaceid_to_index(e.item_wrapper.lastSpaceID),
                 'currentSpaceIndex': inventory.spaceid_to_index(e.item_wrapper.currentSpaceID),
@@ -219,7 +219,7 @@ function manage_inventory(direction) {
                     character.unequip_item(currently_equipped_item.name());
 
                     data.push({
-                        'name': equipped_object.name,
+                        'item_id': Number(equipped_object.name),
                         'equipped': equipped_object.equipped,
                         'lastSpaceIndex': inventory.spaceid_to_index(equipped_object.lastSpaceID),
                         'currentSpaceIndex': inventory.spaceid_to_index(equipped_object.currentSpaceID),
@@ -234,7 +234,7 @@ function manage_inventory(direction) {
 
                 data.push(
                     {
-                        'name': item_object.name,
+                        'item_id': Number(item_object.name),
                         'equipped': item_object.equipped,
                         'lastSpaceIndex': inventory.spaceid_to_index(item_object.lastSpaceID),
                         'currentSpaceIndex': inventory.spaceid_to_index(item_object.currentSpaceID),
@@ -345,7 +345,7 @@ function manage_inventory(direction) {
                 inventory.remove_item(inventory_object.name);
 
                 data.push({
-                    'name': inventory_object.name,
+                    'item_id': Number(inventory_object.name),
                     'equipped': inventory_object.equipped,
                     'lastSpaceIndex': inventory.spaceid_to_index(inventory_object.lastSpaceID),
                     'currentSpaceIndex': inventory.spaceid_to_index(inventory_object.currentSpaceID),
@@ -361,7 +361,7 @@ function manage_inventory(direction) {
             character.unequip_item(konva_item_to_unequip.name());
 
             data.push({
-                'name': item_object.name,
+                'item_id': Number(item_object.name),
                 'equipped': item_object.equipped,
                 'lastSpaceIndex': inventory.spaceid_to_index(e.spaceID),
                 'currentSpaceIndex': inventory.spaceid_to_index(e.spaceID),
@@ -375,7 +375,7 @@ function manage_inventory(direction) {
     /**
      * Writes data to the database. This function makes the following assumptions:
      *    1.) Data is an array of objects
-     *    2.) Each object has at least one property of 'name'. This is the name of an    item.
+     *    2.) Each object has at least one property of 'item_id'. This is the id of an item.
      *
      *   3.) Any further property of the object corresponds directly to a property of an item in the database.
      *
@@ -453,9 +453,9 @@ function manage_inventory(direction) {
             try {
                 inventory.load_item(item);
                 const data = [{
-                    'name': item.name,
-                    'lastSpaceIndex': inventory.spaceid_to_index(inventory.items[item.name].lastSpaceID),
-                    'currentSpaceIndex': inventory.spaceid_to_index(inventory.items[item.name].currentSpaceID),
+                    'item_id': item.item_id,
+                    'lastSpaceIndex': inventory.spaceid_to_index(inventory.items[item.item_id].lastSpaceID),
+                    'currentSpaceIndex': inventory.spaceid_to_index(inventory.items[item.item_id].currentSpaceID),
                 }];
                 write_to_db(data);
             }
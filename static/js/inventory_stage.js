@@ -358,7 +358,7 @@ function create_item_layer_wrapper(rows, cols, cell_size) {
         else if (wrapper.is_space_empty(dragend_location)) {
             const data = [
                 {
-                    'name': moved_item.name,
+                    'item_id': Number(moved_item.name),
                     'lastSpaceIndex': wrapper.spaceid_to_index(moved_item.currentSpaceID),
                     'currentSpaceIndex': wrapper.spaceid_to_index(dragend_location),
                 },
@@ -381,12 +381,12 @@ function create_item_layer_wrapper(rows, cols, cell_size) {
 
                         const data = [
                             {
-                                'name': item_object.name,
+                                'item_id': Number(item_object.name),
                                 'lastSpaceIndex': wrapper.spaceid_to_index(item_object.lastSpaceID),
                                 'currentSpaceIndex': wrapper.spaceid_to_index(item_object.currentSpaceID),
                             },
                             {
-                                'name': item_to_swap.name,
+                                'item_id': Number(item_to_swap.name),
                                 'lastSpaceIndex': wrapper.spaceid_to_index(item_to_swap.lastSpaceID),
                                 'currentSpaceIndex': wrapper.spaceid_to_index(item_to_swap.currentSpaceID),
                             },
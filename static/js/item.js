@@ -1,14 +1,14 @@
 /**** This file provides a "new_item" function, that is resonsible for parsing the item
     * data passed in from the database and doing two things:
     * 1.) Creates a Konva image object and adds it to the "layer" that is passed in.
-    *     Assings the konva image the name of item.name
+    *     Assings the konva image the name of item.item_id
     *
     * 2.) Creates an object that provides the following properties and methods for the item:
     *       * lastSpaceID       - the last cell in inventory occupied by the item
     *       * currentSpaceID    - the current cell in inventory occupied by the item
     *       * width             - How many cells wide the image is
     *       * height            - How many cells tall the image is
-    *       * name              - Set the item.name
+    *       * name              - The item.item_id as a string. Used as the key of the item everywhere
     *       * slot              - The slot type this item can be equipped in
     *       * item_type         - Type of item (shield, armour, weapon, etc)
     *       * equipped          - Boolean to show if the item is equipped
@@ -21,11 +21,50 @@
     * It is important that the konva item and object have the same name as that is how they are "Linked"
     * in this application.
     *
-    * Names in Konva are not unique, although I have ensured with my items the names are unique. I might
-    * change to IDs at a later date
+    * Names in Konva are not unique, so the item id is used as the name rather than the item's name.
     */
 const media_url = JSON.parse(document.getElementById('media_url').textContent);
 
+// Atlases holding the images of the items in this inventory, and where each item is in them.
+// See MUD/atlas.py. Every item in an atlas is cut from the same image, so a whole inventory
+// costs one or two image requests instead of one per item.
+const atlas_element = document.getElementById('item_atlas');
+const item_atlas = atlas_element ? JSON.parse(atlas_element.textContent) : { atlases: [], frames: {} };
+const atlas_images = {};
+
+function load_atlas(index) {
+    if (!(index in atlas_images)) {
+        atlas_images[index] = new Promise(function(resolve, reject) {
+            const image = new Image();
+            image.onload = () => resolve(image);
+            image.onerror = reject;
+            image.src = item_atlas.atlases[index];
+        });
+    }
+    return atlas_images[index];
+}
+
+// Calls callback with a Konva image of the item, cropped out of its atlas if it is in one.
+// Falls back to the item's own (resized) image otherwise.
+function load_item_image(item, callback) {
+    const frame = item_atlas.frames[item.item_id];
+    if (frame) {
+        const [index, x, y, width, height] = frame;
+        load_atlas(index).then(function(atlas) {
+            callback(new Konva.Image({
+                image: atlas,
+                crop: { x: x, y: y, width: width, height: height },
+            }));
+        });
+        return;
+    }
+
+    // Resized WebP copy made by MUD.images, if there is one yet
+    const derivatives = item.image_derivatives || {};
+    const thumb = derivatives.source === item.image ? derivatives.thumb : null;
+    Konva.Image.fromURL(media_url + (thumb ? thumb.webp : item.image), callback);
+}
+
 export function new_item(item, current_item_position, last_item_position, layer, cell_size, slot = null) {
 
     let item_wrapper = {};
@@ -56,7 +95,7 @@ export function new_item(item, current_item_position, last_item_position, layer,
     item_wrapper.width = item.width;
     item_wrapper.height = item.height;
 
-    item_wrapper.name = item.name;
+    item_wrapper.name = String(item.item_id);
     item_wrapper.slot = item.slot;
     item_wrapper.item_type = item.item_type;
     item_wrapper.equipped = item.equipped;
@@ -65,8 +104,7 @@ export function new_item(item, current_item_position, last_item_position, layer,
     item_wrapper.equipped_location = slot;
     item_wrapper.cell_size = cell_size;
 
-    const url = media_url + item.image;
-    Konva.Image.fromURL(url, function(image) {
+    load_item_image(item, function(image) {
         image.setAttrs({
             x: current_item_position[1] * item_wrapper.cell_size,
             y: current_item_position[0] * item_wrapper.cell_size,
@@ -74,7 +112,7 @@ export function new_item(item, current_item_position, last_item_position, layer,
             width: item_wrapper.width * item_wrapper.cell_size,
             height: item_wrapper.height * item_wrapper.cell_size,
             draggable: true,
-            name: item.name,
+            name: item_wrapper.name,
         });//setAttrs
 
         //If the user hovers over or touches (on touch screens) an item, display information about it
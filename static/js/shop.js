@@ -0,0 +1,40 @@
+/**** Buys and sells items from the item shop without reloading the page.
+    *
+    * Every item card contains a buy form and a sell form, one of which is hidden.
+    * Submitting either posts it to the JSON endpoint named in its data-api attribute.
+    * The response contains:
+    *       * gold    - The character's gold balance after the trade
+    *       * owned   - Whether the character now owns the item
+    *       * message - Text to show the user
+    *
+    * The balance and the card's forms are updated in place. If the request fails
+    * for any other reason the form is submitted normally instead.
+    */
+document.querySelectorAll('.trade-form').forEach((form) => {
+    form.addEventListener('submit', (e) => {
+        e.preventDefault();
+
+        fetch(form.dataset.api, {
+            credentials: 'same-origin',
+            method: 'post',
+            body: new FormData(form),
+        }).then((response) => {
+            if (response.status !== 200 && response.status !== 409) {
+                throw `Unexpected response ${response.status}`;
+            }
+            return response.json();
+        }).then((result) => {
+            document.getElementById('gold').textContent = result.gold;
+
+            const footer = form.parentElement;
+            footer.querySelector('.buy-form').classList.toggle('d-none', result.owned);
+            footer.querySelector('.sell-form').classList.toggle('d-none', !result.owned);
+
+            document.getElementById('js-alert-message').textContent = result.message;
+            new bootstrap.Toast(document.getElementById('js-alert')).show();
+        }).catch((error) => {
+            console.error(error);
+            form.submit();
+        });
+    });
+});